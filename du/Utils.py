@@ -1,9 +1,14 @@
 from collections import namedtuple
+import json
+import logging
 import os
 import subprocess
 import tarfile
+import threading
 import hashlib
 
+logger = logging.getLogger(__name__.split(".")[-1])
+
 
 def makeDirTree(path):
     """
@@ -18,6 +23,58 @@ def makeDirTree(path):
     os.makedirs(path)
 
 
+def loadJsonFile(path, description, default=None):
+    """
+    Load a JSON file which is not critical (e.g. state kept between runs), so that a missing or corrupted file is
+    not an error
+
+    @param path File path
+    @param description Description of the file content (used when warning about a file which can't be loaded)
+    @param default Value returned if the file doesn't exist or can't be loaded (empty dictionary if None)
+    @return loaded content
+    """
+
+    if default is None:
+        default = {}
+
+    if not os.path.isfile(path):
+        return default
+
+    try:
+        with open(path, "r") as fileObj:
+            return json.load(fileObj)
+    except (ValueError, OSError) as e:
+        logger.warning("could not load %s %r: %r" % (description, path, str(e)))
+        return default
+
+
+def saveJsonFile(path, content):
+    """
+    Store content to a JSON file. The file is replaced atomically, so that concurrent readers (e.g. other processes
+    sharing the same file) never see a partially written one
+
+    @param path File path
+    @param content JSON serializable content
+    """
+
+    dirName = os.path.dirname(path)
+    if dirName:
+        makeDirTree(dirName)
+
+    # Unique per writer (process & thread)
+    tempPath = "%s.%d.%d.tmp" % (path, os.getpid(), threading.get_ident())
+
+    try:
+        with open(tempPath, "w") as fileObj:
+            json.dump(content, fileObj, indent=4, sort_keys=True)
+
+        os.replace(tempPath, path)
+    except BaseException:
+        if os.path.exists(tempPath):
+            os.remove(tempPath)
+        raise
+
+
 def getHumanReadableSize(size, decimals=2):
     """
     Get human readable size
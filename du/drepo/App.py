@@ -5,14 +5,18 @@ import os
 import traceback
 import time
 import datetime
+import json
 
 import du
 from du.utils.ShellCommand import CommandFailedException
 from du.drepo.DRepo import DRepo, Credentials
 from du.drepo.Commands import DownloadType
+from du.drepo.ProjectStatus import ProjectStatus
 from du.drepo.manifest.Parser import Parser as ManifestParser
 from du.drepo.report.HtmlGenerator import HtmlGenerator
 from du.drepo.report.VersionGenerator import VersionGenerator
+from du.drepo.report.ChangeInfoCache import ChangeInfoCache
+from du.drepo.report.ReportSnapshot import ReportSnapshot
 from du.gerrit.Utils import Utils as GerritUtils
 
 
@@ -114,6 +118,48 @@ def main():
         action="store_true",
         help="if provided, drepo will syncrhonize source code",
     )
+    parser.add_argument(
+        "-plan",
+        action="store_true",
+        help="if provided, drepo prints what a sync would do with each project (with estimated costs), without modifying anything",
+    )
+    parser.add_argument(
+        "-incremental",
+        action="store_true",
+        help="if provided, projects which didn't change since the last sync (inputs, remote base & local state) are skipped",
+    )
+    parser.add_argument(
+        "-worktree_dir",
+        help="if provided, build projects are created as worktrees of primary repositories kept in this directory (shared by all the builds)",
+    )
+    parser.add_argument(
+        "-lock_file",
+        help="if provided, a lock file (exact commit hashes of every project) is written here after the sync",
+    )
+    parser.add_argument(
+        "-sync_lock",
+        help="lock file path; if provided, projects are synced to exactly the hashes it contains, without any Gerrit queries",
+    )
+    parser.add_argument(
+        "-maintenance_jobs",
+        type=int,
+        help="if provided, git maintenance (commit-graph, multi-pack-index, incremental repack) is run after the sync on this many threads, on repositories which are due for it",
+    )
+    parser.add_argument(
+        "-telemetry_file",
+        help="if provided, timings of every sync phase of every project are written here as JSON lines",
+    )
+    parser.add_argument(
+        "-telemetry_top",
+        type=int,
+        default=10,
+        help="number of slowest projects & phases logged after the sync (0 to disable)",
+    )
+    parser.add_argument(
+        "-resume",
+        action="store_true",
+        help="if provided, projects completed by the previous (interrupted) sync with identical inputs are skipped",
+    )
     parser.add_argument("-build")
     parser.add_argument(
         "-verbose",
@@ -153,6 +199,11 @@ the changeID shall be retreived""",
         help="If specified only specific number of commits will be fetched, as opposed to the entire git history",
     )
     parser.add_argument("-j", type=int, default=1, help="Number of threads")
+    parser.add_argument(
+        "-remote_jobs",
+        type=int,
+        help="Maximum number of projects synchronized concurrently from a single remote",
+    )
 
     parser.add_argument(
         "-root",
@@ -170,12 +221,80 @@ the changeID shall be retreived""",
         help="Tag to be checked out for all projects. Useful for releases",
     )
 
+    parser.add_argument(
+        "-status",
+        action="store_true",
+        help="if provided, drepo scans the local state of all the projects and prints a status table",
+    )
+    parser.add_argument(
+        "-status_json",
+        help="if provided, project statuses are also stored as JSON to this path ('-' for stdout)",
+    )
+    parser.add_argument(
+        "-bundle_dir",
+        help="Bundle directory (e.g. on NFS). If provided, repositories created from scratch are seeded from a matching bundle, so that only the delta is fetched from the remote",
+    )
+    parser.add_argument(
+        "-create_bundles",
+        action="store_true",
+        help="if provided, bundles are created from the synced build into -bundle_dir",
+    )
+    parser.add_argument(
+        "-prefetch",
+        action="store_true",
+        help="if provided, drepo keeps running and periodically fetches all the branches & open changes into the mirror cache (requires -cache_dir)",
+    )
+    parser.add_argument(
+        "-prefetch_interval",
+        type=int,
+        default=DRepo.DEFAULT_PREFETCH_INTERVAL_SEC,
+        help="Number of seconds between two prefetch rounds",
+    )
+    parser.add_argument(
+        "-prefetch_rounds",
+        type=int,
+        help="Number of prefetch rounds after which drepo exits (runs forever if not provided)",
+    )
+    parser.add_argument(
+        "-cache_dir",
+        help="Mirror cache directory. If specified, a bare mirror of each project is kept here and shared (via git alternates) between all the build roots",
+    )
+
     parser.add_argument(
         "-report_depth",
         type=int,
         default=3,
         help="Number indicating how many merged commits will be displayed in the reports",
     )
+    parser.add_argument(
+        "-save_report_snapshot",
+        help="if provided, the analyzed report information is stored to this JSON file",
+    )
+    parser.add_argument(
+        "-load_report_snapshot",
+        help="if provided, reports are rendered from this JSON file (see -save_report_snapshot) instead of analyzing the projects",
+    )
+    parser.add_argument(
+        "-report_cache",
+        help="path of the report cache, which keeps Gerrit information of already analyzed commits (defaults to the build state directory)",
+    )
+    parser.add_argument(
+        "-report_cache_ttl",
+        type=int,
+        default=ChangeInfoCache.DEFAULT_OPEN_TTL,
+        help="time (in seconds) for which cached Gerrit information of changes which are not merged remains valid",
+    )
+
+    parser.add_argument(
+        "-forall_keep_going",
+        action="store_true",
+        help="If specified, -forall command is executed in all projects even if it fails in some of them",
+    )
+
+    parser.add_argument(
+        "-forall_log_dir",
+        help="If specified, -forall command output of each project is written to a log file in this directory",
+    )
 
     forallArg = "-forall"
     # The argument entry here is just a placeholder for the help doc, we're doing the parsing manually
@@ -257,6 +376,8 @@ the changeID shall be retreived""",
             fetchDepth=args.fetch_depth,
             ciOnly=args.ci_only,
             tag=args.tag,
+            cacheDir=args.cache_dir,
+            bundleDir=args.bundle_dir,
         )
 
     except Exception as e:
@@ -266,11 +387,65 @@ the changeID shall be retreived""",
         logger.error("*" * 80)
         return -1
 
+    # Prefetch
+    if args.prefetch:
+        logger.info("prefetching ..")
+        try:
+            drepo.prefetch(
+                interval=args.prefetch_interval,
+                numThreads=args.j,
+                maxPerRemote=args.remote_jobs,
+                numRounds=args.prefetch_rounds,
+            )
+        except KeyboardInterrupt:
+            logger.info("prefetch interrupted")
+        except Exception as e:
+            logger.error(traceback.format_exc())
+            logger.error("*" * 80)
+            logger.error("\t\tprefetch error: %r" % str(e))
+            logger.error("*" * 80)
+            return -1
+
+    # Sync plan (dry run), executed as is by the sync
+    syncPlan = None
+
+    if args.plan:
+        try:
+            syncPlan = drepo.plan(
+                numThreads=args.j,
+                buildRoot=args.root,
+                incremental=args.incremental,
+                resume=args.resume,
+                worktreeDir=args.worktree_dir,
+                syncLockFile=args.sync_lock,
+            )
+        except Exception as e:
+            logger.error(traceback.format_exc())
+            logger.error("*" * 80)
+            logger.error("\t\tplan error: %r" % str(e))
+            logger.error("*" * 80)
+            return -1
+
+        logger.info("sync plan:\n" + syncPlan.formatTable())
+
     # Sync
     if args.sync:
         logger.info("syncing ..")
         try:
-            drepo.sync(numThreads=args.j, buildRoot=args.root)
+            drepo.sync(
+                numThreads=args.j,
+                buildRoot=args.root,
+                maxPerRemote=args.remote_jobs,
+                incremental=args.incremental,
+                resume=args.resume,
+                worktreeDir=args.worktree_dir,
+                lockFile=args.lock_file,
+                syncLockFile=args.sync_lock,
+                maintenanceJobs=args.maintenance_jobs,
+                telemetryFile=args.telemetry_file,
+                telemetryTop=args.telemetry_top,
+                syncPlan=syncPlan,
+            )
         except Exception as e:
             logger.error(traceback.format_exc())
             logger.error("*" * 80)
@@ -280,7 +455,13 @@ the changeID shall be retreived""",
 
     if forallCommand:
         try:
-            drepo.execute(forallCommand)
+            drepo.execute(
+                forallCommand,
+                numThreads=args.j,
+                keepGoing=args.forall_keep_going,
+                logDir=args.forall_log_dir,
+                buildRoot=args.root,
+            )
         except CommandFailedException as e:
             logger.error(traceback.format_exc())
             logger.error("*" * 80)
@@ -288,31 +469,75 @@ the changeID shall be retreived""",
             logger.error("*" * 80)
             return e.command.returnCode
 
+    # Bundles
+    if args.create_bundles:
+        logger.info("creating bundles ..")
+        try:
+            drepo.createBundles(buildRoot=args.root, numThreads=args.j)
+        except Exception as e:
+            logger.error(traceback.format_exc())
+            logger.error("*" * 80)
+            logger.error("\t\tbundle error: %r" % str(e))
+            logger.error("*" * 80)
+            return -1
+
+    # Workspace status
+    if args.status:
+        try:
+            statuses = drepo.status(buildRoot=args.root, numThreads=args.j)
+        except Exception as e:
+            logger.error(traceback.format_exc())
+            logger.error("*" * 80)
+            logger.error("\t\tstatus error: %r" % str(e))
+            logger.error("*" * 80)
+            return -1
+
+        logger.info("status:\n" + ProjectStatus.formatTable(statuses))
+
+        if args.status_json:
+            content = json.dumps([i.toDict() for i in statuses], indent=4)
+
+            if args.status_json == "-":
+                sys.stdout.write(content + "\n")
+            else:
+                with open(args.status_json, "w") as fileObj:
+                    fileObj.write(content)
+
     # Generate reports (of possibly various types)
-    if args.notes:
+    if args.notes or args.save_report_snapshot:
         logger.info("generating reports ..")
 
-        reports = parseReportGenerators(args.notes)
+        reports = parseReportGenerators(args.notes) if args.notes else []
 
-        # Generate all reports
-        for reportPath, reportGenerator in reports:
-            logger.info(
-                "generating report %s to %r .." % (str(reportGenerator), reportPath)
-            )
-            try:
-                drepo.generateReport(
-                    reportPath,
-                    reportGenerator,
+        try:
+            # Analyze only once, for all the reports
+            if args.load_report_snapshot:
+                reportInfo = ReportSnapshot.load(manifest, args.load_report_snapshot)
+            else:
+                reportInfo = drepo.analyzeReport(
                     args.report_depth,
                     args.match_tag,
                     numThreads=args.j,
+                    cacheFile=args.report_cache,
+                    cacheTtl=args.report_cache_ttl,
+                )
+
+            if args.save_report_snapshot:
+                ReportSnapshot.save(reportInfo, args.save_report_snapshot)
+
+            # Generate all reports
+            for reportPath, reportGenerator in reports:
+                logger.info(
+                    "generating report %s to %r .." % (str(reportGenerator), reportPath)
                 )
-            except Exception as e:
-                logger.error(traceback.format_exc())
-                logger.error("*" * 80)
-                logger.error("\t\terror generating release notes: %r" % str(e))
-                logger.error("*" * 80)
-                return -1
+
+                drepo.writeReport(reportPath, reportGenerator, reportInfo)
+        except Exception as e:
+            logger.error(traceback.format_exc())
+            logger.error("*" * 80)
+            logger.error("\t\terror generating release notes: %r" % str(e))
+            logger.error("*" * 80)
+            return -1
 
     endTime = time.time()
 
@@ -3,9 +3,13 @@ from du.Utils import makeDirTree
 from du.gerrit.rest.change.ChangeEndpoint import ChangeEndpoint
 from du.gerrit.rest.change.QueryOption import QueryOption
 from du.gerrit.ssh.Connection import Connection
+from du.gerrit.Utils import Utils as GerritUtils
 
+import glob
 import logging
 import os
+import re
+from collections import namedtuple
 from enum import Enum
 
 logger = logging.getLogger(__name__.split(".")[-1])
@@ -29,16 +33,63 @@ class DownloadType(Enum):
         return list(map(lambda c: c.value, cls))
 
 
+# State of a local git repository, as probed by Commands.probeGit
+GitState = namedtuple("GitState", "dirty, untracked, operationInProgress")
+
+
 class Commands:
     """
     Collection of git/gerrit high level commands
     """
 
-    # Return code reported by git if we try to add an already existing remote
-    GIT_CODE_REMOTE_ALREADY_EXISTS = 128
+    # Files present in the git directory while an operation (merge, cherry-pick, revert) is in progress
+    GIT_OPERATION_HEADS = ["MERGE_HEAD", "CHERRY_PICK_HEAD", "REVERT_HEAD"]
+
+    # Name of the remote every repository (project, primary repository or mirror) fetches from
+    REMOTE_NAME = "origin"
+
+    # Configuration of a new mirror (no garbage collection, see Commands.updateMirror)
+    MIRROR_CONFIG = [("gc.auto", "0"), ("gc.pruneExpire", "never")]
+
+    # Refspecs used to keep a mirror up to date (all branches & tags)
+    MIRROR_REFSPECS = ["+refs/heads/*:refs/heads/*", "+refs/tags/*:refs/tags/*"]
+
+    # Namespace of the local refs drepo fetches into
+    LOCAL_REFS_PREFIX = "refs/drepo/"
+
+    # Namespace of the local refs drepo fetches into, when the project is a worktree (refs/worktree/ refs are private
+    # to each worktree, so builds sharing the same repository don't overwrite each other's refs)
+    WORKTREE_REFS_PREFIX = "refs/worktree/drepo/"
+
+    # Namespace of the refs a new repository is seeded with from a bundle
+    BUNDLE_REFS_PREFIX = LOCAL_REFS_PREFIX + "bundle/"
+
+    # Branch ref prefix
+    BRANCH_REF_PREFIX = "refs/heads/"
+
+    # Tag ref prefix
+    TAG_REF_PREFIX = "refs/tags/"
+
+    # Regex which matches a full commit hash (used instead of a ref when syncing from a lock file)
+    HASH_REGEX = re.compile(r"^[0-9a-f]{40}$")
+
+    # Gerrit change (patchset) reference prefix
+    CHANGE_REF_PREFIX = "refs/changes/"
+
+    # Gerrit patchset reference (e.g. refs/changes/45/12345/2), capturing the change number
+    CHANGE_REF_REGEX = re.compile(r"^refs/changes/\d+/(\d+)/\d+$")
 
     @classmethod
-    def prepareGit(cls, path, remoteUrl, clean, remoteName="origin"):
+    def prepareGit(
+        cls,
+        path,
+        remoteUrl,
+        clean,
+        remoteName=REMOTE_NAME,
+        referencePath=None,
+        cloneFilter=None,
+        bundlePath=None,
+    ):
         """
         Prepare a git directory
 
@@ -46,9 +97,15 @@ class Commands:
         @param remoteUrl Remote URL
         @param clean Indication if clean of the git directory should be preformed
         @param remoteName Name of the remote to be added if it doesn't exist
+        @param referencePath Optional path of a (bare) repository whose object store should be borrowed via git alternates
+        @param cloneFilter Optional partial clone filter (e.g. blob:none). Objects filtered out are fetched on demand
+            from the remote
+        @param bundlePath Optional bundle a new repository is seeded with, so that only the delta is fetched later on
         """
 
-        if not os.path.exists(os.path.join(path, ".git")):
+        gitDir = cls.getGitDir(path)
+
+        if not gitDir:
             # Create an empty git repository
             logger.info("initializing %r" % path)
 
@@ -60,151 +117,960 @@ class Commands:
 
             ShellCommand.execute(["git", "init"], workingDirectory=path)
 
-        # Add a remote (not strictly needed, but still useful)
-        try:
+            gitDir = cls.getGitDir(path)
+
+            if bundlePath:
+                cls.seedFromBundle(path, bundlePath)
+
+            # Nothing to reset or clean in a new repository
+            state = GitState(False, False, False)
+        else:
+            state = cls.probeGit(path, clean)
+
+        if referencePath:
+            cls.addAlternate(os.path.join(path, ".git"), referencePath)
+
+        cls.configureRemote(path, remoteUrl, cloneFilter, remoteName)
+
+        # Reset possible unsuccessful merges/etc.
+        if state.dirty or state.operationInProgress:
+            ShellCommand.execute(["git", "reset", "--hard"], workingDirectory=path)
+
+        # Clean
+        if clean and state.untracked:
+            logger.info("cleaning %r" % path)
+            ShellCommand.execute(["git", "clean", "-dfx"], workingDirectory=path)
+
+    @classmethod
+    def probeGit(cls, path, untracked=False):
+        """
+        Probe the state of a local repository with a single (cheap) command
+
+        @param path Local path
+        @param untracked Indication if untracked & ignored files should be looked for (slower)
+        @return GitState
+        """
+
+        command = ["git", "status", "--porcelain=v2"]
+
+        if untracked:
+            # Untracked & ignored directories are reported as a whole, instead of walking them (e.g. build outputs)
+            command += ["--untracked-files=normal", "--ignored"]
+        else:
+            command.append("--untracked-files=no")
+
+        lines = ShellCommand.execute(
+            command, workingDirectory=path
+        ).stdoutStr.splitlines()
+
+        gitDir = cls.getGitDir(path)
+
+        return GitState(
+            # Changed, renamed or unmerged entries
+            dirty=any(line[:2] in ("1 ", "2 ", "u ") for line in lines),
+            # Untracked or ignored entries
+            untracked=any(line[:2] in ("? ", "! ") for line in lines),
+            operationInProgress=any(
+                os.path.exists(os.path.join(gitDir, i)) for i in cls.GIT_OPERATION_HEADS
+            ),
+        )
+
+    @classmethod
+    def configureRemote(cls, path, remoteUrl, cloneFilter=None, remoteName=REMOTE_NAME):
+        """
+        Add a remote, or update its configuration if it changed
+
+        @param path Repository path
+        @param remoteUrl Remote URL (without credentials, since it's stored in the git configuration)
+        @param cloneFilter Optional partial clone filter. If set the remote is marked as a promisor, so that missing
+            objects are lazily fetched from it when needed
+        @param remoteName Remote name
+        """
+
+        remoteConfig = cls.readRemoteConfig(path, remoteName)
+
+        if remoteConfig is None:
             ShellCommand.execute(
                 ["git", "remote", "add", remoteName, remoteUrl], workingDirectory=path
             )
-        except CommandFailedException as e:
-            if e.command.returnCode != cls.GIT_CODE_REMOTE_ALREADY_EXISTS:
-                raise e
+            remoteConfig = {}
 
-            # Update the URL if it already exists
+        elif remoteConfig.get("url") != remoteUrl:
             ShellCommand.execute(
                 ["git", "remote", "set-url", remoteName, remoteUrl],
                 workingDirectory=path,
             )
 
-        # Reset possible unsuccessful merges/etc.
-        ShellCommand.execute(["git", "reset", "--hard"], workingDirectory=path)
+        if cloneFilter:
+            for name, value in (
+                ("promisor", "true"),
+                ("partialclonefilter", cloneFilter),
+            ):
+                if remoteConfig.get(name) != value:
+                    ShellCommand.execute(
+                        ["git", "config", "remote.%s.%s" % (remoteName, name), value],
+                        workingDirectory=path,
+                    )
 
-        # Clean
-        if clean:
-            logger.info("cleaning %r" % path)
-            ShellCommand.execute(["git", "clean", "-dfx"], workingDirectory=path)
+    @staticmethod
+    def getUrlRewriteArgs(remoteUrl, fetchUrl):
+        """
+        Git options which make a single command use a different URL (e.g. with credentials, see
+        Utils.injectPassword) for a remote, without storing it in the git configuration
+
+        @param remoteUrl Configured remote URL
+        @param fetchUrl URL to be used instead
+        @return list of git options (to be placed before the git command)
+        """
+
+        if fetchUrl == remoteUrl:
+            return []
+
+        return ["-c", "url.%s.insteadOf=%s" % (fetchUrl, remoteUrl)]
 
     @staticmethod
-    def checkoutBranch(conn, path, branch, fetchUrl, numRetries, fetchArgs=[]):
+    def readRemoteConfig(path, remoteName):
+        """
+        Read the configuration of a remote with a single command
+
+        @param path Repository path (worktrees share the configuration of the main repository)
+        @param remoteName Remote name
+        @return map of variable name (lower case) -> value, or None if the remote is not configured
         """
-        Download & checkout a branch
 
-        @param conn Gerrit connection
+        cmd = ShellCommand.execute(
+            [
+                "git",
+                "config",
+                "--get-regexp",
+                "^remote\\.%s\\." % re.escape(remoteName),
+            ],
+            workingDirectory=path,
+            raiseOnError=False,
+        )
+
+        # Exit code 1 means there are no matching variables
+        if cmd.returnCode == 1:
+            return None
+
+        if cmd.returnCode != ShellCommand.RETURN_CODE_OK:
+            raise RuntimeError(
+                "Could not read remote %r configuration of %r: %r"
+                % (remoteName, path, cmd.stderrStr.strip())
+            )
+
+        prefix = "remote.%s." % remoteName
+
+        remoteConfig = {}
+
+        for line in cmd.stdoutStr.splitlines():
+            # Variables without a value have no separator
+            tokens = line.split(" ", 1)
+
+            remoteConfig[tokens[0][len(prefix) :]] = (
+                tokens[1] if len(tokens) > 1 else None
+            )
+
+        return remoteConfig
+
+    @staticmethod
+    def addAlternate(gitDir, referencePath):
+        """
+        Link a git object store to another one via git alternates, so that objects present in the
+        reference repository don't have to be downloaded or stored again
+
+        @param gitDir Path of the .git directory which borrows the objects
+        @param referencePath Path of the (bare) repository we're borrowing objects from
+        """
+
+        referenceObjects = os.path.abspath(os.path.join(referencePath, "objects"))
+
+        alternatesPath = os.path.join(gitDir, "objects", "info", "alternates")
+
+        alternates = []
+        if os.path.isfile(alternatesPath):
+            with open(alternatesPath, "r") as fileObj:
+                alternates = [line.strip() for line in fileObj.readlines()]
+
+        if referenceObjects in alternates:
+            # Already linked
+            return
+
+        logger.debug("adding alternate %r to %r" % (referenceObjects, gitDir))
+
+        makeDirTree(os.path.dirname(alternatesPath))
+
+        with open(alternatesPath, "a") as fileObj:
+            fileObj.write(referenceObjects + "\n")
+
+    @staticmethod
+    def getGitDir(path):
+        """
+        Get the git directory of a working tree, without running git
+
         @param path Local path
-        @param branch Branch name
-        @param fetchUrl URL we're fetching from
+        @return git directory path, or None if this is not a git working tree
+        """
+
+        dotGit = os.path.join(path, ".git")
+
+        if os.path.isdir(dotGit):
+            return dotGit
+
+        if not os.path.isfile(dotGit):
+            return None
+
+        # Linked worktree, .git is a file pointing to the actual git directory
+        with open(dotGit, "r") as fileObj:
+            content = fileObj.read().strip()
+
+        if not content.startswith("gitdir:"):
+            return None
+
+        return os.path.join(path, content[len("gitdir:") :].strip())
+
+    @staticmethod
+    def getCommonDir(gitDir):
+        """
+        Get the directory holding the objects & configuration of a repository, which differs from the git directory
+        in case of linked worktrees
+
+        @param gitDir Git directory (see Commands.getGitDir)
+        @return common directory path
+        """
+
+        commonDirFile = os.path.join(gitDir, "commondir")
+
+        if not os.path.isfile(commonDirFile):
+            return gitDir
+
+        with open(commonDirFile, "r") as fileObj:
+            return os.path.normpath(os.path.join(gitDir, fileObj.read().strip()))
+
+    @staticmethod
+    def getObjectsSize(objectsDir):
+        """
+        Get the disk size of an object store (packs & loose objects), without running git
+
+        @param objectsDir Object directory of a repository
+        @return size in bytes
+        """
+
+        size = 0
+
+        for dirPath, _, fileNames in os.walk(objectsDir):
+            for fileName in fileNames:
+                try:
+                    size += os.path.getsize(os.path.join(dirPath, fileName))
+                except OSError:
+                    # Removed concurrently (e.g. by a repack)
+                    pass
+
+        return size
+
+    @classmethod
+    def runMaintenance(cls, path, objectsDir):
+        """
+        Run repository maintenance: write commit-graph, pack loose objects and incrementally repack the packs using
+        a multi-pack-index, keeping history walks fast
+
+        @param path Repository path (working tree, or a bare repository)
+        @param objectsDir Object directory of the repository
+        """
+
+        logger.info("maintaining %r" % path)
+
+        command = [
+            "git",
+            "maintenance",
+            "run",
+            "--task=commit-graph",
+            "--task=loose-objects",
+        ]
+
+        # Git runs the repack before packing the loose objects, and it fails if there are no packs to index (e.g.
+        # if everything was fetched as loose objects so far)
+        if glob.glob(os.path.join(objectsDir, "pack", "*.pack")):
+            command.append("--task=incremental-repack")
+
+        ShellCommand.execute(command + ["--quiet"], workingDirectory=path)
+
+    @classmethod
+    def addWorktree(
+        cls,
+        primaryPath,
+        path,
+        remoteUrl,
+        fetchSource,
+        ref,
+        numRetries,
+        fetchArgs=[],
+        gitArgs=[],
+        referencePath=None,
+        cloneFilter=None,
+        bundlePath=None,
+    ):
+        """
+        Create a (detached) worktree of a primary repository, creating the primary repository if needed. The primary
+        repository holds the object store & configuration shared by all of its worktrees
+
+        @param primaryPath Primary (bare) repository path
+        @param path Worktree path
+        @param remoteUrl Remote URL (see Commands.configureRemote)
+        @param fetchSource Remote name or repository path (e.g. mirror) we're fetching the initial ref from
+        @param ref Remote ref the worktree is initially checked out at
         @param numRetries How many times should the network commands be re-tried
-        @param fetchArgs Additional fetch args
+        @param fetchArgs Additional fetch arguments (e.g. depth)
+        @param gitArgs Additional git options (e.g. see Commands.getUrlRewriteArgs)
+        @param referencePath Optional path of a (bare) repository whose object store should be borrowed via git alternates
+        @param cloneFilter Optional partial clone filter (see Commands.configureRemote)
+        @param bundlePath Optional bundle a new primary repository is seeded with
         """
 
-        logger.info("checkout branch %r @ %r" % (branch, path))
+        if not os.path.isdir(primaryPath):
+            logger.info("creating primary repository %r" % primaryPath)
+
+            makeDirTree(primaryPath)
+
+            ShellCommand.execute(
+                ["git", "init", "--bare"], workingDirectory=primaryPath
+            )
+
+            if bundlePath:
+                cls.seedFromBundle(primaryPath, bundlePath)
+
+        if referencePath:
+            cls.addAlternate(primaryPath, referencePath)
+
+        # Configuration is shared by all the worktrees
+        cls.configureRemote(primaryPath, remoteUrl, cloneFilter)
+
+        # Forget worktrees which were deleted from the disk, so that they can be re-added
+        ShellCommand.execute(["git", "worktree", "prune"], workingDirectory=primaryPath)
 
-        # Fetch only our branch
+        # Worktree can't be created from an empty repository, so fetch the initial commit first
         ShellCommand.execute(
-            ["git", "fetch", fetchUrl, branch] + fetchArgs,
-            workingDirectory=path,
+            ["git"] + gitArgs + ["fetch", "--refmap=", fetchSource, ref] + fetchArgs,
+            workingDirectory=primaryPath,
             numRetries=numRetries,
             randomRetry=True,
         )
 
-        try:
-            ShellCommand.execute(["git", "show-branch", branch], workingDirectory=path)
+        logger.info("adding worktree %r" % path)
+
+        ShellCommand.execute(
+            ["git", "worktree", "add", "--detach", path, "FETCH_HEAD"],
+            workingDirectory=primaryPath,
+        )
+
+    @classmethod
+    def updateMirror(
+        cls,
+        path,
+        remoteUrl,
+        fetchUrl,
+        numRetries,
+        refs=[],
+        full=True,
+        cloneFilter=None,
+        bundlePath=None,
+    ):
+        """
+        Create (if needed) and update a bare mirror repository of a remote project
+
+        @param path Mirror path
+        @param remoteUrl Remote URL (see Commands.configureRemote)
+        @param fetchUrl URL we're fetching from (e.g. remote URL with credentials, see Commands.getUrlRewriteArgs)
+        @param numRetries How many times should the network commands be re-tried
+        @param refs Additional refs (e.g. Gerrit change refs) or commit hashes to be fetched into the mirror, under
+            the same name
+        @param full Indication if all branches & tags should be updated, or only the additional refs
+        @param cloneFilter Optional partial clone filter (e.g. blob:none)
+        @param bundlePath Optional bundle a new mirror is seeded with
+        """
 
-            # Branch exists so reset it to what we fetched
-            ShellCommand.execute(["git", "checkout", branch], workingDirectory=path)
+        if not os.path.isdir(path):
+            logger.info("creating mirror %r" % path)
+
+            makeDirTree(path)
+
+            ShellCommand.execute(["git", "init", "--bare"], workingDirectory=path)
+
+            # Build roots borrow the mirror objects via alternates, so nothing may ever be pruned from it (objects
+            # unreachable from the mirror refs may still be reachable from the build roots)
+            for name, value in cls.MIRROR_CONFIG:
+                ShellCommand.execute(
+                    ["git", "config", name, value], workingDirectory=path
+                )
+
+            if bundlePath:
+                cls.seedFromBundle(path, bundlePath)
+
+        logger.info("updating mirror %r" % path)
+
+        # Fetching from a named remote, so that the filter is registered for it (not for the URL, which may contain
+        # credentials)
+        cls.configureRemote(path, remoteUrl, cloneFilter)
+
+        command = (
+            ["git"]
+            + cls.getUrlRewriteArgs(remoteUrl, fetchUrl)
+            + ["fetch", "--refmap=", "--no-auto-gc"]
+        )
+
+        if cloneFilter:
+            # Projects fetching from a partial mirror have to use a filter as well
             ShellCommand.execute(
-                ["git", "reset", "--hard", "FETCH_HEAD"], workingDirectory=path
+                ["git", "config", "uploadpack.allowFilter", "true"],
+                workingDirectory=path,
             )
 
-        except CommandFailedException:
-            # Branch doesn't exist, so just checkout
+            command.append("--filter=" + cloneFilter)
+
+        if full:
+            command += ["--prune", cls.REMOTE_NAME] + cls.MIRROR_REFSPECS
+        else:
+            command.append(cls.REMOTE_NAME)
+
+        # Hashes are fetched without a destination, since the objects are all we need
+        command += [
+            ref if cls.HASH_REGEX.match(ref) else "+%s:%s" % (ref, ref) for ref in refs
+        ]
+
+        ShellCommand.execute(
+            command,
+            workingDirectory=path,
+            numRetries=numRetries,
+            randomRetry=True,
+        )
+
+        if bundlePath:
+            cls.deleteBundleRefs(path)
+
+    @classmethod
+    def seedFromBundle(cls, path, bundlePath):
+        """
+        Seed a new repository with the objects of a bundle (e.g. from local or NFS storage). Refs of the bundle are
+        kept in a separate namespace, so that fetches from the remote negotiate against them and only transfer the
+        delta
+
+        @param path Repository path
+        @param bundlePath Bundle path (does not need to exist)
+        @return True if the repository was seeded
+        """
+
+        if not os.path.isfile(bundlePath):
+            logger.debug("no bundle %r" % bundlePath)
+            return False
+
+        logger.info("seeding %r from bundle %r" % (path, bundlePath))
+
+        cmd = ShellCommand.execute(
+            ["git", "fetch", bundlePath, "+refs/*:%s*" % cls.BUNDLE_REFS_PREFIX],
+            workingDirectory=path,
+            raiseOnError=False,
+        )
+
+        if cmd.returnCode != ShellCommand.RETURN_CODE_OK:
+            # Not critical, everything is just fetched from the remote
+            logger.warning(
+                "could not seed %r from bundle %r: %r"
+                % (path, bundlePath, cmd.stderrStr.strip())
+            )
+            return False
+
+        return True
+
+    @classmethod
+    def deleteBundleRefs(cls, path):
+        """
+        Delete the refs a repository was seeded with (see Commands.seedFromBundle). They're only needed until the
+        first fetch from the remote, and would otherwise keep the bundle objects reachable forever
+
+        @param path Repository path
+        """
+
+        refs = ShellCommand.execute(
+            ["git", "for-each-ref", "--format=%(refname)", cls.BUNDLE_REFS_PREFIX],
+            workingDirectory=path,
+        ).stdoutStr.splitlines()
+
+        if not refs:
+            return
+
+        logger.info("deleting %d bundle ref(s) @ %r" % (len(refs), path))
+
+        ShellCommand.execute(
+            ["git", "update-ref", "--stdin"],
+            workingDirectory=path,
+            input="".join("delete %s\n" % ref for ref in refs),
+        )
+
+    @staticmethod
+    def createBundle(path, bundlePath, refs):
+        """
+        Create a bundle of given refs & all the tags of a repository. The bundle is replaced atomically, so that
+        syncs reading it concurrently (e.g. from NFS) never see a partially written file
+
+        @param path Repository path
+        @param bundlePath Bundle path
+        @param refs List of refs to bundle (in addition to the tags)
+        @return True if the bundle was created
+        """
+
+        logger.info("bundling %r to %r" % (path, bundlePath))
+
+        try:
+            makeDirTree(os.path.dirname(bundlePath))
+        except FileExistsError:
+            # Bundles of multiple projects may be created concurrently in the same directory
+            pass
+
+        tempPath = "%s.%d.tmp" % (bundlePath, os.getpid())
+
+        cmd = ShellCommand.execute(
+            ["git", "bundle", "create", "--quiet", tempPath] + refs + ["--tags"],
+            workingDirectory=path,
+            raiseOnError=False,
+        )
+
+        if cmd.returnCode != ShellCommand.RETURN_CODE_OK:
+            # E.g. shallow repositories can't be bundled
+            logger.warning("could not bundle %r: %r" % (path, cmd.stderrStr.strip()))
+
+            if os.path.exists(tempPath):
+                os.remove(tempPath)
+
+            return False
+
+        os.replace(tempPath, bundlePath)
+
+        return True
+
+    @staticmethod
+    def revParse(path, refs):
+        """
+        Resolve multiple refs to their hashes with a single command
+
+        @param path Local path
+        @param refs List of refs
+        @return list of hashes (same order as refs)
+        """
+
+        return ShellCommand.execute(
+            ["git", "rev-parse"] + refs, workingDirectory=path
+        ).stdoutStr.split()
+
+    @staticmethod
+    def hasCommit(path, commitHash):
+        """
+        Check if a commit is available in the local object store
+
+        @param path Local path
+        @param commitHash Commit hash
+        @return True if the commit is available
+        """
+
+        return (
             ShellCommand.execute(
-                ["git", "checkout", "-b", branch, "FETCH_HEAD"],
+                ["git", "cat-file", "-e", commitHash + "^{commit}"],
                 workingDirectory=path,
-            )
+                raiseOnError=False,
+            ).returnCode
+            == ShellCommand.RETURN_CODE_OK
+        )
 
     @staticmethod
-    def checkoutTag(conn, path, tag, fetchUrl, numRetries, fetchArgs=[]):
-        '''
-        Checkout a tag
+    def hasCommits(path, refs):
+        """
+        Check if all the refs resolve to commits available in the local object store, with a single command
 
-        @param conn Gerrit connection
         @param path Local path
-        @param tag Tag name
-        @param fetchUrl URL we're fetching from
-        @param numRetries How many times should the network commands be re-tried
-        @param fetchArgs Additional fetch args
+        @param refs List of refs
+        @return True if all the refs are available
         """
-        '''
-        logger.info("checkout tag %r @ %r" % (tag, path))
 
-        # Fetch only our tag
-        ShellCommand.execute(
-            command=[
+        result = ShellCommand.execute(
+            ["git", "cat-file", "--batch-check=%(objecttype)"],
+            workingDirectory=path,
+            raiseOnError=False,
+            input="".join("%s^{commit}\n" % ref for ref in refs),
+        )
+
+        return (
+            result.returnCode == ShellCommand.RETURN_CODE_OK
+            and result.stdoutStr.split() == ["commit"] * len(refs)
+        )
+
+    @staticmethod
+    def getLocalState(path, untracked=False):
+        """
+        Get local repository state with a single command
+
+        @param path Local path
+        @param untracked Indication if untracked & ignored files should make the repository dirty as well (slower)
+        @return (HEAD hash, dirty flag) tuple, or None if this is not a valid git repository
+        """
+
+        if not os.path.exists(os.path.join(path, ".git")):
+            return None
+
+        # Inspection only, so don't let git opportunistically refresh the index
+        command = ["git", "--no-optional-locks", "status", "--porcelain=v2", "--branch"]
+
+        if untracked:
+            # Untracked directories are reported as a whole, since a single entry is enough
+            command += ["--untracked-files=normal", "--ignored"]
+        else:
+            command.append("--untracked-files=no")
+
+        cmd = ShellCommand.execute(
+            command,
+            workingDirectory=path,
+            raiseOnError=False,
+        )
+
+        if cmd.returnCode != ShellCommand.RETURN_CODE_OK:
+            return None
+
+        headHash = None
+        dirty = False
+
+        for line in cmd.stdoutStr.splitlines():
+            if line.startswith("# branch.oid "):
+                headHash = line.split()[-1]
+            elif not line.startswith("#"):
+                # Any non-header line is a changed entry
+                dirty = True
+
+        return headHash, dirty
+
+    @classmethod
+    def getStatus(cls, path):
+        """
+        Get detailed working tree status with a single command (uses the untracked cache, and fsmonitor if the
+        repository is configured to use it)
+
+        @param path Local path
+        @return (HEAD hash, branch, number of changed files, number of untracked files) tuple, where HEAD hash is
+            None if there are no commits and branch is None if HEAD is detached. None if this is not a valid git
+            repository
+        """
+
+        if not cls.getGitDir(path):
+            return None
+
+        cmd = ShellCommand.execute(
+            [
                 "git",
-                "fetch",
-                fetchUrl,
-                "tag",
-                tag,
-                "--no-tags",
-            ]
-            + fetchArgs,
+                "-c",
+                "core.untrackedCache=true",
+                "status",
+                "--porcelain=v2",
+                "--branch",
+                "--untracked-files=normal",
+            ],
             workingDirectory=path,
+            raiseOnError=False,
+        )
+
+        if cmd.returnCode != ShellCommand.RETURN_CODE_OK:
+            return None
+
+        headHash = None
+        branch = None
+        numChanged = 0
+        numUntracked = 0
+
+        for line in cmd.stdoutStr.splitlines():
+            if line.startswith("# branch.oid "):
+                value = line.split()[2]
+                headHash = None if value == "(initial)" else value
+
+            elif line.startswith("# branch.head "):
+                value = line.split()[2]
+                branch = None if value == "(detached)" else value
+
+            elif line[:2] in ("1 ", "2 ", "u "):
+                numChanged += 1
+
+            elif line.startswith("? "):
+                numUntracked += 1
+
+        return headHash, branch, numChanged, numUntracked
+
+    @staticmethod
+    def countCommits(path, baseRef, ref="HEAD"):
+        """
+        Count commits reachable from a ref, but not from a base
+
+        @param path Local path
+        @param baseRef Base ref or hash
+        @param ref Ref or hash
+        @return number of commits, or None if it can't be determined (e.g. base not available)
+        """
+
+        cmd = ShellCommand.execute(
+            ["git", "rev-list", "--count", "%s..%s" % (baseRef, ref)],
+            workingDirectory=path,
+            raiseOnError=False,
+        )
+
+        if cmd.returnCode != ShellCommand.RETURN_CODE_OK:
+            return None
+
+        return int(cmd.stdoutStr.strip())
+
+    @staticmethod
+    def lsRemote(fetchUrl, ref, numRetries):
+        """
+        Get a hash of a remote reference
+
+        @param fetchUrl Remote URL
+        @param ref Full reference name (e.g. refs/heads/master)
+        @param numRetries How many times should the network commands be re-tried
+        @return hash, or None if the reference doesn't exist
+        """
+
+        cmd = ShellCommand.execute(
+            ["git", "ls-remote", fetchUrl, ref],
             numRetries=numRetries,
             randomRetry=True,
         )
 
-        # Checkout what we fetched
-        ShellCommand.execute(["git", "checkout", "FETCH_HEAD"], workingDirectory=path)
+        for line in cmd.stdoutStr.splitlines():
+            tokens = line.split()
+
+            # Patterns match ref suffixes as well, so look for an exact match
+            if len(tokens) == 2 and tokens[1] == ref:
+                return tokens[0]
+
+        return None
 
     @staticmethod
-    def fetchCurrentPatchsetRef(conn, change):
+    def fetchCurrentPatchsetRefs(conn, projectChanges):
         """
-        Fetch current patchset information of given change
+        Fetch current patchset information of multiple changes, using as few (OR-combined) queries as possible
 
         @param conn Gerrit connection (REST or SSH)
-        @param change Change
+        @param projectChanges List of (project name, change) pairs, where change is either a change number (int or
+            numeric string) or a Change-ID
 
-        @return patchset information
+        @return map of (project name, change) -> patchset reference
         """
 
-        if isinstance(conn, ChangeEndpoint):
-            res = conn.query(change, options=[QueryOption.CURRENT_REVISION])
-        else:
-            res = conn.query(Connection.QUERY_ARG_CURRENT_PATCHSET, change=change)
+        def normalize(change):
+            # Change numbers may come as strings (e.g. from the manifest, or from SSH query results)
+            if isinstance(change, int) or (
+                isinstance(change, str) and change.isdigit()
+            ):
+                return int(change)
+
+            return change
+
+        # Unique changes we're querying for
+        changes = []
+        for projectName, change in projectChanges:
+            change = normalize(change)
+            if change not in changes:
+                changes.append(change)
+
+        results = []
 
-        if res:
-            return res[0].currentRevision.ref
+        for query in GerritUtils.chunkOrQuery(["change:%s" % i for i in changes]):
+            if isinstance(conn, ChangeEndpoint):
+                results += conn.query(*query, options=[QueryOption.CURRENT_REVISION])
+            else:
+                results += conn.query(Connection.QUERY_ARG_CURRENT_PATCHSET, *query)
 
-        raise RuntimeError(
-            "Could not acquire current patchset of change %s" % str(change)
+        refs = {}
+
+        for projectName, change in projectChanges:
+            # Change numbers are unique, while a Change-ID may be shared by changes in different projects/branches
+            number = normalize(change)
+            if isinstance(number, int):
+                candidates = [i for i in results if normalize(i.number) == number]
+            else:
+                candidates = [i for i in results if i.id == change]
+
+            # Prefer the change from our project
+            candidates.sort(key=lambda i: i.project != projectName)
+
+            if not candidates or not candidates[0].currentRevision:
+                raise RuntimeError(
+                    "Could not acquire current patchset of change %s" % str(change)
+                )
+
+            refs[(projectName, change)] = candidates[0].currentRevision.ref
+
+        return refs
+
+    @staticmethod
+    def fetchOpenChangeRefs(conn, projectNames):
+        """
+        Fetch current patchset references of all the open changes of multiple projects, using as few (OR-combined)
+        queries as possible
+
+        @param conn Gerrit connection (REST or SSH)
+        @param projectNames List of Gerrit project names
+
+        @return map of project name -> list of (branch, patchset reference) pairs
+        """
+
+        results = []
+
+        for query in GerritUtils.chunkOrQuery(["project:%s" % i for i in projectNames]):
+            query = ["status:open", "("] + query + [")"]
+
+            # Results are limited per query, so page through all of them
+            if isinstance(conn, ChangeEndpoint):
+                results += conn.queryAll(*query, options=[QueryOption.CURRENT_REVISION])
+            else:
+                results += conn.queryAll(Connection.QUERY_ARG_CURRENT_PATCHSET, *query)
+
+        refs = {}
+
+        # Changes may shift between pages (e.g. if updated in the meantime), so they may be returned more than once
+        for change in {change.number: change for change in results}.values():
+            if change.currentRevision:
+                refs.setdefault(change.project, []).append(
+                    (change.branch, change.currentRevision.ref)
+                )
+
+        return refs
+
+    @classmethod
+    def pruneChangeRefs(cls, path, openChangeRefs):
+        """
+        Delete patchset references of changes which are no longer open (e.g. from a mirror)
+
+        @param path Repository path
+        @param openChangeRefs Patchset references of all the open changes of the project (any patchset of these
+            changes is kept)
+        """
+
+        openNumbers = set()
+        for ref in openChangeRefs:
+            match = cls.CHANGE_REF_REGEX.match(ref)
+            if match:
+                openNumbers.add(match.group(1))
+
+        staleRefs = []
+
+        for ref in ShellCommand.execute(
+            ["git", "for-each-ref", "--format=%(refname)", cls.CHANGE_REF_PREFIX],
+            workingDirectory=path,
+        ).stdoutStr.splitlines():
+            match = cls.CHANGE_REF_REGEX.match(ref)
+            if match and match.group(1) not in openNumbers:
+                staleRefs.append(ref)
+
+        if not staleRefs:
+            return
+
+        logger.info("pruning %d closed change ref(s) @ %r" % (len(staleRefs), path))
+
+        ShellCommand.execute(
+            ["git", "update-ref", "--stdin"],
+            workingDirectory=path,
+            input="".join("delete %s\n" % ref for ref in staleRefs),
         )
 
     @staticmethod
-    def downloadChange(
-        conn, path, change, fetchUrl, downloadType, numRetries, fetchArgs=[]
-    ):
+    def fetchRefs(path, fetchSource, refs, numRetries, fetchArgs=[], gitArgs=[]):
         """
-        Download a change into a git folder
+        Fetch multiple refs in a single fetch, storing each one to a local ref
 
-        @param conn Gerrit connection
-        @param path Project path
-        @param fetchUrl Fetch URL
-        @param DRepo.DownloadType Type of download (i.e. cherrypick, checkout, merge)
+        @param path Local path
+        @param fetchSource Remote name or repository path (e.g. mirror) we're fetching from
+        @param refs List of (remote ref, local ref) pairs (e.g. [("refs/heads/master", "refs/drepo/base")])
         @param numRetries How many times should the network commands be re-tried
-        @param fetchArgs Optional additional fetch arguments
+        @param fetchArgs Additional fetch args
+        @param gitArgs Additional git options (e.g. see Commands.getUrlRewriteArgs)
         """
-        logger.info("%s %r @ %r" % (downloadType.name, str(change), path))
 
-        ref = Commands.fetchCurrentPatchsetRef(conn, change)
+        logger.info("fetching %d ref(s) @ %r" % (len(refs), path))
 
-        # Download the change
+        # Only the given refs are updated (remote tracking branches are left alone)
         ShellCommand.execute(
-            ["git", "fetch", fetchUrl, ref] + fetchArgs,
+            ["git"]
+            + gitArgs
+            + ["fetch", "--refmap=", fetchSource]
+            + ["+%s:%s" % (remoteRef, localRef) for remoteRef, localRef in refs]
+            + fetchArgs,
             workingDirectory=path,
             numRetries=numRetries,
             randomRetry=True,
         )
 
+    @classmethod
+    def setSparseCheckout(cls, path, sparsePaths):
+        """
+        Restrict the working tree to a set of directories (cone mode sparse checkout), or restore the full working
+        tree if no paths are given and the project was previously sparse. Has to be called before checkout
+
+        @param path Local path
+        @param sparsePaths List of directories to be checked out (None or empty for the entire tree)
+        """
+
+        if sparsePaths:
+            logger.debug("sparse checkout %r @ %r" % (sparsePaths, path))
+
+            ShellCommand.execute(
+                ["git", "sparse-checkout", "set", "--cone"] + sparsePaths,
+                workingDirectory=path,
+            )
+
+        elif os.path.isfile(
+            os.path.join(cls.getGitDir(path), "info", "sparse-checkout")
+        ):
+            logger.debug("disabling sparse checkout @ %r" % path)
+
+            ShellCommand.execute(
+                ["git", "sparse-checkout", "disable"], workingDirectory=path
+            )
+
+    @staticmethod
+    def checkoutLocalBranch(path, branch, ref):
+        """
+        Checkout a branch, (re)setting it to a local ref
+
+        @param path Local path
+        @param branch Branch name
+        @param ref Local ref the branch should point to
+        """
+
+        logger.info("checkout branch %r @ %r" % (branch, path))
+
+        ShellCommand.execute(
+            ["git", "checkout", "-B", branch, ref], workingDirectory=path
+        )
+
+    @staticmethod
+    def checkoutLocalRef(path, ref):
+        """
+        Checkout a local ref (detached)
+
+        @param path Local path
+        @param ref Local ref
+        """
+
+        ShellCommand.execute(
+            ["git", "checkout", "--detach", ref], workingDirectory=path
+        )
+
+    @staticmethod
+    def applyChange(path, ref, downloadType, committer=None):
+        """
+        Apply an already fetched change
+
+        @param path Project path
+        @param ref Local ref of the change (e.g. FETCH_HEAD)
+        @param DRepo.DownloadType Type of download (i.e. cherrypick, checkout, merge)
+        @param committer Optional (name, email, date) a cherry-picked commit is recorded with (see
+            Commands.getCommitter), so that the same commit is reproduced
+        """
+
         if downloadType == DownloadType.CHERRYPICK:
             # Check if email is configured (needed for cherry-pick)
             try:
@@ -221,7 +1087,9 @@ class Commands:
 
             # Check if name is configured
             try:
-                ShellCommand.execute(["git", "config", "--get", "user.name"])
+                ShellCommand.execute(
+                    ["git", "config", "--get", "user.name"], workingDirectory=path
+                )
             except CommandFailedException:
                 logger.warning("User name needed for cherry-pick, creating one..")
                 ShellCommand.execute(
@@ -244,6 +1112,35 @@ class Commands:
             # Only allow fast-forward merges
             command.append("--ff-only")
 
-        command.append("FETCH_HEAD")
+        command.append(ref)
+
+        environment = None
+        if committer:
+            name, email, date = committer
 
-        ShellCommand.execute(command, workingDirectory=path)
+            environment = {
+                "GIT_COMMITTER_NAME": name,
+                "GIT_COMMITTER_EMAIL": email,
+                "GIT_COMMITTER_DATE": date,
+            }
+
+        ShellCommand.execute(command, workingDirectory=path, environment=environment)
+
+    @staticmethod
+    def getCommitter(path, ref="HEAD"):
+        """
+        Get the committer of a commit
+
+        @param path Project path
+        @param ref Commit reference
+        @return (name, email, date) list, with the date in git internal format (see Commands.applyChange)
+        """
+
+        return (
+            ShellCommand.execute(
+                ["git", "log", "-1", "--format=%cn%x00%ce%x00%cd", "--date=raw", ref],
+                workingDirectory=path,
+            )
+            .stdoutStr.rstrip("\n")
+            .split("\0")
+        )
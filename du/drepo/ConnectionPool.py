@@ -0,0 +1,82 @@
+import logging
+import threading
+
+from urllib.parse import urlparse
+
+from du.drepo.Utils import Utils
+
+logger = logging.getLogger(__name__.split(".")[-1])
+
+
+class ConnectionPool:
+    """
+    Thread-safe pool of Gerrit query connections, shared by everyone querying the same server with the same
+    credentials.
+
+    REST connections keep their HTTP session (and with it the keep-alive connections) for the lifetime of the pool,
+    and SSH connections are multiplexed by the connection manager.
+    """
+
+    def __init__(self, httpCredentials, connectionManager=None):
+        """
+        Constructor
+
+        @param httpCredentials A map of HTTP credentials
+        @param connectionManager Optional SSH connection manager, used to multiplex SSH connections
+        """
+
+        self._httpCredentials = httpCredentials
+        self._connectionManager = connectionManager
+
+        self._lock = threading.Lock()
+
+        # Key -> connection
+        self._connections = {}
+
+    def get(self, remote):
+        """
+        Get a (shared) query connection of a remote
+
+        @param remote Remote
+        @return connection (see Utils.createQueryConnection)
+        """
+
+        key = self.__getKey(remote)
+
+        with self._lock:
+            conn = self._connections.get(key)
+
+            if not conn:
+                logger.debug("creating connection for %r" % remote.name)
+
+                conn = Utils.createQueryConnection(
+                    remote, self._httpCredentials, self._connectionManager
+                )
+
+                self._connections[key] = conn
+
+        return conn
+
+    def __getKey(self, remote):
+        """
+        Pool key of a remote (the same logic as Utils.createQueryConnection, so that remotes which would create
+        identical connections share the same one)
+
+        @param remote Remote
+        @return key tuple
+        """
+
+        if remote.ssh:
+            return (remote.ssh,)
+
+        if remote.http:
+            credentials = self._httpCredentials.get(urlparse(remote.http).hostname)
+
+            return (
+                remote.http,
+                credentials.username if credentials else None,
+                credentials.password if credentials else None,
+            )
+
+        # Not pooled, let Utils.createQueryConnection fail
+        return (remote.name,)
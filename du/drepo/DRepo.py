@@ -1,3 +1,4 @@
+import contextlib
 import logging
 import os
 import sys
@@ -7,6 +8,8 @@ from collections import namedtuple
 import threading
 import concurrent.futures
 import io
+import time
+from urllib.parse import urlparse
 
 from enum import Enum
 
@@ -14,14 +17,29 @@ from du.drepo.Commands import Commands
 from du.drepo.Commands import DownloadType
 
 from du.gerrit.ssh.Connection import Connection
+from du.gerrit.ssh.ConnectionManager import ConnectionManager
+from du.drepo.ConnectionPool import ConnectionPool
 from du.gerrit.rest.change.ChangeEndpoint import ChangeEndpoint
 from du.gerrit.rest.change.QueryOption import QueryOption
 from du.gerrit.ChangeStatus import ChangeStatus
 from du.utils.ShellCommand import ShellCommand, CommandFailedException
 
 from du.drepo.Utils import Utils
+from du.Utils import makeDirTree
+from du.drepo.Scheduler import Scheduler
+from du.drepo.SyncHistory import SyncHistory
+from du.drepo.SyncState import SyncState
+from du.drepo.SyncJournal import SyncJournal
+from du.drepo.SyncLock import SyncLock
+from du.drepo.RepositoryLock import RepositoryLock
+from du.drepo.MaintenanceSchedule import MaintenanceSchedule
+from du.drepo.SyncTelemetry import SyncTelemetry
+from du.drepo.ProjectPlan import ProjectPlan, ChangeDownload, ProjectAction
+from du.drepo.SyncPlan import SyncPlan
+from du.drepo.ProjectStatus import ProjectStatus
 from du.drepo.manifest.Common import ProjectOption
 from du.drepo.report.Analyzer import Analyzer
+from du.drepo.report.ChangeInfoCache import ChangeInfoCache
 
 # Set stdout/stderr encoding top UTF-8 by default
 sys.stdout = codecs.getwriter("utf-8")(sys.stdout.detach())
@@ -40,6 +58,41 @@ class DRepo:
     # Report encoding
     REPORT_ENCODING = "ISO-8859-1"
 
+    # Directory (relative to the build root) in which drepo keeps its state files
+    STATE_DIR = ".drepo"
+
+    # Per-project sync duration history file name
+    SYNC_HISTORY_FILE = "sync_history.json"
+
+    # Per-project fetched size history file name (object store growth of incremental syncs)
+    SYNC_SIZE_HISTORY_FILE = "sync_size_history.json"
+
+    # Per-project sync state file name
+    SYNC_STATE_FILE = "sync_state.json"
+
+    # Sync journal file name (steps completed during the last sync)
+    SYNC_JOURNAL_FILE = "sync_journal.jsonl"
+
+    # Sync phase names (reported in the sync summary)
+    PHASE_CI_DISCOVERY = "CI discovery"
+    PHASE_CHANGE_RESOLUTION = "change resolution"
+    PHASE_UP_TO_DATE_CHECK = "up to date check"
+    PHASE_PROJECTS = "projects"
+    PHASE_MAINTENANCE = "maintenance"
+
+    # Per-repository maintenance schedule file name (stored next to the repositories: in the build state directory,
+    # or in the directory of the shared ones)
+    MAINTENANCE_SCHEDULE_FILE = "maintenance.json"
+
+    # Per-mirror prefetch duration history file name (stored in the cache directory)
+    PREFETCH_HISTORY_FILE = "prefetch_history.json"
+
+    # Report cache of commit -> Gerrit change information (located in the build state directory by default)
+    REPORT_CACHE_FILE = "report_cache.sqlite"
+
+    # Default number of seconds between two prefetch rounds
+    DEFAULT_PREFETCH_INTERVAL_SEC = 300
+
     def __init__(
         self,
         manifest,
@@ -49,6 +102,8 @@ class DRepo:
         fetchDepth=None,
         ciOnly=False,
         tag=None,
+        cacheDir=None,
+        bundleDir=None,
     ):
         """
         Constructor
@@ -61,6 +116,10 @@ class DRepo:
         @param fetchDepth(optional) Git history fetch depth. If None, then entire history is downloaded
         @param ciOnly If specified, clones only projects with CI changes
         @param tag Tag to be checkout for all projects
+        @param cacheDir(optional) Mirror cache directory. If set, a bare mirror of each remote project is kept here
+        and shared (via git alternates) between all the build roots
+        @param bundleDir(optional) Bundle directory (e.g. on NFS). If set, repositories created from scratch are seeded
+        from a matching bundle, so that only the delta is fetched from the remote (see DRepo.createBundles)
         """
 
         self._manifest = manifest
@@ -70,63 +129,1017 @@ class DRepo:
         self._ciType = ciType
         self._ciOnly = ciOnly
         self._tag = tag
+        self._cacheDir = os.path.abspath(cacheDir) if cacheDir else None
+        self._bundleDir = os.path.abspath(bundleDir) if bundleDir else None
 
-    def sync(self, buildName=None, buildRoot=None, numThreads=1):
+        # Mirrors which were already updated during the current sync (mirror path -> additional refs fetched)
+        self._updatedMirrors = {}
+        self._repositoryLocks = {}
+        self._repositoryLocksLock = threading.Lock()
+
+    def sync(
+        self,
+        buildName=None,
+        buildRoot=None,
+        numThreads=1,
+        maxPerRemote=None,
+        incremental=False,
+        resume=False,
+        worktreeDir=None,
+        lockFile=None,
+        syncLockFile=None,
+        maintenanceJobs=None,
+        telemetryFile=None,
+        telemetryTop=0,
+        syncPlan=None,
+    ):
         """
         Synchronize everything based on the provided manifest
 
         @param buildName Build name to synchronize
         @param buildRoot Build root override
         @param numThreads Number of concurrent threads to run the sync on
+        @param maxPerRemote Maximum number of projects synchronized concurrently from a single remote (None for no limit)
+        @param incremental If True, projects which didn't change since the last sync are skipped
+        @param resume If True, projects completed by the previous (interrupted) sync with identical inputs are skipped
+        @param worktreeDir If set, a primary repository of each project is kept in this directory, and build projects
+            are created as its worktrees (detached), so that multiple builds share the same object store
+        @param lockFile If set, a lock file (exact hashes of every project) is written here after a successful sync
+        @param syncLockFile If set, projects are synced to exactly the hashes pinned in this lock file (no Gerrit
+            queries are made)
+        @param maintenanceJobs If set, git maintenance (commit-graph, repack) is run after the sync on this many threads,
+            on the synced repositories which are due for it
+        @param telemetryFile If set, timings of all the sync phases (per project) are written here as JSON lines
+        @param telemetryTop If set, tables of this many slowest projects & phases are logged after the sync
+        @param syncPlan Optional plan created by DRepo.plan (with the same arguments), executed as is instead of
+            planning the sync again
+        """
+
+        syncLock = self.__setupBuild(buildName, buildRoot, worktreeDir, syncLockFile)
+
+        if syncPlan and (
+            syncPlan.buildName != self.__build.name
+            or syncPlan.buildRoot != self.__buildRoot
+        ):
+            raise RuntimeError(
+                "Sync plan of build %r @ %r doesn't match build %r @ %r"
+                % (
+                    syncPlan.buildName,
+                    syncPlan.buildRoot,
+                    self.__build.name,
+                    self.__buildRoot,
+                )
+            )
+
+        # SSH connections (both Gerrit queries and git fetches) are shared for the duration of the sync
+        connectionManager = self.__createConnectionManager()
+
+        self.__telemetry = SyncTelemetry()
+
+        try:
+            with connectionManager.gitEnvironment():
+                if not syncPlan:
+                    syncPlan = self.__plan(
+                        numThreads, incremental, resume, syncLock, connectionManager
+                    )
+
+                self.__execute(
+                    syncPlan,
+                    numThreads,
+                    maxPerRemote,
+                    resume,
+                    lockFile,
+                    maintenanceJobs,
+                )
+        finally:
+            connectionManager.close()
+
+            # Written even if the sync failed, since slow failing syncs are the ones worth looking into
+            if telemetryFile:
+                self.__telemetry.save(telemetryFile)
+
+        if telemetryTop:
+            logger.info(self.__telemetry.formatTopTable(telemetryTop))
+
+    def plan(
+        self,
+        buildName=None,
+        buildRoot=None,
+        numThreads=1,
+        incremental=False,
+        resume=False,
+        worktreeDir=None,
+        syncLockFile=None,
+    ):
+        """
+        Plan a sync without modifying anything (dry run): resolve the changes, inspect the local repositories and
+        decide what would be done with each project
+
+        @param buildName see DRepo.sync#buildName
+        @param buildRoot see DRepo.sync#buildRoot
+        @param numThreads see DRepo.sync#numThreads
+        @param incremental see DRepo.sync#incremental
+        @param resume see DRepo.sync#resume
+        @param worktreeDir see DRepo.sync#worktreeDir
+        @param syncLockFile see DRepo.sync#syncLockFile
+        @return SyncPlan
+        """
+
+        syncLock = self.__setupBuild(buildName, buildRoot, worktreeDir, syncLockFile)
+
+        connectionManager = self.__createConnectionManager()
+
+        self.__telemetry = SyncTelemetry()
+
+        try:
+            with connectionManager.gitEnvironment():
+                return self.__plan(
+                    numThreads, incremental, resume, syncLock, connectionManager
+                )
+        finally:
+            connectionManager.close()
+
+    def __createConnectionManager(self):
+        """
+        Create a SSH connection manager with the remotes of all the manifest projects registered, so that the master
+        connections started by git fetches are closed with it
+
+        @return ConnectionManager
+        """
+
+        connectionManager = ConnectionManager()
+
+        for project in self._manifest.projects:
+            connectionManager.register(project.remoteUrl)
+
+        return connectionManager
+
+    def __setupBuild(self, buildName, buildRoot, worktreeDir, syncLockFile):
+        """
+        Select the build to be synced (or planned)
+
+        @param buildName see DRepo.sync#buildName
+        @param buildRoot see DRepo.sync#buildRoot
+        @param worktreeDir see DRepo.sync#worktreeDir
+        @param syncLockFile see DRepo.sync#syncLockFile
+        @return SyncLock the projects are synced to (None to resolve everything from the manifest)
         """
 
         self.__build = self.__findBuild(buildName)
 
         self.__buildRoot = buildRoot if buildRoot else self.__build.root
 
-        # Create connections for all the projects (we'll be using them for queries later on)
+        self.__worktreeDir = os.path.abspath(worktreeDir) if worktreeDir else None
+
+        return SyncLock.load(syncLockFile) if syncLockFile else None
+
+    def __plan(self, numThreads, incremental, resume, syncLock, connectionManager):
+        """
+        Plan the sync of the selected build, without modifying anything
+
+        @param numThreads see DRepo.sync#numThreads
+        @param incremental see DRepo.sync#incremental
+        @param resume see DRepo.sync#resume
+        @param syncLock SyncLock the projects are synced to (None to resolve everything from the manifest)
+        @param connectionManager SSH connection manager
+        @return SyncPlan
+        """
+
+        # Remote name -> CI query duration in seconds
+        ciTimings = {}
+
+        # Connections for all the projects (we'll be using them for queries later on), shared per remote
+        connectionPool = ConnectionPool(self._httpCredentials, connectionManager)
+
         self._connections = {}
         for project in self._manifest.projects:
-            self._connections[project] = Utils.createQueryConnection(
-                project.remote, self._httpCredentials
+            self._connections[project] = connectionPool.get(project.remote)
+
+        if syncLock:
+            # Everything is pinned by the lock file, so there's nothing to query
+            logger.info("syncing from lock of build %r .." % syncLock.buildName)
+
+            self._ciChanges = {}
+
+            projects = []
+            for project in self._manifest.projects:
+                if not syncLock.get(project):
+                    logger.info("skipping %r (not locked) .." % project.name)
+                    continue
+
+                projects.append(project)
+
+            plans = {
+                project: self.__planLockedProject(project, syncLock.get(project))
+                for project in projects
+            }
+        else:
+            # Find CI changes
+            self._ciChanges = {}
+            if self._ciChange:
+                with self.__telemetry.measure(None, self.PHASE_CI_DISCOVERY):
+                    self._ciChanges, ciTimings = self.__findCiChanges(self._ciChange)
+
+            projects = []
+            for project in self._manifest.projects:
+                if self._ciChange and (self._ciOnly and project not in self._ciChanges):
+                    # Skip this project, since it doesn't have a CI change
+                    logger.info("skipping %r (ci_only) .." % project.name)
+                    continue
+
+                projects.append(project)
+
+            # Resolve current patchsets of all the changes up front, so that workers don't have to query Gerrit
+            with self.__telemetry.measure(None, self.PHASE_CHANGE_RESOLUTION):
+                self._changeRefs = self.__resolveChanges(projects)
+
+            plans = {
+                project: self.__planProject(project, self.__build)
+                for project in projects
+            }
+
+        # Project -> reason it doesn't need to be synced
+        skipped = {}
+
+        if incremental:
+            # Skip the projects which didn't change since the last sync
+            state = SyncState(
+                os.path.join(self.__buildRoot, self.STATE_DIR, self.SYNC_STATE_FILE)
+            )
+
+            with self.__telemetry.measure(None, self.PHASE_UP_TO_DATE_CHECK):
+                upToDate = self.__findUpToDateProjects(
+                    list(plans.values()), state, numThreads
+                )
+
+            for project in projects:
+                if project in upToDate:
+                    logger.info("%r up to date, skipping .." % project.name)
+
+                    skipped[project] = "up to date"
+
+        if resume:
+            # Skip the projects the previous sync already finished
+            journal = SyncJournal(
+                os.path.join(self.__buildRoot, self.STATE_DIR, self.SYNC_JOURNAL_FILE),
+                resume,
+                readOnly=True,
+            )
+
+            completed = self.__findCompletedProjects(
+                [plans[project] for project in projects if project not in skipped],
+                journal,
             )
 
-        # Find CI changes
-        self._ciChanges = self.__findCiChanges(self._ciChange) if self._ciChange else {}
+            for project in projects:
+                if project in completed:
+                    logger.info("%r completed previously, skipping .." % project.name)
 
-        projectsToProcess = [i for i in self._manifest.projects]
+                    skipped[project] = "completed previously"
+
+        history = SyncHistory(
+            os.path.join(self.__buildRoot, self.STATE_DIR, self.SYNC_HISTORY_FILE)
+        )
+        sizeHistory = SyncHistory(
+            os.path.join(self.__buildRoot, self.STATE_DIR, self.SYNC_SIZE_HISTORY_FILE)
+        )
+
+        def inspect(project):
+            if project in skipped:
+                return ProjectAction(
+                    SyncPlan.ACTION_SKIP, skipped[project], 0, history.estimate(project)
+                )
+
+            return self.__inspectProject(plans[project], history, sizeHistory)
 
         with concurrent.futures.ThreadPoolExecutor(max_workers=numThreads) as executor:
-            # Launch threads
-            futures = []
-            for i in range(numThreads):
-                futures.append(executor.submit(self.__processor, projectsToProcess))
+            actions = dict(zip(projects, executor.map(inspect, projects)))
+
+        return SyncPlan(self.__build.name, self.__buildRoot, plans, actions, ciTimings)
+
+    def __inspectProject(self, plan, history, sizeHistory):
+        """
+        Decide what needs to be done with a project which isn't skipped, based on its local state
+
+        @param plan Project plan
+        @param history Sync history (used to estimate the sync duration)
+        @param sizeHistory Sync size history (used to estimate the size of incremental fetches)
+        @return ProjectAction
+        """
+
+        estimatedDuration = history.estimate(plan.project)
+
+        if not Commands.getGitDir(plan.path):
+            # Projects are created from the mirror (or the primary repository), so a clone costs about as much as
+            # their object stores, if there are any yet
+            estimatedSize = None
+
+            for rootDir in (self._cacheDir, self.__worktreeDir):
+                if not rootDir:
+                    continue
+
+                objectsDir = os.path.join(
+                    self.__getRepositoryPath(rootDir, plan.project), "objects"
+                )
+                if os.path.isdir(objectsDir):
+                    estimatedSize = Commands.getObjectsSize(objectsDir)
+                    break
 
-            # Wait for results
-            for future in futures:
-                future.result()
+            reason = None
 
-            executor.shutdown()
+            bundlePath = self.__getBundlePath(plan.project)
+            if estimatedSize is None and bundlePath and os.path.isfile(bundlePath):
+                # Only the delta on top of the bundle is fetched from the remote
+                reason = "seeded from bundle"
 
-    def execute(self, command, buildName=None):
+            return ProjectAction(
+                SyncPlan.ACTION_FULL_FETCH, reason, estimatedSize, estimatedDuration
+            )
+
+        # The sync checks out the locked HEAD directly if it's available
+        if plan.headHash and Commands.hasCommit(plan.path, plan.headHash):
+            return ProjectAction(
+                SyncPlan.ACTION_CHECKOUT,
+                "locked HEAD available",
+                0,
+                estimatedDuration,
+            )
+
+        # Size of the delta can't be known without actually negotiating the fetch, so go with what the previous
+        # incremental syncs fetched (unknown until the project was synced incrementally at least once)
+        return ProjectAction(
+            SyncPlan.ACTION_FAST_FORWARD,
+            None,
+            sizeHistory.estimate(plan.project),
+            estimatedDuration,
+        )
+
+    def __execute(
+        self, syncPlan, numThreads, maxPerRemote, resume, lockFile, maintenanceJobs
+    ):
+        """
+        Synchronize the projects according to the plan
+
+        @param syncPlan SyncPlan to execute
+        @param numThreads see DRepo.sync#numThreads
+        @param maxPerRemote see DRepo.sync#maxPerRemote
+        @param resume see DRepo.sync#resume
+        @param lockFile see DRepo.sync#lockFile
+        @param maintenanceJobs see DRepo.sync#maintenanceJobs
+        """
+
+        # Mirrors are updated (at most) once per sync
+        self._updatedMirrors = {}
+
+        plans = syncPlan.plans
+
+        projectsToProcess = syncPlan.projectsToProcess
+
+        state = SyncState(
+            os.path.join(self.__buildRoot, self.STATE_DIR, self.SYNC_STATE_FILE)
+        )
+
+        journal = SyncJournal(
+            os.path.join(self.__buildRoot, self.STATE_DIR, self.SYNC_JOURNAL_FILE),
+            resume,
+        )
+
+        # Largest projects go first, based on how long they took to sync previously
+        history = SyncHistory(
+            os.path.join(self.__buildRoot, self.STATE_DIR, self.SYNC_HISTORY_FILE)
+        )
+        sizeHistory = SyncHistory(
+            os.path.join(self.__buildRoot, self.STATE_DIR, self.SYNC_SIZE_HISTORY_FILE)
+        )
+
+        scheduler = Scheduler(projectsToProcess, history, maxPerRemote)
+
+        projectsPhase = self.__telemetry.measure(None, self.PHASE_PROJECTS)
+
+        try:
+            with projectsPhase, concurrent.futures.ThreadPoolExecutor(
+                max_workers=numThreads
+            ) as executor:
+                # Launch threads
+                futures = []
+                for i in range(numThreads):
+                    futures.append(
+                        executor.submit(
+                            self.__processor,
+                            scheduler,
+                            history,
+                            sizeHistory,
+                            plans,
+                            state,
+                            journal,
+                        )
+                    )
+
+                # Wait for results
+                for future in futures:
+                    future.result()
+
+                executor.shutdown()
+        finally:
+            history.save()
+            sizeHistory.save()
+            state.save()
+            journal.close()
+
+        if maintenanceJobs:
+            with self.__telemetry.measure(None, self.PHASE_MAINTENANCE):
+                self.__runMaintenance(
+                    [plans[project] for project in projectsToProcess], maintenanceJobs
+                )
+
+        if lockFile:
+            self.__writeLock(lockFile, list(plans.values()), state)
+
+        self.__logSyncSummary(
+            len(plans),
+            len(projectsToProcess),
+            self.__telemetry.getGlobalTimings(),
+            syncPlan.ciTimings,
+        )
+
+    def __logSyncSummary(self, numProjects, numSynced, timings, ciTimings):
+        """
+        Log a summary of a successful sync
+
+        @param numProjects Number of projects in the sync
+        @param numSynced Number of projects which were actually synced (not skipped)
+        @param timings Map of phase name -> duration in seconds
+        @param ciTimings Map of remote name -> CI query duration in seconds
+        """
+
+        lines = [
+            "sync summary: %d/%d project(s) synced (%d skipped)"
+            % (numSynced, numProjects, numProjects - numSynced)
+        ]
+
+        for phase, duration in timings.items():
+            line = "\t%s: %.2fs" % (phase, duration)
+
+            if phase == self.PHASE_CI_DISCOVERY and ciTimings:
+                line += " (%s)" % ", ".join(
+                    "%s: %.2fs" % (remoteName, remoteDuration)
+                    for remoteName, remoteDuration in ciTimings.items()
+                )
+
+            lines.append(line)
+
+        logger.info("\n".join(lines))
+
+    def __runMaintenance(self, plans, numThreads):
+        """
+        Run git maintenance on the synced repositories (and their mirrors) which are due for it
+
+        @param plans Plans of the synced projects
+        @param numThreads Number of concurrent maintenance jobs
+        """
+
+        # Schedule directory -> schedule (shared repositories are scheduled by all the builds using them)
+        schedules = {}
+
+        def getSchedule(scheduleDir):
+            if scheduleDir not in schedules:
+                schedules[scheduleDir] = MaintenanceSchedule(
+                    os.path.join(scheduleDir, self.MAINTENANCE_SCHEDULE_FILE)
+                )
+
+            return schedules[scheduleDir]
+
+        buildStateDir = os.path.join(self.__buildRoot, self.STATE_DIR)
+
+        # Object directory -> (repository path, schedule, lock if the repository is shared with other builds)
+        repositories = {}
+
+        for plan in plans:
+            gitDir = Commands.getGitDir(plan.path)
+            if gitDir:
+                commonDir = Commands.getCommonDir(gitDir)
+
+                if commonDir == gitDir:
+                    repositories.setdefault(
+                        os.path.join(commonDir, "objects"),
+                        (
+                            plan.path,
+                            getSchedule(buildStateDir),
+                            contextlib.nullcontext(),
+                        ),
+                    )
+                else:
+                    # Worktree, the primary repository is shared
+                    repositories.setdefault(
+                        os.path.join(commonDir, "objects"),
+                        (
+                            commonDir,
+                            getSchedule(
+                                self.__worktreeDir
+                                if self.__worktreeDir
+                                else buildStateDir
+                            ),
+                            self.__getRepositoryLock(commonDir),
+                        ),
+                    )
+
+            if self._cacheDir:
+                mirrorPath = self.__getMirrorPath(plan.project)
+                repositories.setdefault(
+                    os.path.join(mirrorPath, "objects"),
+                    (
+                        mirrorPath,
+                        getSchedule(self._cacheDir),
+                        self.__getRepositoryLock(mirrorPath),
+                    ),
+                )
+
+        due = [
+            (objectsDir, path, schedule, lock)
+            for objectsDir, (path, schedule, lock) in repositories.items()
+            if schedule.isDue(objectsDir)
+        ]
+
+        logger.info("maintaining %d/%d repositories .." % (len(due), len(repositories)))
+
+        def maintain(objectsDir, path, schedule, lock):
+            # Maintenance is an optimization, so it's not worth failing the sync over
+            try:
+                # Shared repositories may be fetched into by other builds (or the prefetch) at the same time
+                with lock:
+                    Commands.runMaintenance(path, objectsDir)
+            except Exception as e:
+                logger.warning("maintenance of %r failed: %r" % (path, str(e)))
+                return
+
+            schedule.update(objectsDir)
+
+        try:
+            with concurrent.futures.ThreadPoolExecutor(
+                max_workers=numThreads
+            ) as executor:
+                for future in [executor.submit(maintain, *i) for i in due]:
+                    future.result()
+        finally:
+            for schedule in schedules.values():
+                schedule.save()
+
+    def __writeLock(self, path, plans, state):
+        """
+        Write a lock file of the synced build
+
+        @param path Lock file path
+        @param plans List of project plans
+        @param state Sync state containing the results
+        """
+
+        lock = SyncLock(self.__build.name)
+
+        for plan in plans:
+            projectState = state.get(plan)
+
+            if not projectState or projectState[SyncState.KEY_INPUTS] != plan.inputs():
+                raise RuntimeError(
+                    "Project %r is not synced, can't lock it" % plan.project.name
+                )
+
+            lock.add(
+                plan,
+                projectState[SyncState.KEY_BASE_HASH],
+                projectState[SyncState.KEY_HEAD_HASH],
+                projectState.get(SyncState.KEY_CHANGE_HASHES, []),
+                projectState.get(SyncState.KEY_CHANGE_COMMITTERS, []),
+            )
+
+        lock.save(path)
+
+    def status(self, buildName=None, buildRoot=None, numThreads=1):
+        """
+        Scan the local state of all the projects in parallel (dirty, detached, ahead of the synced base, etc.)
+
+        @param buildName Build name
+        @param buildRoot Build root override
+        @param numThreads Number of concurrent threads to run the scan on
+        @return list of ProjectStatus objects (manifest order)
+        """
+
+        build = self.__findBuild(buildName)
+
+        buildRoot = buildRoot if buildRoot else build.root
+
+        state = SyncState(os.path.join(buildRoot, self.STATE_DIR, self.SYNC_STATE_FILE))
+
+        def scan(project):
+            localStatus = Commands.getStatus(os.path.join(buildRoot, project.path))
+
+            if not localStatus:
+                return ProjectStatus(
+                    project.name,
+                    project.path,
+                    False,
+                    None,
+                    None,
+                    0,
+                    0,
+                    None,
+                    None,
+                    False,
+                )
+
+            headHash, branch, numChanged, numUntracked = localStatus
+
+            projectState = state.getProject(project)
+
+            numAhead = None
+            numChanges = None
+            synced = False
+
+            if projectState:
+                numChanges = len(projectState[SyncState.KEY_INPUTS].get("changes", []))
+                synced = headHash == projectState[SyncState.KEY_HEAD_HASH]
+
+                baseHash = projectState[SyncState.KEY_BASE_HASH]
+
+                # Only count if there's something to count
+                if headHash == baseHash:
+                    numAhead = 0
+                elif headHash:
+                    numAhead = Commands.countCommits(
+                        os.path.join(buildRoot, project.path), baseHash
+                    )
+
+            return ProjectStatus(
+                project.name,
+                project.path,
+                True,
+                headHash,
+                branch,
+                numChanged,
+                numUntracked,
+                numAhead,
+                numChanges,
+                synced,
+            )
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=numThreads) as executor:
+            return list(executor.map(scan, self._manifest.projects))
+
+    def createBundles(self, buildName=None, buildRoot=None, numThreads=1):
+        """
+        Create bundles (base & tags of each project) from an already synced build, used to seed the repositories of
+        first-time syncs. Existing bundles are replaced
+
+        @param buildName Build name
+        @param buildRoot Build root override
+        @param numThreads Number of concurrent threads to create the bundles on
+        @return number of bundles created
+        """
+
+        if not self._bundleDir:
+            raise RuntimeError("Creating bundles requires a bundle directory")
+
+        build = self.__findBuild(buildName)
+
+        buildRoot = buildRoot if buildRoot else build.root
+
+        # Bundle path -> project (multiple projects may share the same remote project)
+        bundles = {}
+        for project in self._manifest.projects:
+            bundles.setdefault(self.__getBundlePath(project), project)
+
+        def create(bundlePath, project):
+            path = os.path.join(buildRoot, project.path)
+
+            gitDir = Commands.getGitDir(path)
+            if not gitDir:
+                logger.warning("%r not synced, skipping .." % project.name)
+                return False
+
+            # Worktrees keep their local refs in a private namespace
+            localRefsPrefix = (
+                Commands.LOCAL_REFS_PREFIX
+                if gitDir == os.path.join(path, ".git")
+                else Commands.WORKTREE_REFS_PREFIX
+            )
+
+            return Commands.createBundle(path, bundlePath, [localRefsPrefix + "base"])
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=numThreads) as executor:
+            futures = [
+                executor.submit(create, bundlePath, project)
+                for bundlePath, project in bundles.items()
+            ]
+
+            numCreated = sum(1 for future in futures if future.result())
+
+        logger.info("created %d/%d bundle(s)" % (numCreated, len(bundles)))
+
+        return numCreated
+
+    def prefetch(
+        self,
+        interval=DEFAULT_PREFETCH_INTERVAL_SEC,
+        numThreads=1,
+        maxPerRemote=None,
+        numRounds=None,
+    ):
+        """
+        Keep the mirror cache warm: periodically fetch branches, tags and open changes of all the manifest projects
+        into their mirrors, so that a sync only needs to fetch a small delta. Runs forever, unless numRounds is set
+
+        @param interval Number of seconds between the starts of two rounds
+        @param numThreads Number of concurrent threads to fetch on
+        @param maxPerRemote Maximum number of mirrors fetched concurrently from a single remote (None for no limit)
+        @param numRounds Number of rounds after which to stop (None to run forever)
+        """
+
+        if not self._cacheDir:
+            raise RuntimeError("Prefetch requires a cache directory")
+
+        roundNumber = 0
+
+        while True:
+            startTime = time.time()
+
+            logger.info("prefetch round %d .." % (roundNumber + 1))
+
+            # SSH connections are shared within a single round only, so that we don't keep idle connections open
+            connectionManager = self.__createConnectionManager()
+
+            try:
+                with connectionManager.gitEnvironment():
+                    self.__prefetch(numThreads, maxPerRemote, connectionManager)
+            except Exception as e:
+                # Long running process, so just try again next round
+                logger.error("prefetch round failed: %r" % str(e))
+            finally:
+                connectionManager.close()
+
+            duration = time.time() - startTime
+
+            logger.info("prefetch round done in %.1fs" % duration)
+
+            roundNumber += 1
+            if numRounds and roundNumber >= numRounds:
+                break
+
+            time.sleep(max(0, interval - duration))
+
+    def __prefetch(self, numThreads, maxPerRemote, connectionManager):
+        """
+        Single prefetch round
+
+        @param numThreads see DRepo.prefetch#numThreads
+        @param maxPerRemote see DRepo.prefetch#maxPerRemote
+        @param connectionManager SSH connection manager
+        """
+
+        # Open changes of all the projects, queried in batches (one connection per remote)
+        openChangeRefs = {}
+
+        remoteProjects = {}
+        for project in self._manifest.projects:
+            remoteProjects.setdefault(project.remote, []).append(project)
+
+        connectionPool = ConnectionPool(self._httpCredentials, connectionManager)
+
+        for remote, projects in remoteProjects.items():
+            conn = connectionPool.get(remote)
+
+            openChangeRefs.update(
+                Commands.fetchOpenChangeRefs(
+                    conn, list(dict.fromkeys(project.name for project in projects))
+                )
+            )
+
+        # Mirror path -> (project, refs); multiple projects may share the same mirror
+        mirrors = {}
+
+        for project in self._manifest.projects:
+            # Only the changes on the branches we're tracking
+            refs = [
+                ref
+                for branch, ref in openChangeRefs.get(project.name, [])
+                if branch == project.branch
+            ]
+
+            mirrorPath = self.__getMirrorPath(project)
+
+            if mirrorPath in mirrors:
+                mirrors[mirrorPath][1].extend(
+                    i for i in refs if i not in mirrors[mirrorPath][1]
+                )
+            else:
+                mirrors[mirrorPath] = (project, refs)
+
+        history = SyncHistory(os.path.join(self._cacheDir, self.PREFETCH_HISTORY_FILE))
+
+        mirrorRefs = {project: refs for project, refs in mirrors.values()}
+
+        scheduler = Scheduler(list(mirrorRefs.keys()), history, maxPerRemote)
+
+        try:
+            with concurrent.futures.ThreadPoolExecutor(
+                max_workers=numThreads
+            ) as executor:
+                futures = [
+                    executor.submit(
+                        self.__prefetchProcessor,
+                        scheduler,
+                        history,
+                        mirrorRefs,
+                        openChangeRefs,
+                    )
+                    for i in range(numThreads)
+                ]
+
+                for future in futures:
+                    future.result()
+        finally:
+            history.save()
+
+    def __prefetchProcessor(self, scheduler, history, mirrorRefs, openChangeRefs):
+        """
+        Prefetch thread
+
+        @param scheduler Scheduler handing out the projects (shared between multiple threads)
+        @param history History in which the mirror update durations are recorded
+        @param mirrorRefs Map of project -> change refs to be fetched into its mirror
+        @param openChangeRefs Map of project name -> (branch, change ref) pairs of all the open changes (see
+            Commands.fetchOpenChangeRefs)
+        """
+
+        while True:
+            project = scheduler.acquire()
+            if not project:
+                break
+
+            startTime = time.time()
+
+            try:
+                mirrorPath = self.__getMirrorPath(project)
+
+                with self.__getRepositoryLock(mirrorPath):
+                    Commands.updateMirror(
+                        mirrorPath,
+                        project.remoteUrl,
+                        Utils.injectPassword(project.remoteUrl, self._httpCredentials),
+                        self.NUM_FETCH_RETRIES,
+                        mirrorRefs[project],
+                        cloneFilter=project.cloneFilter,
+                        bundlePath=self.__getBundlePath(project),
+                    )
+
+                    # Otherwise the mirror accumulates refs of every change ever fetched
+                    Commands.pruneChangeRefs(
+                        mirrorPath,
+                        [ref for _, ref in openChangeRefs.get(project.name, [])],
+                    )
+            except Exception as e:
+                # Keep going, the project will be tried again next round (and synced normally anyway)
+                logger.warning("prefetch of %r failed: %r" % (project.name, str(e)))
+            finally:
+                scheduler.release(project)
+
+            history.update(project, time.time() - startTime)
+
+    def execute(
+        self,
+        command,
+        buildName=None,
+        numThreads=1,
+        keepGoing=False,
+        logDir=None,
+        buildRoot=None,
+    ):
         """
         Execute a command in all project directories
 
+        With a single thread the output is logged as the command runs. Otherwise the commands run in parallel, and the
+        output of each project is buffered and logged at once, in the manifest order (or written to a per-project log
+        file, if logDir is set).
+
         @param command Command to execute
         @param buildName(optional) Build name
+        @param numThreads Number of projects to execute the command in concurrently
+        @param keepGoing If False execution stops at the first failed project, otherwise all projects are processed
+        @param logDir(optional) If set, output of each project is written to a log file in this directory
+        @param buildRoot(optional) Build root override
         """
 
         build = self.__findBuild(buildName)
 
+        root = buildRoot if buildRoot else build.root
+
+        # Absolute paths of all the existing projects
+        projects = []
         for project in self._manifest.projects:
-            # Absolute path of this project on disk
-            projAbsPath = os.path.join(build.root, project.path)
+            projAbsPath = os.path.join(root, project.path)
 
-            if not os.path.exists(projAbsPath):
-                continue
+            if os.path.exists(projAbsPath):
+                projects.append((project, projAbsPath))
+
+        if logDir:
+            makeDirTree(logDir)
+
+        # Set once a command fails (if we're not supposed to keep going)
+        stopEvent = threading.Event()
+
+        def run(project, projAbsPath):
+            if stopEvent.is_set():
+                return None
+
+            cmd = ShellCommand(
+                command,
+                workingDirectory=projAbsPath,
+                raiseOnError=False,
+                output=(
+                    logger.info
+                    if numThreads == 1 and not logDir
+                    else (lambda string: None)
+                ),
+            )
+            cmd.run()
+
+            if cmd.returnCode != ShellCommand.RETURN_CODE_OK and not keepGoing:
+                stopEvent.set()
+
+            return cmd
+
+        failed = []
+        numExecuted = 0
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=numThreads) as executor:
+            futures = [
+                (project, executor.submit(run, project, projAbsPath))
+                for project, projAbsPath in projects
+            ]
+
+            # Report the results in manifest order
+            for project, future in futures:
+                cmd = future.result()
+                if not cmd:
+                    # Skipped because of a previous failure
+                    continue
+
+                numExecuted += 1
+
+                self.__reportCommandOutput(project, cmd, numThreads, logDir)
+
+                if cmd.returnCode != ShellCommand.RETURN_CODE_OK:
+                    failed.append((project, cmd))
+
+        logger.info(
+            "forall: %d succeeded, %d failed, %d skipped"
+            % (
+                numExecuted - len(failed),
+                len(failed),
+                len(projects) - numExecuted,
+            )
+        )
 
-            ShellCommand.execute(
-                command, workingDirectory=projAbsPath, output=logger.info
+        for project, cmd in failed:
+            logger.error("\t%r failed with code %d" % (project.path, cmd.returnCode))
+
+        if failed:
+            # Report the first failure
+            project, cmd = failed[0]
+
+            raise CommandFailedException(
+                cmd,
+                "Command %r failed in %d project(s), first one being %r (code %d)"
+                % (" ".join(command), len(failed), project.path, cmd.returnCode),
+            )
+
+    def __reportCommandOutput(self, project, cmd, numThreads, logDir):
+        """
+        Report output of a command executed via DRepo.execute
+
+        @param project Project the command was executed in
+        @param cmd Executed command
+        @param numThreads see DRepo.execute#numThreads
+        @param logDir see DRepo.execute#logDir
+        """
+
+        if logDir:
+            logPath = os.path.join(logDir, project.path.replace(os.sep, "_") + ".log")
+
+            with open(logPath, "wb") as fileObj:
+                fileObj.write(cmd.stdout)
+                fileObj.write(cmd.stderr)
+
+            logger.info(
+                "%r finished with code %d (%s)"
+                % (project.path, cmd.returnCode, logPath)
+            )
+
+        elif numThreads > 1:
+            # Output was buffered, so log it at once
+            output = (cmd.stdoutStr + cmd.stderrStr).rstrip()
+
+            logger.info(
+                "\n\t---> %r (code %d)%s"
+                % (project.path, cmd.returnCode, "\n" + output if output else "")
             )
 
     def __findBuild(self, buildName):
@@ -147,49 +1160,77 @@ class DRepo:
         except StopIteration:
             raise RuntimeError("Build not defined: %r" % buildName)
 
-    def __processor(self, projectsToProcess):
+    def __processor(self, scheduler, history, sizeHistory, plans, state, journal):
         """
         Project processor thread
 
-        @param projectsToProcess List of projects that are not yet processed (shared between multiple threads)
+        @param scheduler Scheduler handing out the projects (shared between multiple threads)
+        @param history Sync history in which project durations are recorded
+        @param sizeHistory Sync size history in which the fetched sizes of existing projects are recorded
+        @param plans Map of project -> project plan
+        @param state Sync state in which the results are recorded
+        @param journal Sync journal in which the completed steps are recorded
         """
 
         threadName = threading.current_thread().name
 
         logger.debug("[%s] start processor" % threadName)
 
-        while projectsToProcess:
+        while True:
             # Take next available project
-            try:
-                project = projectsToProcess.pop()
-            except IndexError:
+            project = scheduler.acquire()
+            if not project:
                 break
 
             logger.debug("[%s] processing %r" % (threadName, project.name))
 
+            startTime = time.time()
+            startSize = self.__getProjectObjectsSize(plans[project].path)
+
             # Process
-            self.__processProject(project, self.__build)
+            try:
+                self.__processProject(plans[project], state, journal)
+            finally:
+                scheduler.release(project)
+
+            history.update(project, time.time() - startTime)
+
+            # Full fetches aren't representative of what the next (incremental) syncs are going to fetch
+            if startSize is not None:
+                sizeHistory.update(
+                    project,
+                    max(
+                        0, self.__getProjectObjectsSize(plans[project].path) - startSize
+                    ),
+                )
 
             logger.debug("[%s] done processing %r" % (threadName, project.name))
 
-    def __processProject(self, project, build):
+    @staticmethod
+    def __getProjectObjectsSize(path):
         """
-        Process a single project (checkout branches, download changes, etc.
+        Get the disk size of the object store of a project
 
-        @param build Target manifest build
-        @param project Target project
+        @param path Project path
+        @return size in bytes, or None if the project doesn't exist yet
         """
 
-        logger.info("\n\t---> processing %r" % project.name)
+        gitDir = Commands.getGitDir(path)
+        if not gitDir:
+            return None
 
-        # Connection to Gerrit
-        conn = self._connections[project]
+        return Commands.getObjectsSize(
+            os.path.join(Commands.getCommonDir(gitDir), "objects")
+        )
 
-        # URL we're fetching from
-        fetchUrl = Utils.injectPassword(project.remoteUrl, self._httpCredentials)
+    def __planProject(self, project, build):
+        """
+        Figure out what needs to be done to synchronize a project (base, changes, etc.)
 
-        # Absolute path of this project on disk
-        projAbsPath = os.path.join(self.__buildRoot, project.path)
+        @param project Target project
+        @param build Target manifest build
+        @return ProjectPlan
+        """
 
         # Optional checkout we're using as a base
         checkout = build.checkouts.get(project)
@@ -203,19 +1244,9 @@ class DRepo:
         # CI change
         ciChange = self._ciChanges.get(project)
 
-        if self._ciChange and (self._ciOnly and not ciChange):
-            # Skip this project, since it doesn't have a CI change
-            logger.info("skipping (ci_only) ..")
-            return
-
         # Optional tag we're using as a base
         tag = build.tags.get(project)
 
-        # Don't fetch entire history, just up to self._fetchDepth commits
-        fetchDepthArg = []
-        if self._fetchDepth:
-            fetchDepthArg = ["--depth", self._fetchDepth]
-
         # No point in having checkout and tag as a base, since they overwrite eachother
         if tag and checkout:
             raise RuntimeError(
@@ -223,103 +1254,666 @@ class DRepo:
                 % project.name
             )
 
-        # Prepare local directory (initialize git, clean, etc.)
-        Commands.prepareGit(
-            projAbsPath, project.remoteUrl, ProjectOption.CLEAN in project.opts
-        )
+        # Branch which should be checked out (None if base is detached)
+        baseBranch = None
+
+        # List of changes to be applied on top of the base
+        changes = []
 
         if self._tag:
             # If tag is specified by the user (e.g. release), just check it out ignoring everything else
-            Commands.checkoutTag(
-                conn,
-                projAbsPath,
-                self._tag,
-                fetchUrl,
-                self.NUM_FETCH_RETRIES,
-                fetchDepthArg,
-            )
+            baseRef = Commands.TAG_REF_PREFIX + self._tag
         else:
-            # Tag & checkout not defined -> use clean branch as base
-            if not tag and not checkout:
-                Commands.checkoutBranch(
-                    conn,
-                    projAbsPath,
-                    project.branch,
-                    fetchUrl,
-                    self.NUM_FETCH_RETRIES,
-                    fetchDepthArg,
-                )
-
             # Use tag as base
-            elif tag:
-                Commands.checkoutTag(
-                    conn,
-                    projAbsPath,
-                    tag,
-                    fetchUrl,
-                    self.NUM_FETCH_RETRIES,
-                    fetchDepthArg,
-                )
+            if tag:
+                baseRef = Commands.TAG_REF_PREFIX + tag
 
             # Use checkout as base
             elif checkout:
-                Commands.downloadChange(
-                    conn,
-                    projAbsPath,
-                    checkout,
-                    fetchUrl,
-                    DownloadType.CHECKOUT,
-                    DRepo.NUM_FETCH_RETRIES,
-                    fetchDepthArg,
-                )
+                baseRef = self._changeRefs[(project, checkout)]
+
+            # Tag & checkout not defined -> use clean branch as base
+            else:
+                baseRef = Commands.BRANCH_REF_PREFIX + project.branch
+                baseBranch = project.branch
 
             # Pull change on top of the base
             if pullChange:
-                Commands.downloadChange(
-                    conn,
-                    projAbsPath,
-                    pullChange,
-                    fetchUrl,
-                    DownloadType.MERGE,
-                    DRepo.NUM_FETCH_RETRIES,
-                    fetchDepthArg,
+                changes.append(
+                    ChangeDownload(
+                        pullChange,
+                        self._changeRefs[(project, pullChange)],
+                        DownloadType.MERGE,
+                    )
                 )
 
-            # Download cherry picks
+            # Cherry picks
             for cp in cherryPicks:
-                Commands.downloadChange(
-                    conn,
-                    projAbsPath,
-                    cp,
-                    fetchUrl,
-                    DownloadType.CHERRYPICK,
-                    DRepo.NUM_FETCH_RETRIES,
-                    fetchDepthArg,
+                changes.append(
+                    ChangeDownload(
+                        cp, self._changeRefs[(project, cp)], DownloadType.CHERRYPICK
+                    )
                 )
 
-            # Download CI change
+            # CI change
             if ciChange:
-                Commands.downloadChange(
-                    conn,
-                    projAbsPath,
-                    ciChange.number,
-                    fetchUrl,
-                    self._ciType,
-                    DRepo.NUM_FETCH_RETRIES,
-                    fetchDepthArg,
+                changes.append(
+                    ChangeDownload(
+                        ciChange.number, ciChange.currentRevision.ref, self._ciType
+                    )
+                )
+
+        return ProjectPlan(
+            project,
+            os.path.join(self.__buildRoot, project.path),
+            baseRef,
+            baseBranch,
+            changes,
+            self._fetchDepth,
+            ProjectOption.CLEAN in project.opts,
+            project.cloneFilter,
+            project.sparsePaths,
+        )
+
+    def __planLockedProject(self, project, entry):
+        """
+        Create a plan which syncs the project to exactly the hashes pinned in the lock file
+
+        @param project Target project
+        @param entry Project lock entry (see SyncLock.get)
+        @return ProjectPlan
+        """
+
+        if entry[SyncLock.KEY_REMOTE_URL] != project.remoteUrl:
+            logger.warning(
+                "%r locked with a different remote %r"
+                % (project.name, entry[SyncLock.KEY_REMOTE_URL])
+            )
+
+        return ProjectPlan(
+            project,
+            os.path.join(self.__buildRoot, project.path),
+            entry[SyncLock.KEY_BASE_HASH],
+            entry[SyncLock.KEY_BASE_BRANCH],
+            [
+                ChangeDownload(
+                    change[SyncLock.KEY_CHANGE],
+                    change[SyncLock.KEY_HASH],
+                    DownloadType(change[SyncLock.KEY_DOWNLOAD_TYPE]),
+                    change.get(SyncLock.KEY_COMMITTER),
                 )
+                for change in entry[SyncLock.KEY_CHANGES]
+            ],
+            self._fetchDepth,
+            ProjectOption.CLEAN in project.opts,
+            project.cloneFilter,
+            project.sparsePaths,
+            entry[SyncLock.KEY_HEAD_HASH],
+        )
+
+    def __processProject(self, plan, state, journal):
+        """
+        Process a single project (checkout branches, download changes, etc.
+
+        All the refs the project needs (base, changes and tags) are fetched with a single fetch into local refs,
+        after which the base is checked out and the changes applied locally.
+
+        @param plan Project plan
+        @param state Sync state in which the result is recorded
+        @param journal Sync journal in which the completed steps are recorded
+        """
+
+        project = plan.project
+
+        logger.info("\n\t---> processing %r" % project.name)
+
+        # Project is about to be modified, so whatever was recorded so far is no longer valid
+        state.invalidate(plan)
+
+        # URL we're fetching from
+        fetchUrl = Utils.injectPassword(project.remoteUrl, self._httpCredentials)
+
+        # Fetching from the named remote, with credentials (if any) passed on the command line only
+        fetchSource = Commands.REMOTE_NAME
+        gitArgs = Commands.getUrlRewriteArgs(project.remoteUrl, fetchUrl)
+
+        # Absolute path of this project on disk
+        projAbsPath = plan.path
+
+        # Don't fetch entire history, just up to plan.fetchDepth commits
+        fetchDepthArg = []
+        if plan.fetchDepth:
+            fetchDepthArg = ["--depth", plan.fetchDepth]
+
+        # Skip objects excluded by the partial clone filter (fetched on demand later on)
+        fetchArgs = list(fetchDepthArg)
+        if plan.cloneFilter:
+            fetchArgs.append("--filter=" + plan.cloneFilter)
+
+        # Namespace of the local refs
+        localRefsPrefix = (
+            Commands.WORKTREE_REFS_PREFIX
+            if self.__worktreeDir
+            else Commands.LOCAL_REFS_PREFIX
+        )
+
+        # Local ref the base is fetched into
+        baseRef = localRefsPrefix + "base"
+
+        # Local refs the changes are fetched into
+        changeRefs = [
+            localRefsPrefix + "changes/%d" % index for index in range(len(plan.changes))
+        ]
+
+        # Remote ref -> local ref pairs, fetched all at once
+        refs = [(plan.baseRef, baseRef)]
+
+        for change, changeRef in zip(plan.changes, changeRefs):
+            refs.append((change.ref, changeRef))
 
         if not fetchDepthArg:
             # If depth is not specified, fetch all the tags as well (may be used for release note generation later on)
-            ShellCommand.execute(
-                ["git", "fetch", fetchUrl, project.branch, "--tags", "-f"],
-                workingDirectory=projAbsPath,
-                numRetries=self.NUM_FETCH_RETRIES,
-                randomRetry=True,
+            refs.append((Commands.TAG_REF_PREFIX + "*", Commands.TAG_REF_PREFIX + "*"))
+
+        # Refs fetched by the previous (interrupted) sync with the same inputs may still be there (unless the project
+        # was removed or its refs deleted in the meantime)
+        lastStep, _ = journal.lastStep(plan)
+        fetched = (
+            lastStep in (SyncJournal.STEP_FETCHED, SyncJournal.STEP_APPLIED)
+            and Commands.getGitDir(projAbsPath) is not None
+            and Commands.hasCommits(projAbsPath, [baseRef] + changeRefs)
+        )
+
+        # Change refs may be pruned from the mirror (see DRepo.prefetch), so the mirror stays locked until they're
+        # fetched from it
+        mirrorLock = (
+            self.__getRepositoryLock(self.__getMirrorPath(project))
+            if self._cacheDir
+            else contextlib.nullcontext()
+        )
+
+        with mirrorLock:
+            # Everything is fetched from the local mirror if the cache is enabled
+            mirrorPath = None
+            if self._cacheDir and fetched:
+                mirrorPath = self.__getMirrorPath(project)
+
+            elif self._cacheDir:
+                # Branches & tags are always in the mirror, change refs have to be fetched explicitly
+                mirrorRefs = [change.ref for change in plan.changes]
+                if not plan.baseRef.startswith(
+                    (Commands.BRANCH_REF_PREFIX, Commands.TAG_REF_PREFIX)
+                ):
+                    mirrorRefs.append(plan.baseRef)
+
+                with self.__telemetry.measure(project, SyncTelemetry.PHASE_MIRROR):
+                    mirrorPath = self.__updateMirror(
+                        project, fetchUrl, mirrorRefs, plan.cloneFilter
+                    )
+
+            if mirrorPath:
+                fetchSource = mirrorPath
+                gitArgs = []
+
+                if plan.cloneFilter:
+                    # Objects come from the mirror via alternates, and a filtered fetch would register the mirror path as
+                    # a promisor remote
+                    fetchArgs = fetchDepthArg + ["--no-filter"]
+
+            with self.__telemetry.measure(project, SyncTelemetry.PHASE_PREPARE):
+                if self.__worktreeDir:
+                    self.__prepareWorktree(
+                        plan, fetchSource, fetchArgs, gitArgs, mirrorPath
+                    )
+
+                # Prepare local directory (initialize git, clean, etc.)
+                Commands.prepareGit(
+                    projAbsPath,
+                    project.remoteUrl,
+                    plan.clean,
+                    # Worktrees share the object store of their primary repository
+                    referencePath=None if self.__worktreeDir else mirrorPath,
+                    cloneFilter=plan.cloneFilter,
+                    # Otherwise the objects come from the mirror, or the primary repository
+                    bundlePath=(
+                        None
+                        if self.__worktreeDir or mirrorPath
+                        else self.__getBundlePath(project)
+                    ),
+                )
+
+            journal.record(plan, SyncJournal.STEP_PREPARED)
+
+            # Locked HEAD may already be available (e.g. synced from the same lock before), in which case the changes
+            # don't need to be fetched or applied again
+            lockedHeadAvailable = plan.headHash and Commands.hasCommit(
+                projAbsPath, plan.headHash
             )
 
+            if lockedHeadAvailable:
+                logger.info(
+                    "locked HEAD %r available @ %r" % (plan.headHash, projAbsPath)
+                )
+
+                # Check out the result directly
+                baseRef = plan.headHash
+                changeRefs = []
+
+            elif fetched:
+                logger.info("refs already fetched @ %r" % projAbsPath)
+            else:
+                # Single fetch of everything we need
+                with self.__telemetry.measure(project, SyncTelemetry.PHASE_FETCH):
+                    Commands.fetchRefs(
+                        projAbsPath,
+                        fetchSource,
+                        refs,
+                        self.NUM_FETCH_RETRIES,
+                        fetchArgs,
+                        gitArgs,
+                    )
+
+                    # Refs of the bundle the repository was seeded with were only needed to negotiate the first fetch
+                    if not mirrorPath and self.__getBundlePath(project):
+                        Commands.deleteBundleRefs(projAbsPath)
+
+                journal.record(plan, SyncJournal.STEP_FETCHED)
+
+        with self.__telemetry.measure(project, SyncTelemetry.PHASE_CHECKOUT):
+            # Restrict (or restore) the working tree before anything is checked out
+            Commands.setSparseCheckout(projAbsPath, plan.sparsePaths)
+
+            # Checkout the base (a branch may be checked out in a single worktree only, so worktrees are always
+            # detached)
+            if plan.baseBranch and not self.__worktreeDir:
+                Commands.checkoutLocalBranch(projAbsPath, plan.baseBranch, baseRef)
+            else:
+                logger.info("checkout %r @ %r" % (plan.baseRef, projAbsPath))
+
+                Commands.checkoutLocalRef(projAbsPath, baseRef)
+
+        # Committers of the cherry-picked commits (locked ones if the base is the locked HEAD)
+        changeCommitters = [change.committer for change in plan.changes]
+
+        # Apply the changes (if the base is the locked HEAD changeRefs is empty)
+        with self.__telemetry.measure(project, SyncTelemetry.PHASE_APPLY):
+            for index, (change, changeRef) in enumerate(zip(plan.changes, changeRefs)):
+                logger.info(
+                    "%s %r @ %r"
+                    % (change.downloadType.name, str(change.change), projAbsPath)
+                )
+
+                Commands.applyChange(
+                    projAbsPath, changeRef, change.downloadType, change.committer
+                )
+
+                # Cherry-picks create new commits, which can only be reproduced with the same committer
+                if change.downloadType == DownloadType.CHERRYPICK:
+                    changeCommitters[index] = Commands.getCommitter(projAbsPath)
+
+        # Remember what we synced to, so that the next incremental sync may skip this project if nothing changed
+        with self.__telemetry.measure(project, SyncTelemetry.PHASE_STATE):
+            if lockedHeadAvailable:
+                baseHash = plan.baseRef
+                headHash = plan.headHash
+                changeHashes = [change.ref for change in plan.changes]
+            else:
+                hashes = Commands.revParse(projAbsPath, [baseRef, "HEAD"] + changeRefs)
+                baseHash, headHash, changeHashes = hashes[0], hashes[1], hashes[2:]
+
+                if plan.headHash and headHash != plan.headHash:
+                    raise RuntimeError(
+                        "%r HEAD %r differs from the locked one %r (locked without cherry-pick committers?)"
+                        % (project.name, headHash, plan.headHash)
+                    )
+
+            state.update(plan, baseHash, headHash, changeHashes, changeCommitters)
+
+        journal.record(plan, SyncJournal.STEP_APPLIED, headHash)
+
+    def __findCompletedProjects(self, plans, journal):
+        """
+        Find projects the previous sync completed with identical inputs, and which weren't modified since
+
+        @param plans List of project plans
+        @param journal Journal of the previous sync
+        @return set of completed projects
+        """
+
+        completed = set()
+
+        for plan in plans:
+            step, entry = journal.lastStep(plan)
+            if step != SyncJournal.STEP_APPLIED:
+                continue
+
+            # Make sure nobody touched the project in the meantime (including any files a clean sync would remove)
+            localState = Commands.getLocalState(plan.path, plan.clean)
+            if not localState:
+                continue
+
+            headHash, dirty = localState
+            if not dirty and headHash == entry[SyncJournal.KEY_HEAD_HASH]:
+                completed.add(plan.project)
+
+        return completed
+
+    def __findUpToDateProjects(self, plans, state, numThreads):
+        """
+        Find projects which don't need to be synchronized, because neither their inputs, remote base or local
+        state changed since the last sync
+
+        @param plans List of project plans
+        @param state Sync state of the previous sync
+        @param numThreads Number of concurrent threads to run the checks on
+        @return set of up to date projects
+        """
+
+        # Only projects synchronized with exactly the same inputs are candidates
+        candidates = []
+        for plan in plans:
+            projectState = state.get(plan)
+
+            if projectState and projectState[SyncState.KEY_INPUTS] == plan.inputs():
+                candidates.append((plan, projectState))
+
+        logger.info(
+            "checking %d/%d project(s) for remote changes .."
+            % (len(candidates), len(plans))
+        )
+
+        def isUpToDate(plan, projectState):
+            # Local repository still at the same commit and not dirty (a clean sync removes untracked & ignored files
+            # as well, so any such file needs a sync) ?
+            localState = Commands.getLocalState(plan.path, plan.clean)
+            if not localState:
+                return False
+
+            headHash, dirty = localState
+            if dirty or headHash != projectState[SyncState.KEY_HEAD_HASH]:
+                return False
+
+            # Base pinned by a lock file can't move
+            if Commands.HASH_REGEX.match(plan.baseRef):
+                return plan.baseRef == projectState[SyncState.KEY_BASE_HASH]
+
+            # Remote base didn't move ?
+            baseHash = Commands.lsRemote(
+                Utils.injectPassword(plan.project.remoteUrl, self._httpCredentials),
+                plan.baseRef,
+                self.NUM_FETCH_RETRIES,
+            )
+
+            return baseHash == projectState[SyncState.KEY_BASE_HASH]
+
+        upToDate = set()
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=numThreads) as executor:
+            futures = {
+                executor.submit(isUpToDate, plan, projectState): plan
+                for plan, projectState in candidates
+            }
+
+            for future in concurrent.futures.as_completed(futures):
+                if future.result():
+                    upToDate.add(futures[future].project)
+
+        return upToDate
+
+    def __resolveChanges(self, projects):
+        """
+        Resolve current patchset references of all the build changes (checkouts, pulls and cherry-picks), using
+        batched queries (a few per remote)
+
+        @param projects Projects which are going to be processed
+        @return map of (project, change) -> patchset reference
+        """
+
+        if self._tag:
+            # Changes are ignored if the tag is specified by the user
+            return {}
+
+        # Group the changes by remote
+        remoteChanges = {}
+        for project in projects:
+            changes = []
+
+            if project in self.__build.checkouts:
+                changes.append(self.__build.checkouts[project])
+
+            if project in self.__build.pulls:
+                changes.append(self.__build.pulls[project])
+
+            changes += self.__build.cherrypicks.get(project, [])
+
+            for change in changes:
+                remoteChanges.setdefault(project.remote, []).append((project, change))
+
+        refs = {}
+        for remote, projectChanges in remoteChanges.items():
+            # Any of the connections to this remote will do
+            conn = self._connections[projectChanges[0][0]]
+
+            logger.info(
+                "resolving %d change(s) from %r .." % (len(projectChanges), remote.name)
+            )
+
+            remoteRefs = Commands.fetchCurrentPatchsetRefs(
+                conn, [(project.name, change) for project, change in projectChanges]
+            )
+
+            for project, change in projectChanges:
+                refs[(project, change)] = remoteRefs[(project.name, change)]
+
+        return refs
+
+    def __prepareWorktree(self, plan, fetchSource, fetchArgs, gitArgs, mirrorPath):
+        """
+        Make sure the project is a worktree of its primary repository
+
+        @param plan Project plan
+        @param fetchSource Remote name or mirror path we're fetching from
+        @param fetchArgs Additional fetch arguments
+        @param gitArgs Additional git options
+        @param mirrorPath Mirror path if the cache is enabled, None otherwise
+        """
+
+        primaryPath = self.__getRepositoryPath(self.__worktreeDir, plan.project)
+
+        # Multiple projects may share the same primary repository
+        with self.__getRepositoryLock(primaryPath):
+            if Commands.getGitDir(plan.path):
+                # Already exists (either as a worktree, or as a standalone clone from before)
+                if mirrorPath:
+                    Commands.addAlternate(primaryPath, mirrorPath)
+                return
+
+            Commands.addWorktree(
+                primaryPath,
+                plan.path,
+                plan.project.remoteUrl,
+                fetchSource,
+                plan.baseRef,
+                self.NUM_FETCH_RETRIES,
+                fetchArgs,
+                gitArgs,
+                referencePath=mirrorPath,
+                cloneFilter=plan.cloneFilter,
+                bundlePath=None if mirrorPath else self.__getBundlePath(plan.project),
+            )
+
+    def __getMirrorPath(self, project):
+        """
+        Get the mirror path of given project (one mirror per remote project)
+
+        @param project Manifest project
+        @return absolute mirror path
+        """
+
+        return self.__getRepositoryPath(self._cacheDir, project)
+
+    def __getBundlePath(self, project):
+        """
+        Get the path of the bundle a new repository of given project is seeded with (one bundle per remote project)
+
+        @param project Manifest project
+        @return absolute bundle path, or None if bundles are not used
+        """
+
+        if not self._bundleDir:
+            return None
+
+        return (
+            os.path.splitext(self.__getRepositoryPath(self._bundleDir, project))[0]
+            + ".bundle"
+        )
+
+    def __getRepositoryPath(self, rootDir, project):
+        """
+        Get the path of a repository shared by all the builds (e.g. mirror), one per remote project
+
+        @param rootDir Directory in which the shared repositories are kept
+        @param project Manifest project
+        @return absolute repository path
+        """
+
+        hostName = urlparse(project.remoteUrl).hostname
+
+        mirrorName = project.name
+        if not mirrorName.endswith(".git"):
+            mirrorName += ".git"
+
+        return os.path.join(rootDir, hostName if hostName else "local", mirrorName)
+
+    def __getRepositoryLock(self, path):
+        """
+        Get the lock serializing modifications of a shared repository (within this process, and with other processes
+        using the same repository)
+
+        @param path Repository path
+        @return lock
+        """
+
+        with self._repositoryLocksLock:
+            lock = self._repositoryLocks.get(path)
+
+            if not lock:
+                lock = RepositoryLock(path)
+                self._repositoryLocks[path] = lock
+
+            return lock
+
+    def __updateMirror(self, project, fetchUrl, refs, cloneFilter=None):
+        """
+        Update the project mirror, if it wasn't already updated during this sync. Refs not present in the mirror
+        (e.g. Gerrit changes) are fetched into it as well
+
+        @param project Manifest project
+        @param fetchUrl URL we're fetching from
+        @param refs Additional refs the project needs
+        @param cloneFilter Optional partial clone filter
+        @return mirror path
+        """
+
+        mirrorPath = self.__getMirrorPath(project)
+
+        # Multiple projects may share the same mirror, so serialize the updates
+        with self.__getRepositoryLock(mirrorPath):
+            if mirrorPath not in self._updatedMirrors:
+                # Full update (branches, tags & additional refs)
+                Commands.updateMirror(
+                    mirrorPath,
+                    project.remoteUrl,
+                    fetchUrl,
+                    self.NUM_FETCH_RETRIES,
+                    refs,
+                    cloneFilter=cloneFilter,
+                    bundlePath=self.__getBundlePath(project),
+                )
+
+                self._updatedMirrors[mirrorPath] = set(refs)
+            else:
+                # Fetch only the refs we don't have yet
+                missingRefs = [
+                    ref for ref in refs if ref not in self._updatedMirrors[mirrorPath]
+                ]
+
+                if missingRefs:
+                    Commands.updateMirror(
+                        mirrorPath,
+                        project.remoteUrl,
+                        fetchUrl,
+                        self.NUM_FETCH_RETRIES,
+                        missingRefs,
+                        full=False,
+                        cloneFilter=cloneFilter,
+                    )
+
+                    self._updatedMirrors[mirrorPath].update(missingRefs)
+
+        return mirrorPath
+
+    def analyzeReport(
+        self,
+        numMergedCommits=3,
+        tagPattern=None,
+        numThreads=1,
+        cacheFile=None,
+        cacheTtl=ChangeInfoCache.DEFAULT_OPEN_TTL,
+    ):
+        """
+        Analyze the projects of the selected build, so that any number of reports can be rendered from the result
+
+        @param numMergedCommits Number of merged commits to include in the report
+        @param tagPatern Tag pattern
+        @param numThreads Number of threads to run in parallel
+        @param cacheFile Report cache path (defaults to the build state directory)
+        @param cacheTtl Time (in seconds) for which cached information about changes which are not merged remains valid
+        @return ReportInfo
+        """
+
+        if not cacheFile:
+            cacheFile = os.path.join(
+                self._manifest.selectedBuild.root,
+                self.STATE_DIR,
+                self.REPORT_CACHE_FILE,
+            )
+
+        cache = ChangeInfoCache(cacheFile, cacheTtl)
+
+        try:
+            return Analyzer.analyze(
+                self._manifest,
+                self._httpCredentials,
+                numMergedCommits,
+                tagPattern,
+                numThreads,
+                cache,
+            )
+        finally:
+            cache.close()
+
+    def writeReport(self, outputFile, generator, reportInfo):
+        """
+        Render a report file from already analyzed projects
+
+        @param outputFile Target file name
+        @param generator Note generator
+        @param reportInfo ReportInfo (see analyzeReport)
+        """
+
+        with io.open(outputFile, mode="w", encoding=self.REPORT_ENCODING) as fileObj:
+            fileObj.write(generator(reportInfo))
+
     def generateReport(
-        self, outputFile, generator, numMergedCommits=3, tagPattern=None, numThreads=1
+        self,
+        outputFile,
+        generator,
+        numMergedCommits=3,
+        tagPattern=None,
+        numThreads=1,
+        cacheFile=None,
+        cacheTtl=ChangeInfoCache.DEFAULT_OPEN_TTL,
     ):
         """
         Generate a report file
@@ -329,59 +1923,82 @@ class DRepo:
         @param numMergedCommits Number of merged commits to include in the report
         @param tagPatern Tag pattern
         @param numThreads Number of threads to run in parallel
+        @param cacheFile Report cache path (defaults to the build state directory)
+        @param cacheTtl Time (in seconds) for which cached information about changes which are not merged remains valid
         """
 
-        projectsInfo = Analyzer.analyze(
-            self._manifest,
-            self._httpCredentials,
-            numMergedCommits,
-            tagPattern,
-            numThreads,
+        self.writeReport(
+            outputFile,
+            generator,
+            self.analyzeReport(
+                numMergedCommits, tagPattern, numThreads, cacheFile, cacheTtl
+            ),
         )
 
-        with io.open(outputFile, mode="w", encoding=self.REPORT_ENCODING) as fileObj:
-            fileObj.write(generator(projectsInfo))
-
     def __findCiChanges(self, changeId):
         """
         Fetch a list of all the changes which shared this ID (from all the projects in the manifest)
 
         @param changeId Change ID shared between one or more changes across potentially multiple projects
-        @return a list of change JSON objects
+        @return (map of project -> CI change, map of remote name -> query duration in seconds) tuple
         """
 
         # Get a list of all the servers we're working with
-        tmpUniqueRemotes = []
-        remoteProjects = []
+        remoteProjects = {}
         for project in self._manifest.projects:
-            if project.remote not in tmpUniqueRemotes:
-                tmpUniqueRemotes.append(project.remote)
-                remoteProjects.append(project)
+            remoteProjects.setdefault(project.remote, project)
+
+        # Nothing to query (an empty thread pool can't be created either)
+        if not remoteProjects:
+            return {}, {}
+
+        def queryRemote(project):
+            startTime = time.time()
 
-        # Try to find changes with this ID on each of the servers
-        ciChangeCandidates = []
-        for project in remoteProjects:
             conn = self._connections[project]
 
-            changes = conn.query(self._ciChange)
+            # Include current patchsets, so that CI changes don't need to be resolved again later on
+            if isinstance(conn, ChangeEndpoint):
+                changes = conn.query(changeId, options=[QueryOption.CURRENT_REVISION])
+            else:
+                changes = conn.query(Connection.QUERY_ARG_CURRENT_PATCHSET, changeId)
 
             logger.debug(
                 "Fetched CI changes from project %r, %s"
                 % (project.name, [str(i) for i in changes])
             )
 
+            return changes, time.time() - startTime
+
+        # Try to find changes with this ID on all of the servers at once
+        with concurrent.futures.ThreadPoolExecutor(
+            max_workers=len(remoteProjects)
+        ) as executor:
+            futures = [
+                executor.submit(queryRemote, project)
+                for project in remoteProjects.values()
+            ]
+
+        ciChangeCandidates = []
+        timings = {}
+        for remote, future in zip(remoteProjects.keys(), futures):
+            changes, duration = future.result()
+
             ciChangeCandidates += changes
+            timings[remote.name] = duration
+
+        # Index the projects, so that candidates don't need to be compared against every project
+        projectIndex = {}
+        for project in self._manifest.projects:
+            projectIndex.setdefault((project.name, project.branch), []).append(project)
 
         # Filter out the changes that are either not part of our project list, or not on their respective branches
         result = {}
         for change in ciChangeCandidates:
-            for project in self._manifest.projects:
-                if (
-                    project.name == change.project
-                    and project.branch == change.branch
-                    and change.status
-                    not in [ChangeStatus.ABANDONED, ChangeStatus.MERGED]
-                ):
-                    result[project] = change
+            if change.status in [ChangeStatus.ABANDONED, ChangeStatus.MERGED]:
+                continue
+
+            for project in projectIndex.get((change.project, change.branch), []):
+                result[project] = change
 
-        return result
+        return result, timings
@@ -0,0 +1,95 @@
+import glob
+import logging
+import os
+import threading
+import time
+
+from du.Utils import loadJsonFile, saveJsonFile
+
+logger = logging.getLogger(__name__.split(".")[-1])
+
+
+class MaintenanceSchedule:
+    """
+    Keeps track of when git maintenance last ran on each repository, and decides which repositories are due.
+
+    A repository is due if it was never maintained, if it accumulated too many packs, or if its last maintenance
+    is older than the interval.
+    """
+
+    # Default number of seconds after which a repository is maintained again
+    DEFAULT_INTERVAL_SEC = 7 * 24 * 60 * 60
+
+    # Default number of packs after which a repository is maintained regardless of the interval
+    DEFAULT_MAX_PACKS = 10
+
+    # Last maintenance time key
+    KEY_TIME = "time"
+
+    def __init__(self, path, interval=DEFAULT_INTERVAL_SEC, maxPacks=DEFAULT_MAX_PACKS):
+        """
+        Constructor
+
+        @param path Schedule file path (does not need to exist)
+        @param interval Number of seconds after which a repository is maintained again
+        @param maxPacks Number of packs after which a repository is maintained regardless of the interval
+        """
+
+        self._path = path
+        self._interval = interval
+        self._maxPacks = maxPacks
+        self._lock = threading.Lock()
+
+        # Not critical, everything will just be maintained again if it can't be loaded
+        self._repositories = loadJsonFile(path, "maintenance schedule")
+
+    def isDue(self, objectsDir):
+        """
+        Check if a repository needs maintenance
+
+        @param objectsDir Object directory of the repository
+        @return True if maintenance should be run
+        """
+
+        with self._lock:
+            entry = self._repositories.get(objectsDir)
+
+        if not entry:
+            return True
+
+        if time.time() - entry[self.KEY_TIME] >= self._interval:
+            return True
+
+        numPacks = len(glob.glob(os.path.join(objectsDir, "pack", "*.pack")))
+
+        return numPacks >= self._maxPacks
+
+    def update(self, objectsDir):
+        """
+        Record a successful maintenance
+
+        @param objectsDir Object directory of the repository
+        """
+
+        with self._lock:
+            self._repositories[objectsDir] = {self.KEY_TIME: time.time()}
+
+    def save(self):
+        """
+        Store the schedule to disk. The schedule of shared repositories (e.g. mirrors) is shared by multiple builds,
+        so repositories maintained by others since it was loaded are kept
+        """
+
+        with self._lock:
+            repositories = loadJsonFile(self._path, "maintenance schedule")
+
+            for objectsDir, entry in self._repositories.items():
+                if (
+                    objectsDir not in repositories
+                    or repositories[objectsDir][self.KEY_TIME] < entry[self.KEY_TIME]
+                ):
+                    repositories[objectsDir] = entry
+
+            self._repositories = repositories
+
+            saveJsonFile(self._path, self._repositories)
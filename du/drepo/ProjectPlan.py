@@ -0,0 +1,78 @@
+from collections import namedtuple
+
+
+class ChangeDownload(
+    namedtuple(
+        "ChangeDownload", "change, ref, downloadType, committer", defaults=[None]
+    )
+):
+    """
+    Change to be applied on top of a project base
+
+    @param change Change number or Change-ID, as defined in the manifest
+    @param ref Resolved patchset reference (e.g. refs/changes/45/12345/2)
+    @param downloadType How the change is applied (see Commands.DownloadType)
+    @param committer Committer (name, email, date) a cherry-pick is recorded with, so that it reproduces the same
+        commit (None to use the current identity & time)
+    """
+
+    pass
+
+
+class ProjectAction(
+    namedtuple("ProjectAction", "action, reason, estimatedSize, estimatedDuration")
+):
+    """
+    What a sync is going to do with a single project
+
+    @param action One of SyncPlan.ACTIONS
+    @param reason Optional human readable reason of the action (None if obvious)
+    @param estimatedSize Estimated number of bytes the project needs to receive (None if unknown)
+    @param estimatedDuration Estimated sync duration in seconds, based on the previous syncs (None if unknown)
+    """
+
+    pass
+
+
+class ProjectPlan(
+    namedtuple(
+        "ProjectPlan",
+        "project, path, baseRef, baseBranch, changes, fetchDepth, clean, cloneFilter, sparsePaths, headHash",
+        defaults=[None],
+    )
+):
+    """
+    Everything needed to synchronize a single project
+
+    @param project Manifest project
+    @param path Absolute project path on disk
+    @param baseRef Remote reference used as a base (branch, tag or a change patchset)
+    @param baseBranch Branch which should be checked out on top of the base (None if the base is detached)
+    @param changes List of ChangeDownload objects, applied in order on top of the base
+    @param fetchDepth Git history fetch depth (None for entire history)
+    @param clean Indication if the project should be cleaned
+    @param cloneFilter Partial clone filter (None to fetch all the objects)
+    @param sparsePaths List of paths to be checked out (None to check out the entire tree)
+    @param headHash Expected HEAD hash, if the plan comes from a lock file (None otherwise)
+    """
+
+    def inputs(self):
+        """
+        Serializable representation of the plan, used to detect if anything changed between two syncs
+
+        @return dictionary
+        """
+
+        return {
+            "remoteUrl": self.project.remoteUrl,
+            "baseRef": self.baseRef,
+            "baseBranch": self.baseBranch,
+            "changes": [
+                [change.ref, change.downloadType.value] for change in self.changes
+            ],
+            "fetchDepth": self.fetchDepth,
+            "clean": self.clean,
+            "cloneFilter": self.cloneFilter,
+            "sparsePaths": self.sparsePaths,
+            "headHash": self.headHash,
+        }
@@ -0,0 +1,83 @@
+from collections import namedtuple
+
+from du.drepo.Utils import Utils
+
+
+class ProjectStatus(
+    namedtuple(
+        "ProjectStatus",
+        "name, path, exists, head, branch, numChanged, numUntracked, numAhead, numChanges, synced",
+    )
+):
+    """
+    Local workspace status of a single project
+
+    @param name Project name
+    @param path Project path (relative to the build root)
+    @param exists Indication if the project is a valid git repository
+    @param head HEAD hash (None if the project doesn't exist, or has no commits)
+    @param branch Checked out branch (None if HEAD is detached)
+    @param numChanged Number of changed (staged, unstaged or unmerged) files
+    @param numUntracked Number of untracked files
+    @param numAhead Number of commits HEAD is ahead of the base it was synced to (None if unknown)
+    @param numChanges Number of changes applied on top of the base by the last sync (None if unknown)
+    @param synced Indication if HEAD is still where the last sync left it
+    """
+
+    # Table column titles
+    TABLE_HEADER = [
+        "PROJECT",
+        "BRANCH",
+        "HEAD",
+        "CHANGED",
+        "UNTRACKED",
+        "AHEAD",
+        "SYNCED",
+    ]
+
+    @property
+    def dirty(self):
+        """
+        Indication if the project has local modifications
+        """
+
+        return self.numChanged > 0
+
+    def toDict(self):
+        """
+        Serializable representation of the status
+
+        @return dictionary
+        """
+
+        return dict(self._asdict(), dirty=self.dirty)
+
+    @classmethod
+    def formatTable(cls, statuses):
+        """
+        Format a compact, aligned table of multiple project statuses
+
+        @param statuses List of ProjectStatus objects
+        @return table string
+        """
+
+        rows = [cls.TABLE_HEADER]
+
+        for status in statuses:
+            if not status.exists:
+                rows.append([status.path, "-", "missing", "-", "-", "-", "-"])
+                continue
+
+            rows.append(
+                [
+                    status.path,
+                    status.branch if status.branch else "(detached)",
+                    status.head[:12] if status.head else "-",
+                    str(status.numChanged),
+                    str(status.numUntracked),
+                    str(status.numAhead) if status.numAhead is not None else "?",
+                    "yes" if status.synced else "no",
+                ]
+            )
+
+        return Utils.formatTable(rows)
@@ -0,0 +1,83 @@
+import fcntl
+import logging
+import os
+import threading
+
+from du.Utils import makeDirTree
+
+logger = logging.getLogger(__name__.split(".")[-1])
+
+
+class RepositoryLock:
+    """
+    Lock serializing modifications of a shared repository (e.g. mirror), both between the threads of a process and
+    between processes (e.g. multiple builds and the prefetch daemon sharing the same cache directory).
+
+    The inter-process part is an advisory lock of a file next to the repository, released by the OS if the process
+    dies while holding it. The lock is reentrant (the thread holding it may acquire it again).
+    """
+
+    # Suffix of the lock file, placed next to the repository
+    LOCK_FILE_SUFFIX = ".drepo-lock"
+
+    def __init__(self, path):
+        """
+        Constructor
+
+        @param path Repository path
+        """
+
+        self._lockFilePath = path.rstrip(os.sep) + self.LOCK_FILE_SUFFIX
+
+        # File locks are held per open file, so threads of the same process are serialized separately
+        self._lock = threading.RLock()
+
+        # Number of times the lock is held by the owning thread
+        self._depth = 0
+
+        self._fileObj = None
+
+    def __enter__(self):
+        self._lock.acquire()
+
+        if self._depth:
+            self._depth += 1
+            return self
+
+        try:
+            makeDirTree(os.path.dirname(self._lockFilePath))
+
+            fileObj = open(self._lockFilePath, "a")
+
+            try:
+                try:
+                    fcntl.flock(fileObj, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    logger.info("waiting for lock %r .." % self._lockFilePath)
+
+                    fcntl.flock(fileObj, fcntl.LOCK_EX)
+            except BaseException:
+                fileObj.close()
+                raise
+
+            self._fileObj = fileObj
+            self._depth = 1
+        except BaseException:
+            self._lock.release()
+            raise
+
+        return self
+
+    def __exit__(self, *args):
+        self._depth -= 1
+
+        if self._depth:
+            self._lock.release()
+            return
+
+        try:
+            fcntl.flock(self._fileObj, fcntl.LOCK_UN)
+            self._fileObj.close()
+        finally:
+            self._fileObj = None
+            self._lock.release()
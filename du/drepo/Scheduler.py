@@ -0,0 +1,94 @@
+import logging
+import threading
+
+logger = logging.getLogger(__name__.split(".")[-1])
+
+
+class Scheduler:
+    """
+    Thread-safe project scheduler.
+
+    Projects are handed out largest (estimated) cost first, so that the expensive projects don't end up being the
+    tail of the sync. Optionally limits the number of projects processed concurrently per remote.
+    """
+
+    def __init__(self, projects, history, maxPerRemote=None):
+        """
+        Constructor
+
+        @param projects List of projects to schedule
+        @param history SyncHistory used for cost estimation
+        @param maxPerRemote Maximum number of concurrently processed projects per remote (None for no limit)
+        """
+
+        self._maxPerRemote = maxPerRemote
+        self._condition = threading.Condition()
+
+        # Number of projects currently being processed per remote
+        self._active = {}
+
+        # Projects without history are considered at least as expensive as the most expensive known one, since
+        # they're most likely being cloned from scratch
+        estimates = [history.estimate(project) for project in projects]
+        knownEstimates = [i for i in estimates if i is not None]
+        defaultEstimate = max(knownEstimates) if knownEstimates else 0
+
+        costs = {
+            project: estimate if estimate is not None else defaultEstimate
+            for project, estimate in zip(projects, estimates)
+        }
+
+        # Stable sort, so projects of equal cost retain the manifest order
+        self._pending = sorted(projects, key=lambda project: -costs[project])
+
+        logger.debug(
+            "scheduled order: %s"
+            % ", ".join("%s (%.1fs)" % (i.name, costs[i]) for i in self._pending)
+        )
+
+    def acquire(self):
+        """
+        Take the next project to process. Blocks while all the remaining projects belong to saturated remotes
+
+        @return project, or None if there's nothing left to process
+        """
+
+        with self._condition:
+            while self._pending:
+                for index, project in enumerate(self._pending):
+                    if self.__canStart(project):
+                        del self._pending[index]
+
+                        remoteName = project.remote.name
+                        self._active[remoteName] = self._active.get(remoteName, 0) + 1
+
+                        return project
+
+                # Wait for one of the active projects to finish
+                self._condition.wait()
+
+            return None
+
+    def release(self, project):
+        """
+        Mark a project (previously acquired) as done
+
+        @param project Project
+        """
+
+        with self._condition:
+            self._active[project.remote.name] -= 1
+
+            self._condition.notify_all()
+
+    def __canStart(self, project):
+        """
+        Check if the project's remote has a free slot
+
+        @param project Project
+        """
+
+        if not self._maxPerRemote:
+            return True
+
+        return self._active.get(project.remote.name, 0) < self._maxPerRemote
@@ -0,0 +1,78 @@
+import logging
+import threading
+
+from du.Utils import loadJsonFile, saveJsonFile
+
+logger = logging.getLogger(__name__.split(".")[-1])
+
+
+class SyncHistory:
+    """
+    Persisted history of per-project sync measurements (durations, fetched sizes), used to estimate how expensive a
+    project is to sync
+    """
+
+    # Weight of the latest measurement when updating the estimate
+    SMOOTHING_FACTOR = 0.5
+
+    def __init__(self, path):
+        """
+        Constructor
+
+        @param path History file path (does not need to exist)
+        """
+
+        self._path = path
+        self._lock = threading.Lock()
+
+        # Not critical, we'll just start from scratch if it can't be loaded
+        self._durations = loadJsonFile(path, "sync history")
+
+    @staticmethod
+    def key(project):
+        """
+        History key of a project
+
+        @param project Manifest project
+        """
+
+        return project.name + ":" + project.path
+
+    def estimate(self, project):
+        """
+        Get estimated sync duration (or size) of a project
+
+        @param project Manifest project
+        @return duration in seconds (or size in bytes), or None if unknown
+        """
+
+        return self._durations.get(self.key(project))
+
+    def update(self, project, duration):
+        """
+        Record a sync duration (or size)
+
+        @param project Manifest project
+        @param duration Duration in seconds (or size in bytes)
+        """
+
+        key = self.key(project)
+
+        with self._lock:
+            previous = self._durations.get(key)
+
+            if previous is None:
+                self._durations[key] = duration
+            else:
+                self._durations[key] = (
+                    self.SMOOTHING_FACTOR * duration
+                    + (1 - self.SMOOTHING_FACTOR) * previous
+                )
+
+    def save(self):
+        """
+        Store the history to disk
+        """
+
+        with self._lock:
+            saveJsonFile(self._path, self._durations)
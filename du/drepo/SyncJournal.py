@@ -0,0 +1,158 @@
+import json
+import logging
+import os
+import threading
+
+from du.Utils import makeDirTree
+
+logger = logging.getLogger(__name__.split(".")[-1])
+
+
+class SyncJournal:
+    """
+    Append-only journal of completed project sync steps, used to resume an interrupted sync.
+
+    Each line is a JSON object describing a single step of a single project, so that a sync which dies half-way
+    leaves a valid journal behind (except maybe for the last, partially written line).
+    """
+
+    # Git directory prepared (initialized, reset, cleaned)
+    STEP_PREPARED = "prepared"
+
+    # Base & changes fetched into local refs
+    STEP_FETCHED = "fetched"
+
+    # Base checked out and changes applied (project done)
+    STEP_APPLIED = "applied"
+
+    # Steps, in order of execution
+    STEPS = [STEP_PREPARED, STEP_FETCHED, STEP_APPLIED]
+
+    # Project path key
+    KEY_PATH = "path"
+
+    # Step key
+    KEY_STEP = "step"
+
+    # Project inputs key
+    KEY_INPUTS = "inputs"
+
+    # Head hash key (only present for the applied step)
+    KEY_HEAD_HASH = "headHash"
+
+    def __init__(self, path, resume=False, readOnly=False):
+        """
+        Constructor
+
+        @param path Journal file path (does not need to exist)
+        @param resume If True the existing journal is loaded, otherwise it's discarded
+        @param readOnly If True the journal file is left untouched (nothing can be recorded), e.g. for planning
+        """
+
+        self._path = path
+        self._lock = threading.Lock()
+
+        # Project path -> last recorded entry
+        self._entries = {}
+
+        if resume:
+            self.__load()
+
+        self._fileObj = None
+
+        if readOnly:
+            return
+
+        makeDirTree(os.path.dirname(path))
+
+        # Start a fresh journal, which only contains the loaded entries (drops possible corrupted lines)
+        self._fileObj = open(path, "w")
+
+        for entry in self._entries.values():
+            self.__write(entry)
+
+    def lastStep(self, plan):
+        """
+        Get the last step a project completed with exactly the same inputs
+
+        @param plan Project plan
+        @return (step, entry) pair, or (None, None) if nothing usable was recorded
+        """
+
+        with self._lock:
+            entry = self._entries.get(plan.project.path)
+
+        if not entry or entry[self.KEY_INPUTS] != plan.inputs():
+            return None, None
+
+        return entry[self.KEY_STEP], entry
+
+    def record(self, plan, step, headHash=None):
+        """
+        Record a completed step
+
+        @param plan Project plan
+        @param step One of SyncJournal.STEPS
+        @param headHash Resulting HEAD hash (applied step only)
+        """
+
+        if not self._fileObj:
+            raise RuntimeError("Sync journal %r opened read-only" % self._path)
+
+        entry = {
+            self.KEY_PATH: plan.project.path,
+            self.KEY_STEP: step,
+            self.KEY_INPUTS: plan.inputs(),
+        }
+
+        if headHash:
+            entry[self.KEY_HEAD_HASH] = headHash
+
+        with self._lock:
+            self._entries[plan.project.path] = entry
+
+            self.__write(entry)
+
+    def close(self):
+        """
+        Close the journal file
+        """
+
+        with self._lock:
+            if self._fileObj:
+                self._fileObj.close()
+
+    def __write(self, entry):
+        """
+        Append an entry to the journal file
+
+        @param entry Entry dictionary
+        """
+
+        # Flush every line, since the whole point of the journal is surviving an interrupted sync
+        self._fileObj.write(json.dumps(entry, sort_keys=True) + "\n")
+        self._fileObj.flush()
+
+    def __load(self):
+        """
+        Load the existing journal entries
+        """
+
+        if not os.path.isfile(self._path):
+            logger.warning("no sync journal found at %r" % self._path)
+            return
+
+        with open(self._path, "r") as fileObj:
+            for line in fileObj:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # Sync was most likely interrupted while writing this line
+                    logger.warning("ignoring corrupted journal line %r" % line)
+                    continue
+
+                self._entries[entry[self.KEY_PATH]] = entry
+
+        logger.debug(
+            "loaded %d journal entries from %r" % (len(self._entries), self._path)
+        )
@@ -0,0 +1,166 @@
+import json
+import logging
+import os
+
+from du.Utils import makeDirTree
+
+logger = logging.getLogger(__name__.split(".")[-1])
+
+
+class SyncLock:
+    """
+    Snapshot of a synced build: exact base, change and resulting HEAD commit hashes of each project.
+
+    A build synced from a lock file doesn't need any Gerrit queries, since all the changes are pinned to hashes.
+    """
+
+    # Build name key
+    KEY_BUILD = "build"
+
+    # Projects key
+    KEY_PROJECTS = "projects"
+
+    # Project name key
+    KEY_NAME = "name"
+
+    # Project path key
+    KEY_PATH = "path"
+
+    # Project remote URL key
+    KEY_REMOTE_URL = "remoteUrl"
+
+    # Base reference key (as resolved during the sync)
+    KEY_BASE_REF = "baseRef"
+
+    # Base branch key
+    KEY_BASE_BRANCH = "baseBranch"
+
+    # Base hash key
+    KEY_BASE_HASH = "baseHash"
+
+    # Changes key
+    KEY_CHANGES = "changes"
+
+    # Change number/ID key
+    KEY_CHANGE = "change"
+
+    # Change patchset reference key
+    KEY_REF = "ref"
+
+    # Change hash key
+    KEY_HASH = "hash"
+
+    # Change download type key
+    KEY_DOWNLOAD_TYPE = "downloadType"
+
+    # Change committer key ([name, email, date] of a cherry-picked commit, see ChangeDownload.committer)
+    KEY_COMMITTER = "committer"
+
+    # Resulting HEAD hash key
+    KEY_HEAD_HASH = "headHash"
+
+    def __init__(self, buildName, projects=None):
+        """
+        Constructor
+
+        @param buildName Name of the build this lock was created from
+        @param projects Map of project path -> project entry
+        """
+
+        self._buildName = buildName
+        self._projects = projects if projects else {}
+
+    @classmethod
+    def load(cls, path):
+        """
+        Load a lock file
+
+        @param path Lock file path
+        @return SyncLock
+        """
+
+        try:
+            with open(path, "r") as fileObj:
+                content = json.load(fileObj)
+
+            return cls(content[cls.KEY_BUILD], content[cls.KEY_PROJECTS])
+        except (ValueError, KeyError, OSError) as e:
+            raise RuntimeError("Invalid lock file %r: %s" % (path, str(e)))
+
+    @property
+    def buildName(self):
+        """
+        Name of the build this lock was created from
+        """
+
+        return self._buildName
+
+    def get(self, project):
+        """
+        Get the locked state of a project
+
+        @param project Manifest project
+        @return project entry dictionary, or None if the project is not locked
+        """
+
+        return self._projects.get(project.path)
+
+    def add(self, plan, baseHash, headHash, changeHashes, changeCommitters=[]):
+        """
+        Lock a project
+
+        @param plan Plan the project was synced with
+        @param baseHash Hash of the base the project was synced to
+        @param headHash Resulting HEAD hash
+        @param changeHashes Hashes of the applied changes (same order as plan.changes)
+        @param changeCommitters Committers of the applied changes (same order as plan.changes), needed to reproduce
+            cherry-picked commits
+        """
+
+        # Missing if synced by a version which didn't record them
+        changeCommitters = list(changeCommitters) + [None] * (
+            len(plan.changes) - len(changeCommitters)
+        )
+
+        self._projects[plan.project.path] = {
+            self.KEY_NAME: plan.project.name,
+            self.KEY_PATH: plan.project.path,
+            self.KEY_REMOTE_URL: plan.project.remoteUrl,
+            self.KEY_BASE_REF: plan.baseRef,
+            self.KEY_BASE_BRANCH: plan.baseBranch,
+            self.KEY_BASE_HASH: baseHash,
+            self.KEY_CHANGES: [
+                {
+                    self.KEY_CHANGE: change.change,
+                    self.KEY_REF: change.ref,
+                    self.KEY_HASH: changeHash,
+                    self.KEY_DOWNLOAD_TYPE: change.downloadType.value,
+                    self.KEY_COMMITTER: committer,
+                }
+                for change, changeHash, committer in zip(
+                    plan.changes, changeHashes, changeCommitters
+                )
+            ],
+            self.KEY_HEAD_HASH: headHash,
+        }
+
+    def save(self, path):
+        """
+        Store the lock file
+
+        @param path Lock file path
+        """
+
+        logger.info("writing lock file %r" % path)
+
+        dirName = os.path.dirname(path)
+        if dirName:
+            makeDirTree(dirName)
+
+        with open(path, "w") as fileObj:
+            json.dump(
+                {self.KEY_BUILD: self._buildName, self.KEY_PROJECTS: self._projects},
+                fileObj,
+                indent=4,
+                sort_keys=True,
+            )
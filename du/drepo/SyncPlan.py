@@ -0,0 +1,191 @@
+from du.drepo.Utils import Utils
+
+
+class SyncPlan:
+    """
+    Everything a sync is going to do, resolved up front (changes, refs, local state) without modifying anything.
+
+    The sync executes exactly this plan, so a plan printed by a dry run matches what the sync would have done at
+    that point in time.
+    """
+
+    # Nothing to do (project is up to date, or was completed by an interrupted sync)
+    ACTION_SKIP = "no-op"
+
+    # Everything needed is available locally, project is only checked out
+    ACTION_CHECKOUT = "checkout"
+
+    # Existing repository, only new objects are fetched
+    ACTION_FAST_FORWARD = "fast-forward"
+
+    # Repository doesn't exist yet, so the entire (possibly shallow/filtered) history is fetched
+    ACTION_FULL_FETCH = "full fetch"
+
+    # All actions
+    ACTIONS = [ACTION_SKIP, ACTION_CHECKOUT, ACTION_FAST_FORWARD, ACTION_FULL_FETCH]
+
+    # Table column titles
+    TABLE_HEADER = ["PROJECT", "ACTION", "BASE", "CHANGES", "SIZE", "DURATION"]
+
+    def __init__(self, buildName, buildRoot, plans, actions, ciTimings=None):
+        """
+        Constructor
+
+        @param buildName Name of the planned build
+        @param buildRoot Build root the projects are synced to
+        @param plans Map of manifest project -> ProjectPlan (sync order)
+        @param actions Map of manifest project -> ProjectAction
+        @param ciTimings Map of remote name -> CI query duration in seconds
+        """
+
+        self._buildName = buildName
+        self._buildRoot = buildRoot
+        self._plans = plans
+        self._actions = actions
+        self._ciTimings = ciTimings if ciTimings else {}
+
+    @property
+    def buildName(self):
+        """
+        Name of the planned build
+        """
+
+        return self._buildName
+
+    @property
+    def buildRoot(self):
+        """
+        Build root the projects are synced to
+        """
+
+        return self._buildRoot
+
+    @property
+    def plans(self):
+        """
+        Map of manifest project -> ProjectPlan
+        """
+
+        return self._plans
+
+    @property
+    def ciTimings(self):
+        """
+        Map of remote name -> CI query duration in seconds
+        """
+
+        return self._ciTimings
+
+    @property
+    def projectsToProcess(self):
+        """
+        Projects which actually need to be synced (sync order)
+        """
+
+        return [
+            project
+            for project in self._plans
+            if self._actions[project].action != self.ACTION_SKIP
+        ]
+
+    def getAction(self, project):
+        """
+        Get the planned action of a project
+
+        @param project Manifest project
+        @return ProjectAction
+        """
+
+        return self._actions[project]
+
+    def formatTable(self):
+        """
+        Format a compact, aligned table of the planned project actions, followed by a totals line
+
+        @return table string
+        """
+
+        rows = [self.TABLE_HEADER]
+
+        # Action -> number of projects
+        numActions = {}
+        totalSize = 0
+        totalDuration = 0
+        numUnknownSizes = 0
+
+        for project, plan in self._plans.items():
+            action = self._actions[project]
+
+            numActions[action.action] = numActions.get(action.action, 0) + 1
+
+            if action.estimatedSize is None:
+                numUnknownSizes += 1
+            else:
+                totalSize += action.estimatedSize
+
+            if action.action != self.ACTION_SKIP and action.estimatedDuration:
+                totalDuration += action.estimatedDuration
+
+            # Download type -> number of changes
+            numChanges = {}
+            for change in plan.changes:
+                name = change.downloadType.name.lower()
+                numChanges[name] = numChanges.get(name, 0) + 1
+
+            rows.append(
+                [
+                    project.path,
+                    action.action + (" (%s)" % action.reason if action.reason else ""),
+                    plan.baseRef,
+                    ", ".join("%d %s" % (n, name) for name, n in numChanges.items())
+                    or "-",
+                    self.formatSize(action.estimatedSize),
+                    (
+                        "%.1fs" % action.estimatedDuration
+                        if action.estimatedDuration is not None
+                        else "?"
+                    ),
+                ]
+            )
+
+        lines = [Utils.formatTable(rows)]
+
+        lines.append(
+            "%d project(s): %s; estimated size %s%s, estimated duration %.1fs (sequential)"
+            % (
+                len(self._plans),
+                ", ".join(
+                    "%d %s" % (numActions[action], action)
+                    for action in self.ACTIONS
+                    if action in numActions
+                ),
+                self.formatSize(totalSize),
+                " + %d unknown" % numUnknownSizes if numUnknownSizes else "",
+                totalDuration,
+            )
+        )
+
+        return "\n".join(lines)
+
+    @staticmethod
+    def formatSize(size):
+        """
+        Format a human readable size
+
+        @param size Size in bytes (None if unknown)
+        @return size string
+        """
+
+        if size is None:
+            return "?"
+
+        if size < 1024:
+            return "%dB" % size
+
+        for unit in ["KiB", "MiB"]:
+            size /= 1024.0
+
+            if size < 1024:
+                return "%.1f%s" % (size, unit)
+
+        return "%.1fGiB" % (size / 1024.0)
@@ -0,0 +1,100 @@
+import logging
+import threading
+
+from du.Utils import loadJsonFile, saveJsonFile
+
+logger = logging.getLogger(__name__.split(".")[-1])
+
+
+class SyncState:
+    """
+    Persisted state of the last successful sync of each project (inputs it was synced with, and the resulting hashes)
+    """
+
+    # Project inputs key
+    KEY_INPUTS = "inputs"
+
+    # Base hash key
+    KEY_BASE_HASH = "baseHash"
+
+    # Head hash key
+    KEY_HEAD_HASH = "headHash"
+
+    # Change hashes key
+    KEY_CHANGE_HASHES = "changeHashes"
+
+    # Change committers key
+    KEY_CHANGE_COMMITTERS = "changeCommitters"
+
+    def __init__(self, path):
+        """
+        Constructor
+
+        @param path State file path (does not need to exist)
+        """
+
+        self._path = path
+        self._lock = threading.Lock()
+
+        # Not critical, everything will just get synced again if it can't be loaded
+        self._projects = loadJsonFile(path, "sync state")
+
+    def get(self, plan):
+        """
+        Get recorded state of a project
+
+        @param plan Project plan
+        @return state dictionary, or None if the project wasn't synced before
+        """
+
+        return self.getProject(plan.project)
+
+    def getProject(self, project):
+        """
+        Get recorded state of a project, regardless of the inputs it was synced with
+
+        @param project Manifest project
+        @return state dictionary, or None if the project wasn't synced before
+        """
+
+        with self._lock:
+            return self._projects.get(project.path)
+
+    def update(self, plan, baseHash, headHash, changeHashes=[], changeCommitters=[]):
+        """
+        Record a successful project sync
+
+        @param plan Project plan the project was synced with
+        @param baseHash Hash of the base the project was synced to
+        @param headHash Resulting HEAD hash
+        @param changeHashes Hashes of the applied changes (same order as plan.changes)
+        @param changeCommitters Committers of the commits created by applying the changes (see
+            ChangeDownload.committer, same order as plan.changes)
+        """
+
+        with self._lock:
+            self._projects[plan.project.path] = {
+                self.KEY_INPUTS: plan.inputs(),
+                self.KEY_BASE_HASH: baseHash,
+                self.KEY_HEAD_HASH: headHash,
+                self.KEY_CHANGE_HASHES: changeHashes,
+                self.KEY_CHANGE_COMMITTERS: changeCommitters,
+            }
+
+    def invalidate(self, plan):
+        """
+        Forget the recorded state of a project (e.g. before it gets synced)
+
+        @param plan Project plan
+        """
+
+        with self._lock:
+            self._projects.pop(plan.project.path, None)
+
+    def save(self):
+        """
+        Store the state to disk
+        """
+
+        with self._lock:
+            saveJsonFile(self._path, self._projects)
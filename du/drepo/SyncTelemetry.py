@@ -0,0 +1,181 @@
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from du.Utils import makeDirTree
+from du.drepo.Utils import Utils
+
+logger = logging.getLogger(__name__.split(".")[-1])
+
+
+class SyncTelemetry:
+    """
+    Thread-safe recorder of sync phase timings, either per project or global (e.g. Gerrit queries)
+    """
+
+    # Project phases
+    PHASE_MIRROR = "mirror"
+    PHASE_PREPARE = "prepare"
+    PHASE_FETCH = "fetch"
+    PHASE_CHECKOUT = "checkout"
+    PHASE_APPLY = "apply"
+    PHASE_STATE = "state"
+
+    # Project phases, in order of execution
+    PROJECT_PHASES = [
+        PHASE_MIRROR,
+        PHASE_PREPARE,
+        PHASE_FETCH,
+        PHASE_CHECKOUT,
+        PHASE_APPLY,
+        PHASE_STATE,
+    ]
+
+    # Record keys
+    KEY_PROJECT = "project"
+    KEY_PATH = "path"
+    KEY_PHASE = "phase"
+    KEY_START = "start"
+    KEY_DURATION = "duration"
+
+    def __init__(self):
+        """
+        Constructor
+        """
+
+        self._lock = threading.Lock()
+        self._records = []
+
+    @contextmanager
+    def measure(self, project, phase):
+        """
+        Context measuring the duration of a phase
+
+        @param project Manifest project (None for global phases)
+        @param phase Phase name
+        """
+
+        startTime = time.time()
+
+        try:
+            yield
+        finally:
+            self.record(project, phase, startTime, time.time() - startTime)
+
+    def record(self, project, phase, startTime, duration):
+        """
+        Record a phase duration
+
+        @param project Manifest project (None for global phases)
+        @param phase Phase name
+        @param startTime Phase start timestamp
+        @param duration Phase duration in seconds
+        """
+
+        record = {
+            self.KEY_PROJECT: project.name if project else None,
+            self.KEY_PATH: project.path if project else None,
+            self.KEY_PHASE: phase,
+            self.KEY_START: startTime,
+            self.KEY_DURATION: duration,
+        }
+
+        with self._lock:
+            self._records.append(record)
+
+    def getGlobalTimings(self):
+        """
+        Get durations of the global phases
+
+        @return map of phase name -> total duration in seconds (order of recording)
+        """
+
+        timings = {}
+
+        with self._lock:
+            for record in self._records:
+                if record[self.KEY_PATH] is None:
+                    timings[record[self.KEY_PHASE]] = (
+                        timings.get(record[self.KEY_PHASE], 0)
+                        + record[self.KEY_DURATION]
+                    )
+
+        return timings
+
+    def save(self, path):
+        """
+        Store all the records as JSON lines (one record per line)
+
+        @param path File path
+        """
+
+        logger.info("writing telemetry %r" % path)
+
+        dirName = os.path.dirname(path)
+        if dirName:
+            makeDirTree(dirName)
+
+        with self._lock:
+            with open(path, "w") as fileObj:
+                for record in self._records:
+                    fileObj.write(json.dumps(record, sort_keys=True) + "\n")
+
+    def formatTopTable(self, numEntries):
+        """
+        Format tables of the slowest projects (with a per-phase breakdown) and the slowest single phases
+
+        @param numEntries Number of entries in each table
+        @return tables string
+        """
+
+        # Project path -> phase -> duration
+        projects = {}
+
+        with self._lock:
+            projectRecords = [i for i in self._records if i[self.KEY_PATH] is not None]
+
+        for record in projectRecords:
+            phases = projects.setdefault(record[self.KEY_PATH], {})
+            phases[record[self.KEY_PHASE]] = (
+                phases.get(record[self.KEY_PHASE], 0) + record[self.KEY_DURATION]
+            )
+
+        slowestProjects = sorted(
+            projects.items(), key=lambda i: sum(i[1].values()), reverse=True
+        )[:numEntries]
+
+        projectRows = [["PROJECT", "TOTAL"] + self.PROJECT_PHASES]
+        for path, phases in slowestProjects:
+            projectRows.append(
+                [path, "%.2fs" % sum(phases.values())]
+                + [
+                    "%.2fs" % phases[phase] if phase in phases else "-"
+                    for phase in self.PROJECT_PHASES
+                ]
+            )
+
+        slowestPhases = sorted(
+            projectRecords, key=lambda i: i[self.KEY_DURATION], reverse=True
+        )[:numEntries]
+
+        phaseRows = [["PROJECT", "PHASE", "DURATION"]]
+        for record in slowestPhases:
+            phaseRows.append(
+                [
+                    record[self.KEY_PATH],
+                    record[self.KEY_PHASE],
+                    "%.2fs" % record[self.KEY_DURATION],
+                ]
+            )
+
+        return "\n".join(
+            [
+                "slowest projects:",
+                Utils.formatTable(projectRows),
+                "slowest phases:",
+                Utils.formatTable(phaseRows),
+            ]
+        )
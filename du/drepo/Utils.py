@@ -18,17 +18,18 @@ class Utils:
     """
 
     @staticmethod
-    def createQueryConnection(remote, httpCredentials):
+    def createQueryConnection(remote, httpCredentials, connectionManager=None):
         """
         Create a query connection (HTTP or SSH) based on what's available in the given remote
 
         @param remote Remote
         @param httpCredentials A map of HTTP credentials
+        @param connectionManager Optional SSH connection manager, used to multiplex SSH connections
         """
 
         if remote.ssh:
             # Prioritize SSH if available
-            return Connection(remote.ssh)
+            return Connection(remote.ssh, connectionManager)
 
         elif remote.http:
             hostName = urlparse(remote.http).hostname
@@ -94,3 +95,19 @@ class Utils:
             url = url._replace(netloc=encodedNetloc)
 
         return urlunparse(url)
+
+    @staticmethod
+    def formatTable(rows):
+        """
+        Format a compact table, with the columns aligned
+
+        @param rows List of rows (lists of strings), first one being the header
+        @return table string
+        """
+
+        widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+
+        return "\n".join(
+            "  ".join(cell.ljust(width) for cell, width in zip(row, widths)).rstrip()
+            for row in rows
+        )
@@ -13,6 +13,7 @@ from collections import namedtuple
 
 import sys
 import os
+import re
 
 
 class Parser:
@@ -53,6 +54,15 @@ class Parser:
     # Project options attribute name
     KEY_OPTS = "opts"
 
+    # Project partial clone filter attribute name
+    KEY_CLONE_FILTER = "clone_filter"
+
+    # Project sparse checkout paths attribute name
+    KEY_SPARSE_PATHS = "sparse_paths"
+
+    # Regex which matches supported partial clone filters
+    CLONE_FILTER_REGEX = re.compile(r"^(blob:none|blob:limit=\d+[kmg]?|tree:\d+)$")
+
     # Root path attribute name
     KEY_ROOT = "root"
 
@@ -326,4 +336,25 @@ class Parser:
         except ManifestFieldMissingError:
             pass
 
-        return Project(name, projectRemote, path, branch, opts)
+        # Partial clone filter
+        cloneFilter = None
+        try:
+            cloneFilter = rawProject.getStr(cls.KEY_CLONE_FILTER)
+        except ManifestFieldMissingError:
+            pass
+
+        if cloneFilter and not cls.CLONE_FILTER_REGEX.match(cloneFilter):
+            raise ManifestParseError(
+                "Unsupported clone filter %r for project %r" % (cloneFilter, name)
+            )
+
+        # Sparse checkout paths
+        sparsePaths = None
+        try:
+            sparsePaths = rawProject.getList(cls.KEY_SPARSE_PATHS, str)
+        except ManifestFieldMissingError:
+            pass
+
+        return Project(
+            name, projectRemote, path, branch, opts, cloneFilter, sparsePaths
+        )
@@ -5,7 +5,9 @@ class Project:
     TODO: Branch should be moved to the Build class
     """
 
-    def __init__(self, name, remote, path, branch, opts):
+    def __init__(
+        self, name, remote, path, branch, opts, cloneFilter=None, sparsePaths=None
+    ):
         """
         Constructor
 
@@ -14,6 +16,8 @@ class Project:
         @param path See Project.path
         @param branch See Project.branch
         @param opts See Project.opts
+        @param cloneFilter See Project.cloneFilter
+        @param sparsePaths See Project.sparsePaths
         """
 
         self._name = name
@@ -21,6 +25,8 @@ class Project:
         self._path = path
         self._branch = branch
         self._opts = opts
+        self._cloneFilter = cloneFilter
+        self._sparsePaths = sparsePaths
 
     @property
     def name(self):
@@ -63,3 +69,17 @@ class Project:
         Project options list
         """
         return self._opts
+
+    @property
+    def cloneFilter(self):
+        """
+        Partial clone filter (e.g. blob:none, tree:0), or None if the entire history is needed
+        """
+        return self._cloneFilter
+
+    @property
+    def sparsePaths(self):
+        """
+        List of (directory) paths to be checked out, or None if the entire tree is needed
+        """
+        return self._sparsePaths
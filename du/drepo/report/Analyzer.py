@@ -1,30 +1,55 @@
+import itertools
 import logging
 import os
+import re
 from collections import namedtuple
-import threading
+from contextlib import closing, ExitStack
 
 from du.gerrit.Utils import Utils as GerritUtils
-from du.utils.ShellCommand import ShellCommand, CommandFailedException
+from du.utils.ShellCommand import ShellCommand
 from du.gerrit.rest.change.ChangeEndpoint import ChangeEndpoint
 from du.gerrit.ssh.Connection import Connection
 from du.gerrit.ssh.Change import Change
-from du.drepo.Utils import Utils
+from du.drepo.ConnectionPool import ConnectionPool
+from du.gerrit.ssh.ConnectionManager import ConnectionManager
 from du.gerrit.rest.change.QueryOption import QueryOption
 from du.gerrit.ChangeStatus import ChangeStatus
+from du.drepo.report.TagIndex import TagIndex
 from du.drepo.report.Types import *
 import concurrent.futures
 
 logger = logging.getLogger(__name__.split(".")[-1])
 
 
+# Single commit of a git log
+LogItem = namedtuple("LogItem", "hash, shortHash, title, author, message")
+
+
 class Analyzer:
     """
     DRepo repositories cls. Uses the manifest and goes trough all local repositories buildling metadata along the way
     """
 
+    # Git log placeholders of the LogItem fields (full hash, short hash, subject, author name, raw body)
+    GIT_LOG_FIELDS = ["%H", "%h", "%s", "%an", "%B"]
+
+    # Number of commits read on top of the missing merged ones, since the newest commits (e.g. changes applied by
+    # the sync) are usually not merged
+    LOG_WINDOW_EXTRA = 5
+
+    # Long git describe output (<tag>-<distance>-g<abbreviated hash>)
+    DESCRIBE_LONG_REGEX = re.compile(r"^(.*)-(\d+)-g([0-9a-f]+)$")
+
     @classmethod
     def analyze(
-        cls, manifest, httpCredentials, numMergedCommits, tagPattern=None, numThreads=1
+        cls,
+        manifest,
+        httpCredentials,
+        numMergedCommits,
+        tagPattern=None,
+        numThreads=1,
+        cache=None,
+        connectionPool=None,
     ):
         """
         Analyze projects
@@ -33,39 +58,62 @@ class Analyzer:
         @param httpCredentials Credentials used for REST calls to Gerrit
         @param numMergedCommits Number of merged commits to include in the report
         @param tagPattern Tag pattern to match
+        @param numThreads Number of threads to run in parallel
+        @param cache ChangeInfoCache used to avoid querying Gerrit for already known commits (optional)
+        @param connectionPool ConnectionPool used for Gerrit queries (if not set, a pool is created for this analysis)
         """
 
-        projectInfoResults = {}
+        # Project -> local directory
+        localDirs = {}
+
+        for project in manifest.projects:
+            localDir = os.path.join(manifest.selectedBuild.root, project.path)
+
+            # Don't crash in case one of the projects was deleted from the disk, just report a warning
+            if not os.path.isdir(localDir) or not os.path.exists(
+                os.path.join(localDir, ".git")
+            ):
+                logger.warning("%r not valid git directory, skpping .." % project.name)
+                continue
 
-        projectsToAnalyze = [proj for proj in manifest.projects]
+            localDirs[project] = localDir
 
         with concurrent.futures.ThreadPoolExecutor(max_workers=numThreads) as executor:
-            # Launch threads
-            futures = []
-            for i in range(numThreads):
-                futures.append(
-                    executor.submit(
-                        cls.__analyzer,
-                        projectsToAnalyze,
-                        manifest,
-                        httpCredentials,
-                        tagPattern,
-                        numMergedCommits,
-                    )
+            # Get tag names
+            tagInfos = dict(
+                zip(
+                    localDirs.keys(),
+                    executor.map(
+                        lambda localDir: cls.__getTagInfo(localDir, tagPattern),
+                        localDirs.values(),
+                    ),
                 )
+            )
 
-            # Wait for results
-            for future in futures:
-                for projectInfo in future.result():
-                    projectInfoResults[projectInfo.manifestProject] = projectInfo
+            if connectionPool:
+                commits = cls.__getCommits(
+                    localDirs, connectionPool, numMergedCommits, executor, cache
+                )
+            else:
+                # Queries to the same SSH server share a single connection
+                connectionManager = ConnectionManager()
 
-            executor.shutdown()
+                try:
+                    commits = cls.__getCommits(
+                        localDirs,
+                        ConnectionPool(httpCredentials, connectionManager),
+                        numMergedCommits,
+                        executor,
+                        cache,
+                    )
+                finally:
+                    connectionManager.close()
 
-        # Sort the results in the same order as defined in the manifest
-        projectsInfo = []
-        for project in manifest.projects:
-            if project in projectInfoResults:
-                projectsInfo.append(projectInfoResults[project])
+        # Results are in the same order as defined in the manifest
+        projectsInfo = [
+            ProjectInfo(project, tagInfos[project], commits[project])
+            for project in localDirs
+        ]
 
         # Host name
         hostName = ShellCommand.execute(["hostname"]).stdoutStr.strip()
@@ -76,136 +124,206 @@ class Analyzer:
         return ReportInfo(manifest, projectsInfo, hostName, userName)
 
     @classmethod
-    def __analyzer(
-        cls, projectsToAnalyze, manifest, httpCredentials, tagPattern, numMergedCommits
-    ):
+    def __getCommits(cls, localDirs, connectionPool, numMergedCommits, executor, cache):
         """
-        Project analyzer thread
+        Get the latest commits of all the projects, up to (and including) the last wanted merged commit.
+
+        Projects are processed in rounds: each round reads the next window of commits of every unfinished project
+        (from a single history stream per project, each window twice the size of the previous one), and resolves all
+        of their changes with a few batched queries per remote
 
-        @param projectsToAnalyze List of projects that are not yet analyzed (shared between threads
-        @param manifest see cls.analyze#manifest
-        @param httpCredentials see cls.analyze#httpCredentials
-        @param tagPattern see cls.analyze#tagPattern
+        @param localDirs Map of project -> local directory
+        @param connectionPool ConnectionPool used for Gerrit queries
         @param numMergedCommits Number of merged commits to include in the report
+        @param executor Executor used to run git & queries concurrently
+        @param cache ChangeInfoCache (None to always query Gerrit)
+        @return map of project -> list of CommitInfo objects
         """
 
-        threadName = threading.current_thread().name
+        # Project -> commits so far
+        commits = {project: [] for project in localDirs}
 
-        logger.debug("[%s] start analyzer" % threadName)
+        # Project -> number of merged commits which still have to be found
+        numMissing = {project: numMergedCommits for project in localDirs}
 
-        result = []
+        # Project -> size of the next window (doubled every round, so that long histories take only a few rounds)
+        windowSizes = {
+            project: numMergedCommits + cls.LOG_WINDOW_EXTRA for project in localDirs
+        }
 
-        while projectsToAnalyze:
-            # Take next available project
-            try:
-                project = projectsToAnalyze.pop()
-            except IndexError:
-                break
+        pending = list(localDirs.keys())
 
-            logger.debug("[%s] analyzing %r" % (threadName, project.name))
+        with ExitStack() as stack:
+            # Project -> history stream, read window by window (a single git command per project)
+            logs = {
+                project: stack.enter_context(closing(cls.__getGitLog(localDir)))
+                for project, localDir in localDirs.items()
+            }
 
-            # Process
-            projectInfo = cls.__analyzeProject(
-                manifest, project, httpCredentials, tagPattern, numMergedCommits
-            )
-            if projectInfo:
-                result.append(projectInfo)
+            while pending:
 
-            logger.debug("[%s] done analyzing %r" % (threadName, project.name))
+                def readWindow(project):
+                    windowSize = windowSizes[project]
 
-        return result
+                    windowSizes[project] *= 2
 
-    @classmethod
-    def __analyzeProject(
-        cls, manifest, proj, httpCredentials, tagPattern, numMergedCommits
-    ):
-        logger.debug("processing %r .." % proj.name)
+                    return list(itertools.islice(logs[project], windowSize)), windowSize
 
-        # Local project directory
-        localDir = os.path.join(manifest.selectedBuild.root, proj.path)
+                windows = dict(zip(pending, executor.map(readWindow, pending)))
 
-        logger.debug("directory %r" % localDir)
+                # Remote -> Change-IDs of all the projects on it
+                remoteChangeIds = {}
 
-        # Don't crash in case one of the projects was deleted from the disk, just report a warning
-        if not os.path.isdir(localDir) or not os.path.isdir(
-            os.path.join(localDir, ".git")
-        ):
-            logger.warning("not valid git directory, skpping ..")
-            return None
+                # (project, commit hash) -> Change-ID (only commits which are not cached)
+                changeIds = {}
 
-        # Create a connnection for Gerrit communication
-        conn = Utils.createQueryConnection(proj.remote, httpCredentials)
+                # (project, commit hash) -> cached GerritChangeInfo
+                cachedChangeInfos = {}
 
-        # Get tag name
-        tagInfo = cls.__getTagInfo(localDir, tagPattern)
+                for project, (log, _) in windows.items():
+                    for logItem in log:
+                        # Extract gerrit change from local .git message
+                        changeId = GerritUtils.extractChangeId(logItem.message)
 
-        # Get commit log of the project
-        log = cls.__getGitLog(localDir)
+                        if not changeId:
+                            # No change ID (not a gerrit commmit ?)
+                            logger.warning(
+                                "could not extract Gerrit change ID, for commit %r from message %r"
+                                % (logItem.hash, logItem.message)
+                            )
+                            continue
 
-        historyLength = numMergedCommits
+                        if cache:
+                            cachedChangeInfo = cache.get(project, logItem.hash)
 
-        commits = []
+                            if cachedChangeInfo:
+                                cachedChangeInfos[(project, logItem.hash)] = (
+                                    cachedChangeInfo
+                                )
+                                continue
 
-        # Go trough the log
-        for logItem in log:
-            # Extract full message from the local .git
-            message = ShellCommand.execute(
-                ["git", "show", "-s", "--format=%B", logItem.hash],
-                workingDirectory=localDir,
-            ).stdoutStr
+                        changeIds[(project, logItem.hash)] = changeId
 
-            # Extract author (TODO Can we get message & author in a single command?)
-            author = ShellCommand.execute(
-                ["git", "log", "--format=%an", logItem.hash + "^!"],
-                workingDirectory=localDir,
-            ).stdoutStr
+                        remoteChangeIds.setdefault(project.remote, set()).add(changeId)
 
-            # Extract gerrit change from local .git message
-            changeId = GerritUtils.extractChangeId(message)
+                # Fetch information about all the changes, one remote per thread (only remotes which are actually queried
+                # are connected to)
+                remoteChanges = dict(
+                    zip(
+                        remoteChangeIds.keys(),
+                        executor.map(
+                            lambda remote: cls.__fetchChanges(
+                                connectionPool.get(remote), remoteChangeIds[remote]
+                            ),
+                            remoteChangeIds.keys(),
+                        ),
+                    )
+                )
 
-            # Gerrit change info
-            gerritChangeInfo = None
+                # (project, commit hash) -> GerritChangeInfo (only commits which were fetched)
+                fetchedChangeInfos = {}
+
+                for (project, commitHash), changeId in changeIds.items():
+                    changeInfo = cls.__createGerritChangeInfo(
+                        remoteChanges[project.remote],
+                        changeId,
+                        project.name,
+                        commitHash,
+                    )
 
-            if not changeId:
-                # No change ID (not a gerrit commmit ?)
-                logger.warning(
-                    "could not extract Gerrit change ID, for commit %r from message %r"
-                    % (logItem.hash, message)
+                    if changeInfo:
+                        fetchedChangeInfos[(project, commitHash)] = changeInfo
+
+                # Cache everything which was fetched (even commits beyond the report depth, for the next run), one
+                # transaction per round
+                if cache and fetchedChangeInfos:
+                    cache.putAll(fetchedChangeInfos)
+
+                # (project, commit hash) -> GerritChangeInfo
+                changeInfos = cachedChangeInfos
+                changeInfos.update(fetchedChangeInfos)
+
+                pending = []
+
+                for project, (log, windowSize) in windows.items():
+                    for logItem in log:
+                        gerritChangeInfo = changeInfos.get((project, logItem.hash))
+
+                        commits[project].append(
+                            CommitInfo(
+                                logItem.title,
+                                logItem.hash,
+                                logItem.shortHash,
+                                logItem.author,
+                                gerritChangeInfo,
+                            )
+                        )
+
+                        if (
+                            gerritChangeInfo
+                            and gerritChangeInfo.status == ChangeStatus.MERGED
+                        ):
+                            numMissing[project] -= 1
+
+                        if numMissing[project] == 0:
+                            # Reached allowed number of merged commits depth
+                            logger.debug(
+                                "Maximum history length reached %d" % numMergedCommits
+                            )
+                            break
+                    else:
+                        # Keep going, unless the entire history was read
+                        if len(log) == windowSize:
+                            pending.append(project)
+
+                # Stop the commands of the finished projects
+                for project in windows:
+                    if project not in pending:
+                        logs[project].close()
+
+        return commits
+
+    @classmethod
+    def __fetchChanges(cls, conn, changeIds):
+        """
+        Fetch changes (with all of their patchsets) using as few (OR-combined) queries as possible
+
+        @param conn Gerrit connection
+        @param changeIds Change IDs
+
+        @return map of (project name, Change-ID) -> list of changes
+        """
+
+        results = []
+
+        for query in GerritUtils.chunkOrQuery(
+            ["change:%s" % changeId for changeId in sorted(changeIds)]
+        ):
+            if isinstance(conn, ChangeEndpoint):
+                results += conn.query(
+                    *query,
+                    options=[QueryOption.ALL_REVISIONS, QueryOption.CURRENT_COMMIT],
                 )
             else:
-                # Fetch information about this change
-                gerritChangeInfo = cls.__fetchGerritChangeInfo(
-                    conn, changeId, proj.name, logItem.hash
+                results += conn.query(
+                    Connection.QUERY_ARG_PATCHSETS,
+                    Connection.QUERY_ARG_CURRENT_PATCHSET,
+                    *query,
                 )
 
-            commitInfo = CommitInfo(
-                logItem.title,
-                logItem.hash,
-                logItem.shortHash,
-                author,
-                gerritChangeInfo,
-            )
-            commits.append(commitInfo)
+        changes = {}
 
-            if (
-                commitInfo.gerritChangeInfo
-                and commitInfo.gerritChangeInfo.status == ChangeStatus.MERGED
-            ):
-                historyLength -= 1
-
-            if historyLength == 0:
-                # Reached allowed number of merged commits depth
-                logger.debug("Maximum history length reached %d" % numMergedCommits)
-                break
+        for change in results:
+            changes.setdefault((change.project, change.id), []).append(change)
 
-        return ProjectInfo(proj, tagInfo, commits)
+        return changes
 
     @classmethod
-    def __fetchGerritChangeInfo(cls, conn, changeId, projectName, commitHash):
+    def __createGerritChangeInfo(cls, changes, changeId, projectName, commitHash):
         """
-        Fetch a change from specific project
+        Find a change from specific project
 
-        @conn Gerrit connection
+        @param changes Fetched changes (see cls.__fetchChanges)
         @param changeId Change ID
         @param projectName Project name
         @param commitHash Local commit hash
@@ -213,42 +331,25 @@ class Analyzer:
         @return Change information
         """
 
-        # Fetch data from server
-        if isinstance(conn, ChangeEndpoint):
-            changes = conn.query(
-                changeId,
-                options=[QueryOption.ALL_REVISIONS, QueryOption.CURRENT_COMMIT],
-            )
-        else:
-            changes = conn.query(
-                Connection.QUERY_ARG_PATCHSETS,
-                Connection.QUERY_ARG_CURRENT_PATCHSET,
-                change=changeId,
-            )
-
-        # Find a change in the project we're processing now
+        # Find a change in the project we're processing now (same Change-ID may be on multiple branches)
         patchsetNumber = None
         changeInfo = None
-        for change in changes:
-            # Ignore changes which do not belong to our project
-            if change.project != projectName:
-                continue
-
+        for change in changes.get((projectName, changeId), []):
             changeInfo = change
 
             # Try to figure out the patchset number, by comparing hash values
-            if isinstance(conn, ChangeEndpoint):
-                for revisionHash, revision in change.revisions.items():
-                    if revisionHash == commitHash:
-                        patchsetNumber = revision.number
-                        break
-
-            else:
+            if isinstance(change, Change):
                 for i in change.patchSets:
                     if i.revision == commitHash:
                         patchsetNumber = i.number
                         break
 
+            else:
+                for revisionHash, revision in change.revisions.items():
+                    if revisionHash == commitHash:
+                        patchsetNumber = revision.number
+                        break
+
             if patchsetNumber:
                 # Found exactly this hash on Gerrit
                 break
@@ -269,36 +370,31 @@ class Analyzer:
     @classmethod
     def __getGitLog(cls, directory):
         """
-        Get a list of git commits for given directory
+        Stream git commits of given directory (newest first), using a single git command. Closing the generator
+        stops the command
 
         @param directory Directory path
 
-        @return a list of log items
+        @return generator of log items
         """
 
-        LogItem = namedtuple("LogItem", "hash, shortHash, title")
+        command = ["git", "log", "-z"]
 
-        # List the logs long/short hashes and their subjects
-        cmd = ShellCommand.execute(
-            ["git", "log", "--pretty=%H %h %s"], workingDirectory=directory
+        # Fields of each commit, separated (and terminated) by NUL characters, which can't appear in any of them
+        cmd = ShellCommand(
+            command + ["--format=" + "%x00".join(cls.GIT_LOG_FIELDS)],
+            workingDirectory=directory,
         )
 
-        items = []
+        fields = []
 
-        for line in cmd.stdoutStr.splitlines():
-            # Find the first whitespace, indicating the start of the short hash
-            longHashEndPos = line.find(" ")
+        for field in cmd.stream("\0"):
+            fields.append(field)
 
-            # Find the first whitespace after that, indicating the start of subject
-            shortHashEndPos = line.find(" ", longHashEndPos + 1)
+            if len(fields) == len(cls.GIT_LOG_FIELDS):
+                yield LogItem(*fields)
 
-            commitLongHash = line[:longHashEndPos].strip()
-            commitShortHash = line[longHashEndPos + 1 : shortHashEndPos]
-            commitMessage = line[shortHashEndPos + 1 :].rstrip()
-
-            items.append(LogItem(commitLongHash, commitShortHash, commitMessage))
-
-        return items
+                fields = []
 
     @classmethod
     def __getTagInfo(cls, directory, tagPattern=None):
@@ -307,52 +403,41 @@ class Analyzer:
         @param tagPattern Tag pattern to look for, in order to provide matchedTagName/cleanMatchedTagName fields
         """
 
-        tagName = None
-        tagCleanName = None
-
-        # Get HEAD hash ID
-        headHash = ShellCommand.execute(
-            ["git", "rev-parse", "--short", "HEAD"], workingDirectory=directory
-        ).stdoutStr.rstrip()
+        tagIndex = TagIndex.create(directory)
 
         # Get head name (if it's tagged)
-        headTagName = None
-        try:
-            headTagName = ShellCommand.execute(
-                ["git", "describe", "--exact-match", "--tags", headHash],
-                workingDirectory=directory,
-            ).stdoutStr.rstrip()
-        except CommandFailedException:
-            pass
-
-        tagRefHash = None
-        if headTagName:
-            tagRefHash = ShellCommand.execute(
-                ["git", "show-ref", headTagName, "--hash"], workingDirectory=directory
-            ).stdoutStr.rstrip()
+        headTags = tagIndex.getTags(tagIndex.headHash)
+        headTagName = headTags[0] if headTags else None
+
+        tagRefHash = tagIndex.getRefHash(headTagName) if headTagName else None
 
         # Find a tag which matches given pattern (may be dirty if commits are present before this tag)
         # For example if we're looking for "master*" tags we could get "master-0.32.0-1-g9298258bf" as a result
-        # because there are commits after the "master-0.32" tag
+        # because there are commits after the "master-0.32" tag. The long format always contains the distance and
+        # the abbreviated HEAD hash, which is printed alone if no tag matches (or no pattern was given)
+        description = ShellCommand.execute(
+            ["git", "describe", "--tags", "--long", "--always"]
+            + (["--match", tagPattern] if tagPattern else ["--exclude", "*"]),
+            workingDirectory=directory,
+        ).stdoutStr.rstrip()
+
+        match = cls.DESCRIBE_LONG_REGEX.match(description)
+
         matchedTagName = None
-        if tagPattern:
-            try:
-                matchedTagName = ShellCommand.execute(
-                    ["git", "describe", "--match", tagPattern, "--tags"],
-                    workingDirectory=directory,
-                ).stdoutStr.rstrip()
-            except CommandFailedException:
-                logger.warning("Could not find any tags which match %r" % tagPattern)
 
         # We're looking for the last clean tag name which matches the patter nabove (e.g. instead of "master-0.32.0-1-g9298258bf", we'll get "master-0.32")
         cleanMatchedTagName = None
-        if tagPattern:
-            try:
-                cleanMatchedTagName = ShellCommand.execute(
-                    ["git", "describe", "--match", tagPattern, "--tags", "--abbrev=0"],
-                    workingDirectory=directory,
-                ).stdoutStr.rstrip()
-            except CommandFailedException:
+
+        if match:
+            cleanMatchedTagName, distance, headHash = match.groups()
+
+            # Describe omits the distance & hash for exactly tagged commits
+            matchedTagName = cleanMatchedTagName if distance == "0" else description
+
+        else:
+            headHash = description
+
+            if tagPattern:
                 logger.warning("Could not find any tags which match %r" % tagPattern)
 
         return TagInfo(
@@ -0,0 +1,149 @@
+import logging
+import os
+import sqlite3
+import time
+
+from du.Utils import makeDirTree
+from du.gerrit.ChangeStatus import ChangeStatus
+from du.drepo.report.Types import GerritChangeInfo
+
+logger = logging.getLogger(__name__.split(".")[-1])
+
+
+class ChangeInfoCache:
+    """
+    Persistent (sqlite) cache of commit -> Gerrit change information.
+
+    A commit always belongs to the same change, and once a change is merged its information never changes again,
+    so merged changes are cached forever. Any other change (open, or abandoned which may still be restored) is only
+    cached for a limited time.
+    """
+
+    # Default time (in seconds) for which information about changes which are not merged remains valid
+    DEFAULT_OPEN_TTL = 10 * 60
+
+    # Time (in seconds) to wait for another process (e.g. a concurrent report) to release the database
+    BUSY_TIMEOUT = 60
+
+    def __init__(self, path, openTtl=DEFAULT_OPEN_TTL):
+        """
+        Constructor
+
+        @param path Database file path (does not need to exist)
+        @param openTtl Time (in seconds) for which information about changes which are not merged remains valid
+        """
+
+        self._path = path
+        self._openTtl = openTtl
+
+        dirName = os.path.dirname(path)
+        if dirName:
+            makeDirTree(dirName)
+
+        try:
+            self._db = self.__open(path)
+        except sqlite3.DatabaseError as e:
+            # Not critical, we'll just start from scratch
+            logger.warning("could not load report cache %r: %r" % (path, str(e)))
+
+            os.remove(path)
+            self._db = self.__open(path)
+
+    @staticmethod
+    def __open(path):
+        """
+        Open the database, and create the table if needed
+
+        @param path Database file path
+        @return database connection
+        """
+
+        db = sqlite3.connect(path, timeout=ChangeInfoCache.BUSY_TIMEOUT)
+
+        try:
+            with db:
+                db.execute(
+                    "CREATE TABLE IF NOT EXISTS changes ("
+                    "remote TEXT, project TEXT, hash TEXT, "
+                    "number INTEGER, patchSetNumber INTEGER, status TEXT, currentPatchSetNumber INTEGER, "
+                    "updated REAL, "
+                    "PRIMARY KEY (remote, project, hash))"
+                )
+        except sqlite3.DatabaseError:
+            db.close()
+            raise
+
+        return db
+
+    def get(self, project, commitHash):
+        """
+        Get cached change information of a commit
+
+        @param project Manifest project the commit belongs to
+        @param commitHash Commit hash
+        @return GerritChangeInfo, or None if not cached (or expired)
+        """
+
+        row = self._db.execute(
+            "SELECT number, patchSetNumber, status, currentPatchSetNumber, updated FROM changes "
+            "WHERE remote = ? AND project = ? AND hash = ?",
+            (project.remote.fetch, project.name, commitHash),
+        ).fetchone()
+
+        if not row:
+            return None
+
+        number, patchSetNumber, status, currentPatchSetNumber, updated = row
+
+        status = ChangeStatus[status]
+
+        if status != ChangeStatus.MERGED and time.time() - updated > self._openTtl:
+            return None
+
+        return GerritChangeInfo(number, patchSetNumber, status, currentPatchSetNumber)
+
+    def put(self, project, commitHash, changeInfo):
+        """
+        Cache change information of a commit
+
+        @param project Manifest project the commit belongs to
+        @param commitHash Commit hash
+        @param changeInfo GerritChangeInfo
+        """
+
+        self.putAll({(project, commitHash): changeInfo})
+
+    def putAll(self, changeInfos):
+        """
+        Cache change information of multiple commits, in a single transaction (so that the database is only locked
+        while writing)
+
+        @param changeInfos Map of (project, commit hash) -> GerritChangeInfo
+        """
+
+        updated = time.time()
+
+        with self._db:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO changes VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (
+                        project.remote.fetch,
+                        project.name,
+                        commitHash,
+                        changeInfo.number,
+                        changeInfo.patchSetNumber,
+                        changeInfo.status.name,
+                        changeInfo.currentPatchSetNumber,
+                        updated,
+                    )
+                    for (project, commitHash), changeInfo in changeInfos.items()
+                ],
+            )
+
+    def close(self):
+        """
+        Close the database
+        """
+
+        self._db.close()
@@ -0,0 +1,159 @@
+import json
+import logging
+import os
+
+from du.Utils import makeDirTree
+from du.gerrit.ChangeStatus import ChangeStatus
+from du.drepo.report.Types import *
+
+logger = logging.getLogger(__name__.split(".")[-1])
+
+
+class ReportSnapshot:
+    """
+    JSON snapshot of an analyzed report, which can be reloaded later to render reports without analyzing the
+    projects again
+    """
+
+    # Snapshot format version
+    VERSION = 1
+
+    # Snapshot keys
+    KEY_VERSION = "version"
+    KEY_BUILD = "build"
+    KEY_HOST_NAME = "hostName"
+    KEY_USER_NAME = "userName"
+    KEY_PROJECTS = "projects"
+    KEY_NAME = "name"
+    KEY_PATH = "path"
+    KEY_TAG_INFO = "tagInfo"
+    KEY_COMMITS = "commits"
+    KEY_GERRIT_CHANGE_INFO = "gerritChangeInfo"
+    KEY_STATUS = "status"
+
+    @classmethod
+    def save(cls, reportInfo, path):
+        """
+        Store report information
+
+        @param reportInfo ReportInfo
+        @param path Snapshot file path
+        """
+
+        logger.info("writing report snapshot %r" % path)
+
+        projects = []
+
+        for projectInfo in reportInfo.projects:
+            commits = []
+
+            for commitInfo in projectInfo.commitsInfo:
+                commit = commitInfo._asdict()
+
+                if commitInfo.gerritChangeInfo:
+                    commit[cls.KEY_GERRIT_CHANGE_INFO] = dict(
+                        commitInfo.gerritChangeInfo._asdict(),
+                        status=commitInfo.gerritChangeInfo.status.name,
+                    )
+
+                commits.append(commit)
+
+            projects.append(
+                {
+                    cls.KEY_NAME: projectInfo.manifestProject.name,
+                    cls.KEY_PATH: projectInfo.manifestProject.path,
+                    cls.KEY_TAG_INFO: projectInfo.tagInfo._asdict(),
+                    cls.KEY_COMMITS: commits,
+                }
+            )
+
+        snapshot = {
+            cls.KEY_VERSION: cls.VERSION,
+            cls.KEY_BUILD: reportInfo.manifest.selectedBuild.name,
+            cls.KEY_HOST_NAME: reportInfo.hostName,
+            cls.KEY_USER_NAME: reportInfo.userName,
+            cls.KEY_PROJECTS: projects,
+        }
+
+        dirName = os.path.dirname(path)
+        if dirName:
+            makeDirTree(dirName)
+
+        with open(path, "w") as fileObj:
+            json.dump(snapshot, fileObj, indent=4)
+
+    @classmethod
+    def load(cls, manifest, path):
+        """
+        Load report information
+
+        @param manifest Manifest the snapshot was created from (its projects are referenced by the snapshot)
+        @param path Snapshot file path
+        @return ReportInfo
+        """
+
+        logger.info("loading report snapshot %r" % path)
+
+        with open(path, "r") as fileObj:
+            snapshot = json.load(fileObj)
+
+        if snapshot.get(cls.KEY_VERSION) != cls.VERSION:
+            raise RuntimeError(
+                "Unsupported report snapshot version %r" % snapshot.get(cls.KEY_VERSION)
+            )
+
+        if snapshot[cls.KEY_BUILD] != manifest.selectedBuild.name:
+            raise RuntimeError(
+                "Report snapshot was created for build %r, but %r is selected"
+                % (snapshot[cls.KEY_BUILD], manifest.selectedBuild.name)
+            )
+
+        # (name, path) -> manifest project
+        manifestProjects = {
+            (project.name, project.path): project for project in manifest.projects
+        }
+
+        projectsInfo = []
+
+        for project in snapshot[cls.KEY_PROJECTS]:
+            manifestProject = manifestProjects.get(
+                (project[cls.KEY_NAME], project[cls.KEY_PATH])
+            )
+
+            if not manifestProject:
+                raise RuntimeError(
+                    "Report snapshot project %r not found in the manifest"
+                    % project[cls.KEY_NAME]
+                )
+
+            commitsInfo = []
+
+            for commit in project[cls.KEY_COMMITS]:
+                gerritChangeInfo = commit[cls.KEY_GERRIT_CHANGE_INFO]
+
+                if gerritChangeInfo:
+                    gerritChangeInfo = GerritChangeInfo(
+                        **dict(
+                            gerritChangeInfo,
+                            status=ChangeStatus[gerritChangeInfo[cls.KEY_STATUS]],
+                        )
+                    )
+
+                commitsInfo.append(
+                    CommitInfo(**dict(commit, gerritChangeInfo=gerritChangeInfo))
+                )
+
+            projectsInfo.append(
+                ProjectInfo(
+                    manifestProject,
+                    TagInfo(**project[cls.KEY_TAG_INFO]),
+                    commitsInfo,
+                )
+            )
+
+        return ReportInfo(
+            manifest,
+            projectsInfo,
+            snapshot[cls.KEY_HOST_NAME],
+            snapshot[cls.KEY_USER_NAME],
+        )
@@ -0,0 +1,104 @@
+import logging
+
+from du.utils.ShellCommand import ShellCommand
+
+logger = logging.getLogger(__name__.split(".")[-1])
+
+
+class TagIndex:
+    """
+    In-memory index of the tags of a repository (and its HEAD), built with a single ref listing
+    """
+
+    # Tag reference prefix
+    TAGS_PREFIX = "refs/tags/"
+
+    # Suffix of peeled (dereferenced) tag references
+    PEELED_SUFFIX = "^{}"
+
+    # HEAD reference
+    HEAD = "HEAD"
+
+    def __init__(self, headHash, refHashes, commitHashes):
+        """
+        Constructor
+
+        @param headHash HEAD commit hash
+        @param refHashes Map of tag name -> tag reference hash (tag object hash for annotated tags)
+        @param commitHashes Map of tag name -> tagged commit hash
+        """
+
+        self._headHash = headHash
+        self._refHashes = refHashes
+        self._commitHashes = commitHashes
+
+    @classmethod
+    def create(cls, directory):
+        """
+        Create an index of a repository
+
+        @param directory Git directory
+        @return TagIndex
+        """
+
+        # Peeled entries (tagged commits of annotated tags) follow their tags
+        output = ShellCommand.execute(
+            ["git", "show-ref", "--head", "--dereference", "--tags"],
+            workingDirectory=directory,
+        ).stdoutStr
+
+        headHash = None
+        refHashes = {}
+        commitHashes = {}
+
+        for line in output.splitlines():
+            refHash, refName = line.split(" ", 1)
+
+            if refName == cls.HEAD:
+                headHash = refHash
+
+            elif refName.startswith(cls.TAGS_PREFIX):
+                tagName = refName[len(cls.TAGS_PREFIX) :]
+
+                if tagName.endswith(cls.PEELED_SUFFIX):
+                    commitHashes[tagName[: -len(cls.PEELED_SUFFIX)]] = refHash
+                else:
+                    refHashes[tagName] = refHash
+                    commitHashes.setdefault(tagName, refHash)
+
+        return cls(headHash, refHashes, commitHashes)
+
+    @property
+    def headHash(self):
+        """
+        HEAD commit hash
+        """
+
+        return self._headHash
+
+    def getRefHash(self, tagName):
+        """
+        Get the reference hash of a tag
+
+        @param tagName Tag name
+        @return hash (tag object hash for annotated tags, commit hash otherwise), or None if there's no such tag
+        """
+
+        return self._refHashes.get(tagName)
+
+    def getTags(self, commitHash):
+        """
+        Get the tags of a commit
+
+        @param commitHash Commit hash
+        @return list of tag names, annotated tags first (sorted by name)
+        """
+
+        return sorted(
+            [
+                tagName
+                for tagName, tagCommitHash in self._commitHashes.items()
+                if tagCommitHash == commitHash
+            ],
+            key=lambda tagName: (self._refHashes[tagName] == commitHash, tagName),
+        )
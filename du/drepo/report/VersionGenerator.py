@@ -29,8 +29,11 @@ class VersionGenerator:
                 elif cleanTagName != proj.tagInfo.cleanMatchedTagName:
                     brokenFlag = True
 
-                # Detect dirty tag name and set the dirty flag
-                if proj.tagInfo.matchedTagName and "-g" in proj.tagInfo.matchedTagName:
+                # Detect dirty tag name (commits after the clean tag) and set the dirty flag
+                if (
+                    proj.tagInfo.matchedTagName
+                    and proj.tagInfo.matchedTagName != proj.tagInfo.cleanMatchedTagName
+                ):
                     dirtyFlag = True
 
                 if proj.tagInfo.matchedTagName:
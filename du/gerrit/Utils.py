@@ -15,6 +15,15 @@ class Utils:
     # Regex which matches a Gerrit change ID git message
     CHANGE_ID_MESSAGE_REGEX = re.compile(r"Change-Id: (%s)" % CHANGE_ID_VALUE_PATTERN)
 
+    # Maximum length of a single query string (kept well below the command line/URL limits)
+    MAX_QUERY_LENGTH = 2048
+
+    # Maximum number of OR-combined terms in a single query (kept below the default query result limit)
+    MAX_QUERY_TERMS = 100
+
+    # Query operator used to combine terms
+    QUERY_OPERATOR_OR = "OR"
+
     @staticmethod
     def isValidChangeId(changeId):
         """
@@ -41,3 +50,49 @@ class Utils:
                 return match.group(1)
 
         return None
+
+    @staticmethod
+    def chunkOrQuery(terms, maxLength=MAX_QUERY_LENGTH, maxTerms=MAX_QUERY_TERMS):
+        """
+        Combine query terms with OR operators, splitting them into multiple queries so that none of them exceeds
+        the length/term limits
+
+        @param terms List of query terms (e.g. ["change:1234", "change:I8473b95934b5732ac55d26311a706c9c2bde9940"])
+        @param maxLength Maximum length of a single query
+        @param maxTerms Maximum number of terms in a single query
+
+        @return a list of queries, each one being a list of tokens (e.g. ["change:1", "OR", "change:2"])
+        """
+
+        queries = []
+
+        query = []
+        queryLength = 0
+        queryTerms = 0
+
+        for term in terms:
+            term = str(term)
+
+            # Length of the term, including the separating operator
+            termLength = len(term) + len(Utils.QUERY_OPERATOR_OR) + 2
+
+            if query and (
+                queryLength + termLength > maxLength or queryTerms == maxTerms
+            ):
+                queries.append(query)
+
+                query = []
+                queryLength = 0
+                queryTerms = 0
+
+            if query:
+                query.append(Utils.QUERY_OPERATOR_OR)
+
+            query.append(term)
+            queryLength += termLength
+            queryTerms += 1
+
+        if query:
+            queries.append(query)
+
+        return queries
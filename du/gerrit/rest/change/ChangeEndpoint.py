@@ -16,6 +16,9 @@ class ChangeEndpoint:
 
     ENDPOINT = "/changes/"
 
+    # Attribute of the last returned change, indicating if there are more results than returned
+    KEY_MORE_CHANGES = "_more_changes"
+
     def __init__(self, rest):
         """ """
 
@@ -30,6 +33,39 @@ class ChangeEndpoint:
         Source: https://gerrit-review.googlesource.com/Documentation/rest-api-changes.html#list-changes
         """
 
+        return [
+            ChangeInfo(jsonObject) for jsonObject in self.__query(args, options, kwargs)
+        ]
+
+    def queryAll(self, *args, options=[], **kwargs):
+        """
+        Execute a query. Unlike ChangeEndpoint.query, which returns at most as many results as the server limit
+        allows, pages through the results until all of them are returned
+
+        @param options A list of QueryOption values
+        """
+
+        response = []
+
+        while True:
+            page = self.__query(args, options, kwargs, len(response))
+
+            response += page
+
+            if not page or not page[-1].get(self.KEY_MORE_CHANGES):
+                return [ChangeInfo(jsonObject) for jsonObject in response]
+
+    def __query(self, args, options, kwargs, start=0):
+        """
+        Execute a query
+
+        @param args Query arguments
+        @param options A list of QueryOption values
+        @param kwargs Query key/value pairs
+        @param start Number of results to skip
+        @return list of JSON objects
+        """
+
         params = self.ENDPOINT
 
         params += "?q="
@@ -50,11 +86,13 @@ class ChangeEndpoint:
         for opt in options:
             params += "&o=" + opt.name
 
+        if start:
+            params += "&S=%d" % start
+
         logger.debug("params: %r" % params)
 
         response = self.__rest.get(params)
 
         logger.debug("response:\n%s" % pprint.pformat(response, indent=2))
 
-        # Execute the query & parse the results
-        return [ChangeInfo(jsonObject) for jsonObject in response]
+        return response
@@ -13,6 +13,7 @@ class ChangeInfo:
     def __init__(self, jsonObject):
         self.__currentRevision = jsonObject.get("current_revision", None)
 
+        self.__id = jsonObject.get("change_id")
         self.__project = jsonObject.get("project")
         self.__branch = jsonObject.get("branch")
         self.__number = jsonObject.get("_number")
@@ -30,6 +31,13 @@ class ChangeInfo:
         """
         return self.__status
 
+    @property
+    def id(self):
+        """
+        The Change-Id of the change
+        """
+        return self.__id
+
     @property
     def number(self):
         """
@@ -28,20 +28,31 @@ class Connection:
     # Stats response type
     QUERY_TYPE_STATS = "stats"
 
+    # Stats response attribute key, indicating if there are more results than returned
+    QUERY_KEY_MORE_CHANGES = "moreChanges"
+
+    # Number of results to skip
+    QUERY_ARG_START = "--start"
+
     # Number of connection retries
     NUM_CONNECTION_RETRIES = 3
 
     # Time range for random connection retries
     RETRY_CONNECTION_RANGE_SEC = (0.5, 3)
 
-    def __init__(self, server):
+    def __init__(self, server, connectionManager=None):
         """
         Constructor
 
         @param server Server address
+        @param connectionManager Optional ConnectionManager, used to share a single SSH connection between queries
         """
 
         self._server = server
+        self._connectionManager = connectionManager
+
+        if connectionManager:
+            connectionManager.register(server)
 
     def query(self, *args, **kwargs):
         """
@@ -50,6 +61,40 @@ class Connection:
         @return Parsed list of JSON objects
         """
 
+        changes, _ = self.__query(args, kwargs)
+
+        return changes
+
+    def queryAll(self, *args, **kwargs):
+        """
+        Preform a gerrit query, passing on all arguments. Unlike Connection.query, which returns at most as many
+        results as the server limit allows, pages through the results until all of them are returned
+
+        @return Parsed list of JSON objects
+        """
+
+        changes = []
+
+        while True:
+            # Options have to precede the query
+            page, result = self.__query(
+                (self.QUERY_ARG_START, len(changes)) + args, kwargs
+            )
+
+            changes += page
+
+            if not page or not result.get(self.QUERY_KEY_MORE_CHANGES):
+                return changes
+
+    def __query(self, args, kwargs):
+        """
+        Preform a gerrit query
+
+        @param args Query arguments
+        @param kwargs Query key arguments
+        @return tuple of parsed list of JSON objects and the query result (stats) object
+        """
+
         query = ""
 
         # Additional query arguments
@@ -64,6 +109,9 @@ class Connection:
 
         rawCommand = ["ssh"]
 
+        if self._connectionManager:
+            rawCommand += self._connectionManager.sshArgs
+
         if parsedUrl.port:
             rawCommand += ["-p", str(parsedUrl.port)]
 
@@ -93,7 +141,7 @@ class Connection:
 
         if responseType == self.QUERY_TYPE_STATS:
             # All good, return response objects
-            return [Change(i) for i in parsedResponse]
+            return [Change(i) for i in parsedResponse], result
 
         elif responseType == self.QUERY_TYPE_ERROR:
             # Query failed
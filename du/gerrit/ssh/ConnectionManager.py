@@ -0,0 +1,127 @@
+import logging
+import os
+import shlex
+import shutil
+import tempfile
+import threading
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+from du.utils.ShellCommand import ShellCommand
+
+logger = logging.getLogger(__name__.split(".")[-1])
+
+
+class ConnectionManager:
+    """
+    Manages persistent (multiplexed) SSH connections.
+
+    Every SSH process started with the options provided by this class reuses a single master connection per host
+    (OpenSSH ControlMaster/ControlPersist), so only the first one pays for the key exchange.
+    """
+
+    # SSH URL scheme
+    SCHEME_SSH = "ssh"
+
+    # Environment variable git uses to run SSH
+    ENV_GIT_SSH_COMMAND = "GIT_SSH_COMMAND"
+
+    # Number of seconds an idle master connection is kept alive
+    DEFAULT_CONTROL_PERSIST_SEC = 120
+
+    def __init__(self, controlPersist=DEFAULT_CONTROL_PERSIST_SEC):
+        """
+        Constructor
+
+        @param controlPersist Number of seconds an idle master connection is kept alive
+        """
+
+        self._controlPersist = controlPersist
+
+        # Control socket paths need to be short (Unix socket path limit), so keep them in a temporary directory
+        # and let SSH name them with a hash of the destination (%C)
+        self._controlDir = tempfile.mkdtemp(prefix="du_ssh_")
+
+        # Destinations (user, host, port) which may have a master connection open
+        self._destinations = set()
+        self._lock = threading.Lock()
+
+    @property
+    def sshArgs(self):
+        """
+        SSH command line options enabling connection sharing
+        """
+
+        return [
+            "-o",
+            "ControlMaster=auto",
+            "-o",
+            "ControlPath=%s" % os.path.join(self._controlDir, "%C"),
+            "-o",
+            "ControlPersist=%d" % self._controlPersist,
+        ]
+
+    def register(self, url):
+        """
+        Register a SSH URL whose connections will be multiplexed, so that its master connection can be closed later
+        on. Has no effect on non-SSH URLs
+
+        @param url Server URL (e.g. ssh://user@server:29418)
+        """
+
+        parsedUrl = urlparse(url)
+
+        if not parsedUrl.scheme.startswith(self.SCHEME_SSH) or not parsedUrl.hostname:
+            return
+
+        with self._lock:
+            self._destinations.add(
+                (parsedUrl.username, parsedUrl.hostname, parsedUrl.port)
+            )
+
+    @contextmanager
+    def gitEnvironment(self):
+        """
+        Context in which all git commands (started from this process) share the SSH connections.
+
+        Modifies the process environment, so it should be entered before, and exited after all the worker threads.
+        """
+
+        oldCommand = os.environ.get(self.ENV_GIT_SSH_COMMAND)
+
+        # Respect the user's SSH command if one is set
+        sshCommand = oldCommand if oldCommand else "ssh"
+
+        os.environ[self.ENV_GIT_SSH_COMMAND] = " ".join(
+            [sshCommand] + [shlex.quote(arg) for arg in self.sshArgs]
+        )
+
+        try:
+            yield
+        finally:
+            if oldCommand is None:
+                os.environ.pop(self.ENV_GIT_SSH_COMMAND, None)
+            else:
+                os.environ[self.ENV_GIT_SSH_COMMAND] = oldCommand
+
+    def close(self):
+        """
+        Close all the master connections
+        """
+
+        with self._lock:
+            destinations = list(self._destinations)
+            self._destinations.clear()
+
+        for userName, hostName, port in destinations:
+            command = ["ssh"] + self.sshArgs + ["-O", "exit"]
+
+            if port:
+                command += ["-p", str(port)]
+
+            command.append(userName + "@" + hostName if userName else hostName)
+
+            # Fails if there's no master running for this destination, which is fine
+            ShellCommand.execute(command, raiseOnError=False)
+
+        shutil.rmtree(self._controlDir, ignore_errors=True)
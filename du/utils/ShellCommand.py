@@ -4,6 +4,7 @@ import subprocess
 import sys
 import threading
 import select
+import tempfile
 import time
 import random
 
@@ -53,6 +54,9 @@ class ShellCommand:
     # Number of fetch retries
     DEFAULT_NUM_RETRIES = 3
 
+    # Maximum number of bytes read at once when streaming the output
+    STREAM_CHUNK_SIZE = 64 * 1024
+
     def __init__(
         self,
         command,
@@ -62,6 +66,8 @@ class ShellCommand:
         randomRetry=False,
         retryRange=None,
         output=logger.debug,
+        environment=None,
+        input=None,
     ):
         """
         Constructor
@@ -75,6 +81,8 @@ class ShellCommand:
         in which random retries will be performed,  If randomRetry == False: retryRange is treated as single integer
         value used for fixed retry interval
         @param output Log output function
+        @param environment Optional map of additional environment variables the command is executed with
+        @param input Optional string written to the standard input of the command
         """
 
         self.__output = output
@@ -103,6 +111,15 @@ class ShellCommand:
         # Retry time range value
         self._retryRange = retryRange
 
+        # Environment of the command (None to inherit the environment of this process)
+        self._environment = None
+        if environment:
+            self._environment = dict(os.environ)
+            self._environment.update(environment)
+
+        # Standard input of the command
+        self._input = input
+
     @staticmethod
     def execute(*args, **kwargs):
         """
@@ -162,12 +179,26 @@ class ShellCommand:
                 self.OUTPUT_STREAM_STDOUT: b"",
             }
 
-            pipe = subprocess.Popen(
-                self._command,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                cwd=self._workingDirectory,
-            )
+            # Input is passed as a file, so that the command can't block on a full stdin pipe while we're reading
+            # its output
+            stdinFile = None
+            if self._input is not None:
+                stdinFile = tempfile.TemporaryFile()
+                stdinFile.write(self._input.encode(self.OUTPUT_ENCODING))
+                stdinFile.seek(0)
+
+            try:
+                pipe = subprocess.Popen(
+                    self._command,
+                    stdin=stdinFile,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.PIPE,
+                    cwd=self._workingDirectory,
+                    env=self._environment,
+                )
+            finally:
+                if stdinFile:
+                    stdinFile.close()
 
             # Streams we're reading from
             outputStreams = {
@@ -263,6 +294,97 @@ class ShellCommand:
         if not success:
             raise CommandFailedException(self, errorMessage)
 
+    def stream(self, separator="\n"):
+        """
+        Run the command and iterate its output records as they are produced, without buffering the entire output.
+        If the iteration is stopped early (e.g. by closing the generator) the command is killed, so it doesn't produce
+        output nobody is going to read. Retries are not supported, and output is not logged
+
+        @param separator Record separator
+        @return generator of output records (strings)
+        """
+
+        # Convert all arguments to string
+        self._command = [str(i) for i in self._command]
+
+        logger.debug(
+            "streaming%s:\n\t%s"
+            % (
+                ""
+                if not self._workingDirectory
+                else " in '" + self._workingDirectory + "'",
+                " ".join(self._command),
+            )
+        )
+
+        # Working directory ok ?
+        if self._workingDirectory != None and not os.path.isdir(self._workingDirectory):
+            raise RuntimeError("Invalid working directory: %r" % self._workingDirectory)
+
+        separator = separator.encode(self.OUTPUT_ENCODING)
+
+        # Stderr goes to a file, so that the command can't block on a full stderr pipe while we're reading stdout
+        with tempfile.TemporaryFile() as stderrFile:
+            pipe = subprocess.Popen(
+                self._command,
+                stdout=subprocess.PIPE,
+                stderr=stderrFile,
+                cwd=self._workingDirectory,
+                env=self._environment,
+            )
+
+            completed = False
+
+            try:
+                pending = b""
+
+                while True:
+                    chunk = pipe.stdout.read1(self.STREAM_CHUNK_SIZE)
+                    if not chunk:
+                        break
+
+                    records = (pending + chunk).split(separator)
+
+                    # Last record is incomplete (or empty, if the chunk ended with a separator)
+                    pending = records.pop()
+
+                    for record in records:
+                        yield record.decode(self.OUTPUT_ENCODING)
+
+                if pending:
+                    yield pending.decode(self.OUTPUT_ENCODING)
+
+                completed = True
+            finally:
+                if not completed:
+                    # Consumer is not interested in the rest of the output
+                    pipe.kill()
+
+                pipe.stdout.close()
+
+                self._returnCode = pipe.wait()
+
+            stderrFile.seek(0)
+
+            self._outputBuffers = {
+                self.OUTPUT_STREAM_STDERR: stderrFile.read(),
+                self.OUTPUT_STREAM_STDOUT: b"",
+            }
+
+        if self._returnCode != self.RETURN_CODE_OK and self._raiseOnError:
+            errorMessage = ""
+
+            errorMessage += "Command failed\n"
+            errorMessage += "\tcommand: %r\n" % " ".join(self._command)
+            errorMessage += "\tcode: %d\n" % self.returnCode
+
+            if self._workingDirectory:
+                errorMessage += "\twork directory: %r\n" % self._workingDirectory
+
+            errorMessage += self.stderrStr
+
+            raise CommandFailedException(self, errorMessage)
+
     @property
     def returnCode(self):
         """
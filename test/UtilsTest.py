@@ -0,0 +1,29 @@
+import os
+
+from du.Utils import loadJsonFile, saveJsonFile
+from test.TestBase import TestBase
+
+
+class UtilsTest(TestBase):
+    def testJsonFile(self):
+        path = self.getTempPath("utils/json/state/file.json")
+        if os.path.exists(path):
+            os.remove(path)
+
+        # Missing
+        self.assertEqual(loadJsonFile(path, "state"), {})
+        self.assertEqual(loadJsonFile(path, "state", []), [])
+
+        saveJsonFile(path, {"key": [1, 2]})
+
+        self.assertEqual(loadJsonFile(path, "state"), {"key": [1, 2]})
+
+        # Nothing left behind
+        self.assertEqual(os.listdir(os.path.dirname(path)), ["file.json"])
+
+        # Corrupted
+        with open(path, "w") as fileObj:
+            fileObj.write("{")
+
+        with self.assertLogs("Utils", "WARNING"):
+            self.assertEqual(loadJsonFile(path, "state"), {})
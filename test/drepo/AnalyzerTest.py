@@ -0,0 +1,76 @@
+import os
+import shutil
+import subprocess
+from unittest import mock
+
+from du.drepo.ConnectionPool import ConnectionPool
+from du.drepo.manifest.Parser import Parser as ManifestParser
+from du.drepo.report.Analyzer import Analyzer
+from du.utils.ShellCommand import ShellCommand
+from test.TestBase import TestBase
+
+
+class AnalyzerTest(TestBase):
+    # Number of commits in the test history
+    NUM_COMMITS = 3000
+
+    def setUp(self):
+        self._root = os.path.dirname(self.getTempPath("analyzer/build/dummy"))
+
+        shutil.rmtree(self._root)
+
+        path = os.path.join(self._root, "a")
+
+        ShellCommand.execute(["git", "init", path])
+        ShellCommand.execute(
+            ["git", "symbolic-ref", "HEAD", "refs/heads/master"], workingDirectory=path
+        )
+
+        # Long history without any Change-IDs (e.g. not a Gerrit project)
+        ShellCommand.execute(
+            ["git", "fast-import", "--quiet"],
+            workingDirectory=path,
+            input="".join(
+                "commit refs/heads/master\n"
+                "committer test <test@test.com> %d +0000\n"
+                "data <<EOF\ncommit %d\nEOF\n\n" % (1700000000 + i, i)
+                for i in range(self.NUM_COMMITS)
+            ),
+        )
+
+        self._manifest = ManifestParser.parseString("""
+remotes = {
+    'remote' : 'ssh://server',
+}
+
+projects = [
+    {'name' : 'a', 'remote' : 'remote', 'path' : 'a', 'branch' : 'master'},
+]
+
+builds = {
+    'build' : {
+        'root' : '%s',
+    }
+}
+
+build = 'build'
+""" % self._root)
+
+    def testLongHistory(self):
+        popen = subprocess.Popen
+
+        # Every commit is reported as a non-Gerrit one
+        with mock.patch(
+            "subprocess.Popen", side_effect=popen
+        ) as popenMock, self.assertLogs("Analyzer", "WARNING"):
+            reportInfo = Analyzer.analyze(
+                self._manifest, {}, 3, connectionPool=ConnectionPool({})
+            )
+
+        # Entire history is read, without a git command per window
+        self.assertEqual(len(reportInfo.projects[0].commitsInfo), self.NUM_COMMITS)
+        self.assertEqual(
+            reportInfo.projects[0].commitsInfo[0].title,
+            "commit %d" % (self.NUM_COMMITS - 1),
+        )
+        self.assertLessEqual(popenMock.call_count, 10)
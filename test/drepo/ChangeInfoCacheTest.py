@@ -0,0 +1,72 @@
+import os
+import time
+
+from du.drepo.manifest.Project import Project
+from du.drepo.manifest.Remote import Remote
+from du.drepo.report.ChangeInfoCache import ChangeInfoCache
+from du.drepo.report.Types import GerritChangeInfo
+from du.gerrit.ChangeStatus import ChangeStatus
+from test.TestBase import TestBase
+
+
+class ChangeInfoCacheTest(TestBase):
+    def setUp(self):
+        self._projectA = Project(
+            "a", Remote("remote", "ssh://server"), "a", "master", []
+        )
+        self._projectB = Project("a", Remote("other", "ssh://other"), "a", "master", [])
+
+        self._cachePath = self.getTempPath("cache/report_cache.sqlite")
+        if os.path.exists(self._cachePath):
+            os.remove(self._cachePath)
+
+    def testCache(self):
+        merged = GerritChangeInfo(1, 2, ChangeStatus.MERGED, 2)
+        new = GerritChangeInfo(2, 1, ChangeStatus.NEW, 3)
+
+        cache = ChangeInfoCache(self._cachePath)
+        cache.put(self._projectA, "1111", merged)
+        cache.put(self._projectA, "2222", new)
+        cache.close()
+
+        cache = ChangeInfoCache(self._cachePath)
+        self.assertEqual(cache.get(self._projectA, "1111"), merged)
+        self.assertEqual(cache.get(self._projectA, "2222"), new)
+        self.assertEqual(cache.get(self._projectA, "3333"), None)
+
+        # Same project name on a different remote
+        self.assertEqual(cache.get(self._projectB, "1111"), None)
+        cache.close()
+
+        # Open changes expire, merged ones don't
+        cache = ChangeInfoCache(self._cachePath, openTtl=0)
+        time.sleep(0.01)
+        self.assertEqual(cache.get(self._projectA, "1111"), merged)
+        self.assertEqual(cache.get(self._projectA, "2222"), None)
+        cache.close()
+
+    def testCorrupted(self):
+        with open(self._cachePath, "w") as fileObj:
+            fileObj.write("corrupted")
+
+        # Started from scratch
+        cache = ChangeInfoCache(self._cachePath)
+        self.assertEqual(cache.get(self._projectA, "1111"), None)
+        cache.close()
+
+    def testConcurrent(self):
+        merged = GerritChangeInfo(1, 2, ChangeStatus.MERGED, 2)
+        new = GerritChangeInfo(2, 1, ChangeStatus.NEW, 3)
+
+        first = ChangeInfoCache(self._cachePath)
+        second = ChangeInfoCache(self._cachePath)
+
+        # Writes are visible to (and don't lock out) another open cache
+        first.putAll({(self._projectA, "1111"): merged})
+        self.assertEqual(second.get(self._projectA, "1111"), merged)
+
+        second.put(self._projectA, "2222", new)
+        self.assertEqual(first.get(self._projectA, "2222"), new)
+
+        first.close()
+        second.close()
@@ -0,0 +1,494 @@
+import os
+import shutil
+from unittest import mock
+
+from du.drepo.Commands import Commands, DownloadType, GitState
+from du.gerrit.rest.change.ChangeEndpoint import ChangeEndpoint
+from du.utils.ShellCommand import ShellCommand
+from test.TestBase import TestBase
+
+
+class CommandsTest(TestBase):
+    def testReadRemoteConfig(self):
+        path = os.path.dirname(self.getTempPath("commands/git/repository/dummy"))
+
+        shutil.rmtree(path)
+
+        ShellCommand.execute(["git", "init", path])
+
+        # Remote partially defined in an included file
+        with open(os.path.join(path, "remote.config"), "w") as fileObj:
+            fileObj.write("""[remote "origin"]
+	fetch = +refs/heads/*:refs/remotes/origin/*
+""")
+
+        with open(os.path.join(path, ".git", "config"), "a") as fileObj:
+            fileObj.write("""[REMOTE "upstream"]
+	url = ssh://server/other ; comment
+[Remote "origin"]
+	url = ssh://user@server:29418/project
+	promisor
+	partialCloneFilter = "blob:none"
+[include]
+	path = ../remote.config
+[branch "master"]
+	remote = origin
+""")
+
+        self.assertEqual(
+            Commands.readRemoteConfig(path, "origin"),
+            {
+                "url": "ssh://user@server:29418/project",
+                "fetch": "+refs/heads/*:refs/remotes/origin/*",
+                "promisor": None,
+                "partialclonefilter": "blob:none",
+            },
+        )
+
+        self.assertEqual(
+            Commands.readRemoteConfig(path, "upstream"),
+            {"url": "ssh://server/other"},
+        )
+
+        self.assertIsNone(Commands.readRemoteConfig(path, "missing"))
+
+    def testBundle(self):
+        sourcePath = os.path.dirname(self.getTempPath("commands/bundle/source/dummy"))
+        seededPath = os.path.dirname(self.getTempPath("commands/bundle/seeded/dummy"))
+        bundlePath = self.getTempPath("commands/bundle/bundles/project.bundle")
+
+        for path in (sourcePath, seededPath):
+            shutil.rmtree(path)
+
+        # Source repository with a base ref & a tag
+        ShellCommand.execute(["git", "init", sourcePath])
+        ShellCommand.execute(
+            [
+                "git",
+                "-c",
+                "user.name=test",
+                "-c",
+                "user.email=test@test.com",
+                "commit",
+                "--allow-empty",
+                "-m",
+                "base",
+            ],
+            workingDirectory=sourcePath,
+        )
+        ShellCommand.execute(["git", "tag", "v1.0"], workingDirectory=sourcePath)
+        ShellCommand.execute(
+            ["git", "update-ref", Commands.LOCAL_REFS_PREFIX + "base", "HEAD"],
+            workingDirectory=sourcePath,
+        )
+
+        self.assertTrue(
+            Commands.createBundle(
+                sourcePath, bundlePath, [Commands.LOCAL_REFS_PREFIX + "base"]
+            )
+        )
+
+        # New repository gets the objects, with the refs kept in a separate namespace
+        ShellCommand.execute(["git", "init", "--bare", seededPath])
+
+        self.assertTrue(Commands.seedFromBundle(seededPath, bundlePath))
+
+        self.assertEqual(
+            Commands.revParse(
+                seededPath,
+                [
+                    Commands.BUNDLE_REFS_PREFIX + "drepo/base",
+                    Commands.BUNDLE_REFS_PREFIX + "tags/v1.0^{commit}",
+                ],
+            ),
+            Commands.revParse(sourcePath, ["HEAD", "HEAD"]),
+        )
+
+        # Missing bundle is not an error
+        self.assertFalse(Commands.seedFromBundle(seededPath, bundlePath + ".missing"))
+
+        # Bundle refs are dropped once they're no longer needed
+        Commands.deleteBundleRefs(seededPath)
+
+        self.assertEqual(
+            ShellCommand.execute(
+                ["git", "for-each-ref", Commands.BUNDLE_REFS_PREFIX],
+                workingDirectory=seededPath,
+            ).stdoutStr,
+            "",
+        )
+
+    def testFilteredFetchRemotes(self):
+        sourcePath = os.path.dirname(self.getTempPath("commands/filter/source/dummy"))
+        mirrorPath = os.path.dirname(self.getTempPath("commands/filter/mirror/dummy"))
+        projectPaths = [
+            os.path.dirname(self.getTempPath("commands/filter/%s/dummy" % name))
+            for name in ("mirrored", "direct")
+        ]
+
+        for path in [sourcePath, mirrorPath] + projectPaths:
+            shutil.rmtree(path)
+
+        ShellCommand.execute(["git", "init", sourcePath])
+        with open(os.path.join(sourcePath, "file.txt"), "w") as fileObj:
+            fileObj.write("content")
+        ShellCommand.execute(["git", "add", "file.txt"], workingDirectory=sourcePath)
+        ShellCommand.execute(
+            [
+                "git",
+                "-c",
+                "user.name=test",
+                "-c",
+                "user.email=test@test.com",
+                "commit",
+                "-m",
+                "base",
+            ],
+            workingDirectory=sourcePath,
+        )
+        ShellCommand.execute(
+            ["git", "config", "uploadpack.allowFilter", "true"],
+            workingDirectory=sourcePath,
+        )
+
+        # Configured URL differs from the one we're fetching from (e.g. credentials), and must not be stored
+        remoteUrl = "file://" + sourcePath
+        fetchUrl = sourcePath
+        refs = [("HEAD", Commands.LOCAL_REFS_PREFIX + "base")]
+
+        Commands.updateMirror(
+            mirrorPath, remoteUrl, fetchUrl, 1, cloneFilter="blob:none"
+        )
+
+        # Project fetching from the mirror (objects come from alternates)
+        Commands.prepareGit(
+            projectPaths[0],
+            remoteUrl,
+            False,
+            referencePath=mirrorPath,
+            cloneFilter="blob:none",
+        )
+        Commands.fetchRefs(projectPaths[0], mirrorPath, refs, 1, ["--no-filter"])
+
+        # Project fetching from the remote directly
+        Commands.prepareGit(projectPaths[1], remoteUrl, False, cloneFilter="blob:none")
+        Commands.fetchRefs(
+            projectPaths[1],
+            Commands.REMOTE_NAME,
+            refs,
+            1,
+            ["--filter=blob:none"],
+            Commands.getUrlRewriteArgs(remoteUrl, fetchUrl),
+        )
+
+        for path in [mirrorPath] + projectPaths:
+            remoteConfig = ShellCommand.execute(
+                ["git", "config", "--get-regexp", r"^remote\."],
+                workingDirectory=path,
+            ).stdoutStr
+
+            # Only the named remote exists (no URL-named promisor remotes)
+            self.assertEqual(
+                {line.split(".")[1] for line in remoteConfig.splitlines()},
+                {Commands.REMOTE_NAME},
+            )
+            self.assertNotIn(" %s\n" % fetchUrl, remoteConfig)
+
+            self.assertEqual(
+                Commands.readRemoteConfig(path, Commands.REMOTE_NAME)["url"], remoteUrl
+            )
+
+    def testFetchOpenChangeRefs(self):
+        class Rest:
+            """
+            Serves a query result limited to two changes per request
+            """
+
+            def __init__(self):
+                self.requests = []
+
+            def get(self, params):
+                self.requests.append(params)
+
+                start = int(params.split("&S=")[1]) if "&S=" in params else 0
+
+                changes = [
+                    {
+                        "change_id": "I%040d" % number,
+                        "project": "project",
+                        "branch": "master",
+                        "_number": number,
+                        "status": "NEW",
+                        "current_revision": "%040d" % number,
+                        "revisions": {
+                            "%040d"
+                            % number: {
+                                "ref": "refs/changes/%02d/%d/1"
+                                % (number % 100, number),
+                                "_number": 1,
+                            }
+                        },
+                    }
+                    for number in range(100, 105)
+                ][start : start + 2]
+
+                if start + 2 < 5:
+                    changes[-1][ChangeEndpoint.KEY_MORE_CHANGES] = True
+
+                return changes
+
+        rest = Rest()
+
+        refs = Commands.fetchOpenChangeRefs(ChangeEndpoint(rest), ["project"])
+
+        self.assertEqual(len(rest.requests), 3)
+        self.assertEqual(
+            refs,
+            {
+                "project": [
+                    ("master", "refs/changes/%02d/%d/1" % (number % 100, number))
+                    for number in range(100, 105)
+                ]
+            },
+        )
+
+    def testFetchCurrentPatchsetRefs(self):
+        class Rest:
+            def __init__(self):
+                self.requests = []
+
+            def get(self, params):
+                self.requests.append(params)
+
+                return [
+                    {
+                        "change_id": "I%040d" % number,
+                        "project": "project",
+                        "branch": "master",
+                        "_number": number,
+                        "status": "NEW",
+                        "current_revision": "%040d" % number,
+                        "revisions": {
+                            "%040d"
+                            % number: {
+                                "ref": "refs/changes/%02d/%d/2"
+                                % (number % 100, number),
+                                "_number": 2,
+                            }
+                        },
+                    }
+                    for number in (1234, 1235)
+                ]
+
+        rest = Rest()
+
+        # Change numbers given as strings (e.g. from the manifest) match the numeric query results
+        refs = Commands.fetchCurrentPatchsetRefs(
+            ChangeEndpoint(rest),
+            [("project", "1234"), ("project", 1234), ("project", "I%040d" % 1235)],
+        )
+
+        self.assertEqual(len(rest.requests), 1)
+        self.assertEqual(
+            refs,
+            {
+                ("project", "1234"): "refs/changes/34/1234/2",
+                ("project", 1234): "refs/changes/34/1234/2",
+                ("project", "I%040d" % 1235): "refs/changes/35/1235/2",
+            },
+        )
+
+    def testPruneChangeRefs(self):
+        path = os.path.dirname(self.getTempPath("commands/prune/mirror/dummy"))
+
+        shutil.rmtree(path)
+
+        ShellCommand.execute(["git", "init", path])
+        ShellCommand.execute(
+            [
+                "git",
+                "-c",
+                "user.name=test",
+                "-c",
+                "user.email=test@test.com",
+                "commit",
+                "--allow-empty",
+                "-m",
+                "change",
+            ],
+            workingDirectory=path,
+        )
+
+        for ref in (
+            "refs/changes/01/101/1",
+            "refs/changes/01/101/2",
+            "refs/changes/02/102/1",
+            "refs/changes/03/103/1",
+            "refs/changes/03/103/2",
+            "refs/heads/other",
+        ):
+            ShellCommand.execute(
+                ["git", "update-ref", ref, "HEAD"], workingDirectory=path
+            )
+
+        # Older patchsets of open changes are kept, as well as refs which aren't patchsets
+        with mock.patch.object(
+            ShellCommand, "execute", wraps=ShellCommand.execute
+        ) as execute:
+            Commands.pruneChangeRefs(path, ["refs/changes/01/101/2"])
+
+        # Listed & deleted with a single command each
+        self.assertEqual(execute.call_count, 2)
+
+        self.assertEqual(
+            ShellCommand.execute(
+                [
+                    "git",
+                    "for-each-ref",
+                    "--format=%(refname)",
+                    "refs/changes/",
+                    "refs/heads/other",
+                ],
+                workingDirectory=path,
+            ).stdoutStr.split(),
+            [
+                "refs/changes/01/101/1",
+                "refs/changes/01/101/2",
+                "refs/heads/other",
+            ],
+        )
+
+    def testGetLocalStateUntracked(self):
+        path = os.path.dirname(self.getTempPath("commands/local_state/project/dummy"))
+
+        shutil.rmtree(path)
+
+        ShellCommand.execute(["git", "init", path])
+        with open(os.path.join(path, ".gitignore"), "w") as fileObj:
+            fileObj.write("*.o\n")
+        ShellCommand.execute(["git", "add", ".gitignore"], workingDirectory=path)
+        ShellCommand.execute(
+            [
+                "git",
+                "-c",
+                "user.name=test",
+                "-c",
+                "user.email=test@test.com",
+                "commit",
+                "-m",
+                "base",
+            ],
+            workingDirectory=path,
+        )
+
+        headHash = Commands.revParse(path, ["HEAD"])[0]
+
+        self.assertEqual(Commands.getLocalState(path, True), (headHash, False))
+
+        # Ignored file only matters if untracked files are looked for
+        with open(os.path.join(path, "build.o"), "w") as fileObj:
+            fileObj.write("object")
+
+        self.assertEqual(Commands.getLocalState(path), (headHash, False))
+        self.assertEqual(Commands.getLocalState(path, True), (headHash, True))
+
+    def testPrepareGit(self):
+        path = os.path.dirname(self.getTempPath("commands/prepare/project/dummy"))
+        remoteUrl = "ssh://server/project"
+
+        shutil.rmtree(path)
+
+        Commands.prepareGit(path, remoteUrl, True)
+
+        with open(os.path.join(path, ".gitignore"), "w") as fileObj:
+            fileObj.write("build/\n")
+        ShellCommand.execute(["git", "add", ".gitignore"], workingDirectory=path)
+        ShellCommand.execute(
+            [
+                "git",
+                "-c",
+                "user.name=test",
+                "-c",
+                "user.email=test@test.com",
+                "commit",
+                "-m",
+                "base",
+            ],
+            workingDirectory=path,
+        )
+
+        # Clean tree: probed & remote configuration read, nothing else
+        with mock.patch.object(
+            ShellCommand, "execute", wraps=ShellCommand.execute
+        ) as execute:
+            Commands.prepareGit(path, remoteUrl, True)
+
+        self.assertEqual(execute.call_count, 2)
+
+        # Ignored build output is cleaned, modifications reset
+        os.makedirs(os.path.join(path, "build", "output"))
+        with open(os.path.join(path, "build", "output", "file.o"), "w") as fileObj:
+            fileObj.write("object")
+        with open(os.path.join(path, ".gitignore"), "a") as fileObj:
+            fileObj.write("*.o\n")
+
+        self.assertEqual(
+            Commands.probeGit(path, True),
+            GitState(dirty=True, untracked=True, operationInProgress=False),
+        )
+
+        Commands.prepareGit(path, remoteUrl, True)
+
+        self.assertFalse(os.path.exists(os.path.join(path, "build")))
+        self.assertEqual(
+            Commands.probeGit(path, True),
+            GitState(dirty=False, untracked=False, operationInProgress=False),
+        )
+
+    def testApplyChangeCommitter(self):
+        path = os.path.dirname(self.getTempPath("commands/committer/project/dummy"))
+
+        shutil.rmtree(path)
+
+        ShellCommand.execute(["git", "init", path])
+
+        def commit(message):
+            with open(os.path.join(path, "file.txt"), "a") as fileObj:
+                fileObj.write(message + "\n")
+
+            ShellCommand.execute(["git", "add", "file.txt"], workingDirectory=path)
+            ShellCommand.execute(
+                [
+                    "git",
+                    "-c",
+                    "user.name=author",
+                    "-c",
+                    "user.email=author@test.com",
+                    "commit",
+                    "-m",
+                    message,
+                ],
+                workingDirectory=path,
+            )
+
+            return Commands.revParse(path, ["HEAD"])[0]
+
+        baseHash = commit("base")
+        changeHash = commit("change")
+
+        committer = ["committer", "committer@test.com", "1700000000 +0100"]
+
+        # Cherry-picking with the same committer reproduces the same commit
+        hashes = []
+        for _ in range(2):
+            ShellCommand.execute(
+                ["git", "checkout", "-q", "--detach", baseHash], workingDirectory=path
+            )
+
+            Commands.applyChange(path, changeHash, DownloadType.CHERRYPICK, committer)
+
+            hashes.append(Commands.revParse(path, ["HEAD"])[0])
+
+        self.assertNotEqual(hashes[0], changeHash)
+        self.assertEqual(hashes[0], hashes[1])
+        self.assertEqual(Commands.getCommitter(path), committer)
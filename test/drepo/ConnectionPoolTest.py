@@ -0,0 +1,24 @@
+import concurrent.futures
+
+from du.drepo.ConnectionPool import ConnectionPool
+from du.drepo.manifest.Remote import Remote
+from test.TestBase import TestBase
+
+
+class ConnectionPoolTest(TestBase):
+    def testShared(self):
+        pool = ConnectionPool({})
+
+        remoteA = Remote("a", "ssh://server:29418")
+        remoteB = Remote("b", "https://server", "ssh://server:29418")
+        remoteC = Remote("c", "ssh://other:29418")
+
+        # Remotes using the same server share a connection
+        self.assertIs(pool.get(remoteA), pool.get(remoteB))
+        self.assertIsNot(pool.get(remoteA), pool.get(remoteC))
+
+        # Even when requested concurrently
+        with concurrent.futures.ThreadPoolExecutor(max_workers=8) as executor:
+            connections = list(executor.map(pool.get, [remoteC] * 32))
+
+        self.assertTrue(all(conn is connections[0] for conn in connections))
@@ -1,15 +1,28 @@
+import fcntl
+import json
 import os
 import logging
+import re
+import subprocess
+import threading
 from test.TestBase import TestBase
 from urllib.parse import urlparse
 import tempfile
 import shutil
+from unittest import mock
 
+from du.drepo.Commands import Commands, DownloadType
+from du.drepo.App import main as AppMain
 from du.drepo.DRepo import DRepo, Credentials
+from du.drepo.ProjectStatus import ProjectStatus
+from du.drepo.RepositoryLock import RepositoryLock
+from du.drepo.Utils import Utils
+from du.gerrit.rest.change.ChangeEndpoint import ChangeEndpoint
+from du.gerrit.ssh.ConnectionManager import ConnectionManager
 from du.drepo.manifest.Parser import Parser as ManifestParser
 from du.drepo.report.HtmlGenerator import HtmlGenerator
 from du.drepo.report.VersionGenerator import VersionGenerator
-from du.utils.ShellCommand import ShellCommand
+from du.utils.ShellCommand import ShellCommand, CommandFailedException
 
 logger = logging.getLogger(__name__.split(".")[-1])
 
@@ -40,6 +53,9 @@ class DRepoTest(TestBase):
     # Test change number  env variable
     ENV_VAR_CHANGE_NUMBER = "DREPO_TEST_GERRIT_CHANGE_NUMBER"
 
+    # Change-ID of the local remote changes
+    CHANGE_ID = "I%040d" % 1
+
     def testClone(self):
         vectors = (
             # SSH vector
@@ -184,3 +200,714 @@ DREPO_SELECTED_BUILD = 'test_default_clone_build'
 
         # Cleanup
         shutil.rmtree(rootDir)
+
+    def testResumeRemovedProject(self):
+        rootDir = self.__createRootDir("resume_removed")
+        self.__createRemote(rootDir)
+        buildRoot = os.path.join(rootDir, "build_root")
+
+        drepo = DRepo(self.__createManifest(buildRoot))
+
+        with self.__gerritConnection():
+            drepo.sync()
+
+            # Project removed after the sync completed, the journal still says its refs were fetched
+            shutil.rmtree(os.path.join(buildRoot, "a"))
+
+            drepo.sync(resume=True)
+
+        self.assertEqual(
+            Commands.revParse(os.path.join(buildRoot, "a"), ["HEAD"]),
+            Commands.revParse(self.__getRemotePath("a"), ["master"]),
+        )
+
+    def testFastForwardSize(self):
+        rootDir = self.__createRootDir("fast_forward_size")
+        self.__createRemote(rootDir)
+        manifest = self.__createManifest(os.path.join(rootDir, "build_root"))
+
+        drepo = DRepo(manifest)
+
+        with self.__gerritConnection():
+            drepo.sync()
+
+            # Nothing known about incremental fetches yet
+            syncPlan = drepo.plan()
+            for project in manifest.projects:
+                self.assertIsNone(syncPlan.getAction(project).estimatedSize)
+
+            # New (incompressible) content on the remote master of "a"
+            workPath = os.path.join(rootDir, "work", "a")
+            self.__git(workPath, "reset", "--hard", "HEAD~1")
+            with open(os.path.join(workPath, "new.bin"), "wb") as fileObj:
+                fileObj.write(os.urandom(64 * 1024))
+            self.__git(workPath, "add", "new.bin")
+            self.__git(workPath, "commit", "-m", "new")
+            self.__git(workPath, "push", self.__getRemotePath("a"), "HEAD:master")
+
+            drepo.sync()
+
+            syncPlan = drepo.plan()
+
+        # Next incremental syncs are estimated by what the previous one fetched
+        sizes = {
+            project.name: syncPlan.getAction(project).estimatedSize
+            for project in manifest.projects
+        }
+        self.assertGreaterEqual(sizes["a.git"], 64 * 1024)
+        self.assertLess(sizes["b.git"], 64 * 1024)
+
+    def testSyncPlanRegistersRemotes(self):
+        rootDir = self.__createRootDir("sync_plan_remotes")
+        self.__createRemote(rootDir)
+        manifest = self.__createManifest(os.path.join(rootDir, "build_root"))
+
+        drepo = DRepo(manifest)
+
+        with self.__gerritConnection():
+            syncPlan = drepo.plan()
+
+            # Fetches of a plan created beforehand share the SSH connections as well (closed after the sync)
+            with mock.patch.object(
+                ConnectionManager, "register", autospec=True
+            ) as register:
+                drepo.sync(syncPlan=syncPlan)
+
+        self.assertEqual(
+            {call.args[1] for call in register.call_args_list},
+            {project.remoteUrl for project in manifest.projects},
+        )
+
+    def testSharedMaintenance(self):
+        rootDir = self.__createRootDir("shared_maintenance")
+        self.__createRemote(rootDir)
+        cacheDir = os.path.join(rootDir, "cache")
+        worktreeDir = os.path.join(rootDir, "worktrees")
+
+        # Repository path -> indication if it was locked while maintained
+        maintained = []
+
+        def runMaintenance(path, objectsDir):
+            with open(path + RepositoryLock.LOCK_FILE_SUFFIX, "a") as fileObj:
+                try:
+                    fcntl.flock(fileObj, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    maintained.append((path, True))
+                else:
+                    maintained.append((path, False))
+
+        with self.__gerritConnection(), mock.patch.object(
+            Commands, "runMaintenance", side_effect=runMaintenance
+        ):
+            for buildName in ("first", "second"):
+                drepo = DRepo(
+                    self.__createManifest(os.path.join(rootDir, buildName)),
+                    cacheDir=cacheDir,
+                )
+
+                drepo.sync(worktreeDir=worktreeDir, maintenanceJobs=2)
+
+        # Mirrors & primary repositories are maintained once (by the first build), while locked
+        self.assertEqual(len(maintained), 4)
+        self.assertTrue(all(locked for _, locked in maintained))
+        self.assertEqual(
+            {os.path.dirname(os.path.dirname(path)) for path, _ in maintained},
+            {cacheDir, worktreeDir},
+        )
+
+        # Their schedule is kept next to them
+        for scheduleDir in (cacheDir, worktreeDir):
+            self.assertTrue(
+                os.path.isfile(
+                    os.path.join(scheduleDir, DRepo.MAINTENANCE_SCHEDULE_FILE)
+                )
+            )
+
+    def testMirrorCache(self):
+        rootDir = self.__createRootDir("mirror_cache")
+        self.__createRemote(rootDir)
+        cacheDir = os.path.join(rootDir, "cache")
+
+        with self.__gerritConnection():
+            for buildName in ("first", "second"):
+                DRepo(
+                    self.__createManifest(os.path.join(rootDir, buildName)),
+                    cacheDir=cacheDir,
+                ).sync()
+
+        for name in ("a", "b"):
+            mirrorPath = os.path.join(cacheDir, "local", name + ".git")
+
+            # Bare mirror with all the branches & tags
+            self.assertEqual(
+                self.__git(mirrorPath, "rev-parse", "--is-bare-repository"), "true"
+            )
+            self.assertEqual(
+                Commands.revParse(mirrorPath, ["master", "v1.0"]),
+                Commands.revParse(self.__getRemotePath(name), ["master", "v1.0"]),
+            )
+
+            for buildName in ("first", "second"):
+                projectPath = os.path.join(rootDir, buildName, name)
+
+                # Objects are borrowed from the mirror, nothing is stored in the project itself
+                with open(
+                    os.path.join(projectPath, ".git", "objects", "info", "alternates")
+                ) as fileObj:
+                    self.assertEqual(
+                        fileObj.read().split(), [os.path.join(mirrorPath, "objects")]
+                    )
+
+                self.assertEqual(self.__countLocalObjects(projectPath), 0)
+
+                self.assertEqual(
+                    Commands.revParse(projectPath, ["HEAD"]),
+                    Commands.revParse(mirrorPath, ["master"]),
+                )
+
+    def testSingleFetch(self):
+        rootDir = self.__createRootDir("single_fetch")
+        self.__createRemote(rootDir)
+        buildRoot = os.path.join(rootDir, "build_root")
+
+        drepo = DRepo(
+            self.__createManifest(
+                buildRoot, "'cherrypicks': {'a.git': [101]}, 'pulls': {'b.git': 201}"
+            )
+        )
+
+        popen = subprocess.Popen
+
+        with self.__gerritConnection(), mock.patch(
+            "subprocess.Popen", side_effect=popen
+        ) as popenMock:
+            drepo.sync()
+
+        # Base, change & tags of each project are fetched at once
+        fetchPaths = [
+            call.kwargs["cwd"]
+            for call in popenMock.call_args_list
+            if "fetch" in call.args[0]
+        ]
+
+        self.assertEqual(
+            sorted(fetchPaths),
+            [os.path.join(buildRoot, name) for name in ("a", "b")],
+        )
+
+        for name in ("a", "b"):
+            projectPath = os.path.join(buildRoot, name)
+
+            # Change applied on top of the base, tags are there as well
+            self.assertEqual(
+                self.__git(projectPath, "log", "-1", "--format=%s"), "change"
+            )
+            self.assertEqual(
+                Commands.revParse(projectPath, ["HEAD~1", "v1.0"]),
+                Commands.revParse(self.__getRemotePath(name), ["master", "v1.0"]),
+            )
+
+    def testParallelForall(self):
+        rootDir = self.__createRootDir("parallel_forall")
+        self.__createRemote(rootDir)
+        buildRoot = os.path.join(rootDir, "build_root")
+        logDir = os.path.join(rootDir, "logs")
+
+        for name in ("a", "b"):
+            os.makedirs(os.path.join(buildRoot, name))
+
+        drepo = DRepo(self.__createManifest(buildRoot))
+
+        # Project "a" finishes last, "b" fails
+        command = [
+            "sh",
+            "-c",
+            'if [ "${PWD##*/}" = a ]; then sleep 0.5; echo a; else echo b; exit 3; fi',
+        ]
+
+        with self.assertLogs("DRepo", "INFO") as logs, self.assertRaises(
+            CommandFailedException
+        ):
+            drepo.execute(command, numThreads=2, keepGoing=True)
+
+        # Output of each project is reported at once, in the manifest order
+        outputs = [line for line in logs.output if "--->" in line]
+
+        self.assertEqual(len(outputs), 2)
+        self.assertTrue(outputs[0].endswith("'a' (code 0)\na"))
+        self.assertTrue(outputs[1].endswith("'b' (code 3)\nb"))
+
+        self.assertIn(
+            "INFO:DRepo:forall: 1 succeeded, 1 failed, 0 skipped", logs.output
+        )
+
+        # Or written to per-project log files
+        with self.assertRaises(CommandFailedException):
+            drepo.execute(command, numThreads=2, keepGoing=True, logDir=logDir)
+
+        for name in ("a", "b"):
+            with open(os.path.join(logDir, name + ".log"), "r") as fileObj:
+                self.assertEqual(fileObj.read(), name + "\n")
+
+        # Remaining projects are skipped after the first failure, unless asked to keep going
+        command[2] = command[2].replace("= a", "= b")
+
+        with self.assertLogs("DRepo", "INFO") as logs, self.assertRaises(
+            CommandFailedException
+        ):
+            drepo.execute(command, numThreads=1)
+
+        self.assertIn(
+            "INFO:DRepo:forall: 0 succeeded, 1 failed, 1 skipped", logs.output
+        )
+
+    def testWorktrees(self):
+        rootDir = self.__createRootDir("worktrees")
+        self.__createRemote(rootDir)
+        worktreeDir = os.path.join(rootDir, "worktrees")
+
+        with self.__gerritConnection():
+            DRepo(self.__createManifest(os.path.join(rootDir, "first"))).sync(
+                worktreeDir=worktreeDir
+            )
+
+            primaryObjects = {
+                name: self.__countLocalObjects(
+                    os.path.join(worktreeDir, "local", name + ".git")
+                )
+                for name in ("a", "b")
+            }
+
+            DRepo(self.__createManifest(os.path.join(rootDir, "second"))).sync(
+                worktreeDir=worktreeDir
+            )
+
+        for name in ("a", "b"):
+            primaryPath = os.path.join(worktreeDir, "local", name + ".git")
+
+            # New build didn't add any objects
+            self.assertEqual(
+                self.__countLocalObjects(primaryPath), primaryObjects[name]
+            )
+
+            for buildName in ("first", "second"):
+                projectPath = os.path.join(rootDir, buildName, name)
+
+                # Worktree of the primary repository, checked out at the base
+                self.assertTrue(os.path.isfile(os.path.join(projectPath, ".git")))
+                self.assertEqual(
+                    Commands.getCommonDir(Commands.getGitDir(projectPath)), primaryPath
+                )
+                self.assertEqual(
+                    Commands.revParse(projectPath, ["HEAD"]),
+                    Commands.revParse(self.__getRemotePath(name), ["master"]),
+                )
+
+            self.assertEqual(
+                [
+                    line.split()[1]
+                    for line in self.__git(
+                        primaryPath, "worktree", "list", "--porcelain"
+                    ).splitlines()
+                    if line.startswith("worktree ")
+                ][1:],
+                [
+                    os.path.join(rootDir, buildName, name)
+                    for buildName in ("first", "second")
+                ],
+            )
+
+    def testPrefetch(self):
+        rootDir = self.__createRootDir("prefetch")
+        self.__createRemote(rootDir)
+        cacheDir = os.path.join(rootDir, "cache")
+
+        drepo = DRepo(
+            self.__createManifest(os.path.join(rootDir, "build_root")),
+            cacheDir=cacheDir,
+        )
+
+        def getMirrorRefs(name):
+            return self.__git(
+                os.path.join(cacheDir, "local", name + ".git"),
+                "for-each-ref",
+                "--format=%(refname)",
+            ).split()
+
+        with self.__gerritConnection():
+            drepo.prefetch(numThreads=2, numRounds=1)
+
+            # Branches, tags & open changes
+            self.assertEqual(
+                getMirrorRefs("a"),
+                ["refs/changes/01/101/1", "refs/heads/master", "refs/tags/v1.0"],
+            )
+            self.assertEqual(
+                getMirrorRefs("b"),
+                ["refs/changes/01/201/1", "refs/heads/master", "refs/tags/v1.0"],
+            )
+
+            # Changes which are no longer open are pruned
+            self.__gerrit.changes[0]["status"] = "MERGED"
+
+            drepo.prefetch(numThreads=2, numRounds=1)
+
+        self.assertEqual(getMirrorRefs("a"), ["refs/heads/master", "refs/tags/v1.0"])
+        self.assertEqual(
+            getMirrorRefs("b"),
+            ["refs/changes/01/201/1", "refs/heads/master", "refs/tags/v1.0"],
+        )
+
+        self.assertTrue(
+            os.path.isfile(os.path.join(cacheDir, DRepo.PREFETCH_HISTORY_FILE))
+        )
+
+    def testCiChange(self):
+        rootDir = self.__createRootDir("ci_change")
+        self.__createRemote(rootDir)
+        buildRoot = os.path.join(rootDir, "build_root")
+
+        # Both remotes have to be queried at the same time for the CI queries to get through
+        barrier = threading.Barrier(2, timeout=10)
+        get = self.__gerrit.get
+
+        def getConcurrently(params):
+            if params.startswith(ChangeEndpoint.ENDPOINT + "?q=%s&" % self.CHANGE_ID):
+                barrier.wait()
+
+            return get(params)
+
+        self.__gerrit.get = getConcurrently
+
+        drepo = DRepo(
+            self.__createManifest(buildRoot),
+            ciChange=self.CHANGE_ID,
+            ciType=DownloadType.CHERRYPICK,
+        )
+
+        with self.__gerritConnection(), self.assertLogs("DRepo", "INFO") as logs:
+            drepo.sync()
+
+        # Change found on both remotes, and applied to both projects
+        for name in ("a", "b"):
+            self.assertEqual(
+                self.__git(os.path.join(buildRoot, name), "log", "-1", "--format=%s"),
+                "change",
+            )
+
+        # Query duration of each remote is reported
+        self.assertTrue(
+            any(
+                re.search(r"CI discovery: [\d.]+s \(one: [\d.]+s, two: [\d.]+s\)", line)
+                for line in logs.output
+            )
+        )
+
+    def testCiChangeNoProjects(self):
+        rootDir = self.__createRootDir("ci_change_no_projects")
+        buildRoot = os.path.join(rootDir, "build_root")
+
+        manifest = ManifestParser.parseString("""
+remotes = {}
+
+projects = []
+
+builds = {"main": {"root": "%s"}}
+
+build = "main"
+""" % buildRoot)
+
+        # Nothing to look the change up on, so nothing to sync
+        syncPlan = DRepo(
+            manifest, ciChange=self.CHANGE_ID, ciType=DownloadType.CHERRYPICK
+        ).plan()
+
+        self.assertEqual(syncPlan.projectsToProcess, [])
+        self.assertEqual(syncPlan.ciTimings, {})
+
+    def testStatus(self):
+        rootDir = self.__createRootDir("status")
+        self.__createRemote(rootDir)
+        buildRoot = os.path.join(rootDir, "build_root")
+        jsonPath = os.path.join(rootDir, "status.json")
+
+        manifestSource = self.__createManifestSource(
+            buildRoot, "'cherrypicks': {'a.git': [101]}"
+        )
+
+        with self.__gerritConnection():
+            DRepo(ManifestParser.parseString(manifestSource)).sync()
+
+        # Local commit, modified & untracked files
+        projectPath = os.path.join(buildRoot, "b")
+
+        with open(os.path.join(projectPath, "local.txt"), "w") as fileObj:
+            fileObj.write("local")
+        self.__git(projectPath, "add", "local.txt")
+        self.__git(projectPath, "commit", "-m", "local")
+        self.__git(projectPath, "checkout", "--detach")
+
+        with open(os.path.join(projectPath, "local.txt"), "w") as fileObj:
+            fileObj.write("modified")
+        for fileName in ("x.txt", "y.txt"):
+            with open(os.path.join(projectPath, fileName), "w") as fileObj:
+                fileObj.write("untracked")
+
+        with self.assertLogs("App", "INFO") as logs:
+            self.assertEqual(
+                self.callAppMain(
+                    AppMain,
+                    "-manifest_source",
+                    manifestSource,
+                    "-status",
+                    "-status_json",
+                    jsonPath,
+                    "-j",
+                    "2",
+                ),
+                0,
+            )
+
+        headHashes = [
+            Commands.revParse(os.path.join(buildRoot, name), ["HEAD"])[0]
+            for name in ("a", "b")
+        ]
+
+        with open(jsonPath, "r") as fileObj:
+            self.assertEqual(
+                json.load(fileObj),
+                [
+                    {
+                        "name": "a.git",
+                        "path": "a",
+                        "exists": True,
+                        "head": headHashes[0],
+                        "branch": "master",
+                        "numChanged": 0,
+                        "numUntracked": 0,
+                        "numAhead": 1,
+                        "numChanges": 1,
+                        "synced": True,
+                        "dirty": False,
+                    },
+                    {
+                        "name": "b.git",
+                        "path": "b",
+                        "exists": True,
+                        "head": headHashes[1],
+                        "branch": None,
+                        "numChanged": 1,
+                        "numUntracked": 2,
+                        "numAhead": 1,
+                        "numChanges": 0,
+                        "synced": False,
+                        "dirty": True,
+                    },
+                ],
+            )
+
+        table = next(line for line in logs.output if "status:" in line).split("\n")[1:]
+
+        self.assertEqual(
+            [row.split() for row in table],
+            [
+                ProjectStatus.TABLE_HEADER,
+                ["a", "master", headHashes[0][:12], "0", "0", "1", "yes"],
+                ["b", "(detached)", headHashes[1][:12], "1", "2", "1", "no"],
+            ],
+        )
+
+    def __createRootDir(self, name):
+        """
+        Create an empty temporary directory
+
+        @param name Directory name
+        @return directory path
+        """
+
+        rootDir = os.path.dirname(self.getTempPath("drepo/%s/dummy" % name))
+
+        shutil.rmtree(rootDir)
+        os.makedirs(rootDir)
+
+        return rootDir
+
+    def __git(self, path, *args):
+        """
+        Run a git command
+
+        @param path Working directory
+        @param args Git arguments
+        @return standard output (stripped)
+        """
+
+        return ShellCommand.execute(
+            ["git", "-c", "user.name=test", "-c", "user.email=test@test.com"]
+            + list(args),
+            workingDirectory=path,
+        ).stdoutStr.strip()
+
+    def __countLocalObjects(self, path):
+        """
+        Count objects stored in a repository itself (not borrowed via alternates)
+
+        @param path Repository path
+        @return number of loose & packed objects
+        """
+
+        counts = dict(
+            line.split(": ")
+            for line in self.__git(path, "count-objects", "-v").splitlines()
+        )
+
+        return int(counts["count"]) + int(counts["in-pack"])
+
+    def __createRemote(self, rootDir):
+        """
+        Create a local remote with projects "a" and "b", each with two commits & a tag on master, and an open change
+        on top of master (shared Change-ID, see DRepoTest.CHANGE_ID). Gerrit information of the changes is served by
+        DRepoTest.__gerritConnection
+
+        @param rootDir Directory in which the remote is created
+        """
+
+        self.__remoteDir = os.path.join(rootDir, "remote")
+
+        changes = []
+
+        for name, changeNumber in (("a", 101), ("b", 201)):
+            workPath = os.path.join(rootDir, "work", name)
+
+            ShellCommand.execute(["git", "init", "-b", "master", workPath])
+
+            self.__git(workPath, "commit", "--allow-empty", "-m", "first")
+            self.__git(workPath, "tag", "-a", "-m", "v1.0", "v1.0")
+            self.__git(workPath, "commit", "--allow-empty", "-m", "second")
+
+            self.__git(rootDir, "clone", "--bare", workPath, self.__getRemotePath(name))
+
+            with open(os.path.join(workPath, "change.txt"), "w") as fileObj:
+                fileObj.write(name)
+            self.__git(workPath, "add", "change.txt")
+            self.__git(
+                workPath, "commit", "-m", "change\n\nChange-Id: %s" % self.CHANGE_ID
+            )
+
+            changeRef = "refs/changes/%02d/%d/1" % (changeNumber % 100, changeNumber)
+
+            self.__git(
+                workPath, "push", self.__getRemotePath(name), "HEAD:" + changeRef
+            )
+
+            revision = self.__git(workPath, "rev-parse", "HEAD")
+
+            changes.append(
+                {
+                    "change_id": self.CHANGE_ID,
+                    "project": name + ".git",
+                    "branch": "master",
+                    "_number": changeNumber,
+                    "status": "NEW",
+                    "current_revision": revision,
+                    "revisions": {revision: {"ref": changeRef, "_number": 1}},
+                }
+            )
+
+        self.__gerrit = GerritRest(changes)
+
+    def __getRemotePath(self, name):
+        """
+        Get the path of a remote project
+
+        @param name Project name (without the .git suffix)
+        @return repository path
+        """
+
+        return os.path.join(self.__remoteDir, name + ".git")
+
+    def __gerritConnection(self):
+        """
+        Context in which all the Gerrit queries are served by the local remote (see DRepoTest.__createRemote)
+        """
+
+        return mock.patch.object(
+            Utils, "createQueryConnection", return_value=ChangeEndpoint(self.__gerrit)
+        )
+
+    def __createManifest(self, buildRoot, build=""):
+        """
+        Create a manifest of the local remote projects (each one on a remote of its own)
+
+        @param buildRoot Build root
+        @param build Additional build ("main") configuration
+        @return manifest
+        """
+
+        return ManifestParser.parseString(self.__createManifestSource(buildRoot, build))
+
+    def __createManifestSource(self, buildRoot, build=""):
+        """
+        Create a manifest source of the local remote projects (see DRepoTest.__createManifest)
+
+        @param buildRoot Build root
+        @param build Additional build ("main") configuration
+        @return manifest source
+        """
+
+        return """
+remotes = {"one": "file://%s", "two": "file://%s"}
+
+projects = [
+    {"name": "a.git", "remote": "one", "path": "a", "branch": "master"},
+    {"name": "b.git", "remote": "two", "path": "b", "branch": "master"},
+]
+
+builds = {"main": {"root": "%s", %s}}
+
+build = "main"
+""" % (
+            self.__remoteDir,
+            self.__remoteDir,
+            buildRoot,
+            build,
+        )
+
+
+class GerritRest:
+    """
+    Gerrit REST API serving a fixed set of changes (supports change, Change-ID and open changes of project queries)
+    """
+
+    def __init__(self, changes):
+        """
+        Constructor
+
+        @param changes List of change JSON objects
+        """
+
+        self.changes = changes
+        self.requests = []
+
+    def get(self, params):
+        self.requests.append(params)
+
+        terms = params.split("?q=")[1].split("&")[0].split("+")
+
+        projects = [
+            term.split(":", 1)[1] for term in terms if term.startswith("project:")
+        ]
+
+        if projects:
+            return [
+                change
+                for change in self.changes
+                if change["project"] in projects and change["status"] == "NEW"
+            ]
+
+        terms = {term.split(":", 1)[-1] for term in terms}
+
+        return [
+            change
+            for change in self.changes
+            if change["change_id"] in terms or str(change["_number"]) in terms
+        ]
@@ -0,0 +1,60 @@
+import os
+
+from du.drepo.MaintenanceSchedule import MaintenanceSchedule
+from test.TestBase import TestBase
+
+
+class MaintenanceScheduleTest(TestBase):
+    def setUp(self):
+        self._schedulePath = self.getTempPath("maintenance/maintenance.json")
+        if os.path.exists(self._schedulePath):
+            os.remove(self._schedulePath)
+
+        self._objectsDir = os.path.dirname(
+            self.getTempPath("maintenance/objects/pack/dummy")
+        )
+        for i in os.listdir(self._objectsDir):
+            os.remove(os.path.join(self._objectsDir, i))
+
+        self._objectsDir = os.path.dirname(self._objectsDir)
+
+    def testSchedule(self):
+        schedule = MaintenanceSchedule(self._schedulePath, maxPacks=2)
+
+        # Never maintained
+        self.assertTrue(schedule.isDue(self._objectsDir))
+
+        schedule.update(self._objectsDir)
+        schedule.save()
+
+        # Reload from disk
+        schedule = MaintenanceSchedule(self._schedulePath, maxPacks=2)
+        self.assertFalse(schedule.isDue(self._objectsDir))
+
+        # Too many packs
+        for i in range(2):
+            with open(os.path.join(self._objectsDir, "pack", "pack-%d.pack" % i), "w"):
+                pass
+
+        self.assertTrue(schedule.isDue(self._objectsDir))
+
+        # Interval expired
+        schedule = MaintenanceSchedule(self._schedulePath, interval=0, maxPacks=100)
+        self.assertTrue(schedule.isDue(self._objectsDir))
+
+    def testSharedSave(self):
+        otherObjectsDir = os.path.join(os.path.dirname(self._objectsDir), "other")
+
+        # Both loaded before either one was saved
+        first = MaintenanceSchedule(self._schedulePath)
+        second = MaintenanceSchedule(self._schedulePath)
+
+        first.update(self._objectsDir)
+        first.save()
+
+        second.update(otherObjectsDir)
+        second.save()
+
+        schedule = MaintenanceSchedule(self._schedulePath)
+        self.assertFalse(schedule.isDue(self._objectsDir))
+        self.assertFalse(schedule.isDue(otherObjectsDir))
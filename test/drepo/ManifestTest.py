@@ -346,3 +346,49 @@ build = 'main'
             manifest.selectedBuild.tags, {manifest.projects[0]: "tag_name"}
         )
         self.assertEqual(manifest.selectedBuild.root, "build/root")
+
+    def testPartialClone(self):
+        test = """
+remotes = {
+    'iwedia' : 'ssh://dummy@gerrit.iwedia.com:29418'
+}
+
+builds = {
+    'main' : {
+        'root' : 'build/root'
+    }
+}
+
+projects = [
+    {
+        'name' : 'libiwu',
+        'remote' : 'iwedia',
+        'path' : 'project_path',
+        'branch' : 'master',
+        'clone_filter' : 'blob:none',
+        'sparse_paths' : ['src', 'include'],
+    },
+    {
+        'name' : 'libiwu2',
+        'remote' : 'iwedia',
+        'path' : 'project_path2',
+        'branch' : 'master',
+    }
+]
+
+build = 'main'
+"""
+
+        manifest = Parser.parseString(test)
+
+        self.assertEqual(manifest.projects[0].cloneFilter, "blob:none")
+        self.assertEqual(manifest.projects[0].sparsePaths, ["src", "include"])
+
+        self.assertEqual(manifest.projects[1].cloneFilter, None)
+        self.assertEqual(manifest.projects[1].sparsePaths, None)
+
+        with self.assertRaises(ManifestParseError) as context:
+            Parser.parseString(test.replace("blob:none", "blob:all"))
+
+        with self.assertRaises(ManifestParseError) as context:
+            Parser.parseString(test.replace("['src', 'include']", "['src', 1]"))
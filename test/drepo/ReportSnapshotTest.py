@@ -0,0 +1,59 @@
+from du.drepo.manifest.Parser import Parser as ManifestParser
+from du.drepo.report.ReportSnapshot import ReportSnapshot
+from du.drepo.report.Types import *
+from du.gerrit.ChangeStatus import ChangeStatus
+from test.TestBase import TestBase
+
+
+class ReportSnapshotTest(TestBase):
+    def setUp(self):
+        self._manifest = ManifestParser.parseString("""
+remotes = {
+    'remote' : 'ssh://server',
+}
+
+projects = [
+    {'name' : 'a', 'remote' : 'remote', 'path' : 'a', 'branch' : 'master'},
+    {'name' : 'b', 'remote' : 'remote', 'path' : 'b', 'branch' : 'master'},
+]
+
+builds = {
+    'build' : {
+        'root' : '/root/build',
+    }
+}
+
+build = 'build'
+""")
+
+    def testSaveLoad(self):
+        projectA, projectB = self._manifest.projects
+
+        reportInfo = ReportInfo(
+            self._manifest,
+            [
+                ProjectInfo(
+                    projectA,
+                    TagInfo("1234", None, None, "v1.0-1-g1234", "v1.0"),
+                    [
+                        CommitInfo("title", "1234abcd", "1234", "author", None),
+                        CommitInfo(
+                            "merged",
+                            "5678abcd",
+                            "5678",
+                            "author",
+                            GerritChangeInfo(1, 2, ChangeStatus.MERGED, 3),
+                        ),
+                    ],
+                ),
+                ProjectInfo(projectB, TagInfo("4321", None, "v2", None, None), []),
+            ],
+            "host",
+            "user",
+        )
+
+        path = self.getTempPath("snapshot/report.json")
+
+        ReportSnapshot.save(reportInfo, path)
+
+        self.assertEqual(ReportSnapshot.load(self._manifest, path), reportInfo)
@@ -0,0 +1,31 @@
+import os
+import threading
+
+from du.drepo.RepositoryLock import RepositoryLock
+from test.TestBase import TestBase
+
+
+class RepositoryLockTest(TestBase):
+    def testExclusive(self):
+        path = os.path.dirname(self.getTempPath("repository_lock/mirror.git/dummy"))
+
+        events = []
+
+        # Separate instances lock the file separately, same as separate processes would
+        def lock():
+            with RepositoryLock(path):
+                events.append("other")
+
+        with RepositoryLock(path):
+            thread = threading.Thread(target=lock)
+            thread.start()
+
+            thread.join(0.2)
+            self.assertTrue(thread.is_alive())
+
+            events.append("first")
+
+        thread.join()
+
+        self.assertEqual(events, ["first", "other"])
+        self.assertTrue(os.path.isfile(path + RepositoryLock.LOCK_FILE_SUFFIX))
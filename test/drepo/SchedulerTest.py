@@ -0,0 +1,77 @@
+import os
+
+from du.drepo.Scheduler import Scheduler
+from du.drepo.SyncHistory import SyncHistory
+from du.drepo.manifest.Project import Project
+from du.drepo.manifest.Remote import Remote
+from test.TestBase import TestBase
+
+
+class SchedulerTest(TestBase):
+    def setUp(self):
+        self._remote1 = Remote("remote1", "ssh://server1")
+        self._remote2 = Remote("remote2", "ssh://server2")
+
+        self._small = Project("small", self._remote1, "small", "master", [])
+        self._large = Project("large", self._remote1, "large", "master", [])
+        self._medium = Project("medium", self._remote2, "medium", "master", [])
+        self._new = Project("new", self._remote2, "new", "master", [])
+
+        self._historyPath = self.getTempPath("scheduler/history.json")
+        if os.path.exists(self._historyPath):
+            os.remove(self._historyPath)
+
+    def testHistory(self):
+        history = SyncHistory(self._historyPath)
+        self.assertIsNone(history.estimate(self._small))
+
+        history.update(self._small, 10)
+        history.update(self._small, 20)
+        history.save()
+
+        # Reload from disk
+        history = SyncHistory(self._historyPath)
+        self.assertEqual(history.estimate(self._small), 15)
+
+    def testLargestFirst(self):
+        history = SyncHistory(self._historyPath)
+        history.update(self._small, 1)
+        history.update(self._large, 100)
+        history.update(self._medium, 10)
+
+        scheduler = Scheduler(
+            [self._small, self._medium, self._large, self._new], history
+        )
+
+        order = []
+        while True:
+            project = scheduler.acquire()
+            if not project:
+                break
+
+            order.append(project)
+            scheduler.release(project)
+
+        # Unknown projects are treated as the most expensive ones
+        self.assertEqual(order, [self._large, self._new, self._medium, self._small])
+
+    def testRemoteLimit(self):
+        history = SyncHistory(self._historyPath)
+        history.update(self._large, 100)
+        history.update(self._small, 50)
+        history.update(self._medium, 10)
+
+        scheduler = Scheduler(
+            [self._small, self._medium, self._large], history, maxPerRemote=1
+        )
+
+        # Second project from the first remote has to wait, so the other remote gets a slot
+        self.assertEqual(scheduler.acquire(), self._large)
+        self.assertEqual(scheduler.acquire(), self._medium)
+
+        scheduler.release(self._large)
+        self.assertEqual(scheduler.acquire(), self._small)
+
+        scheduler.release(self._medium)
+        scheduler.release(self._small)
+        self.assertIsNone(scheduler.acquire())
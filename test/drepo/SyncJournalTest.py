@@ -0,0 +1,61 @@
+import os
+
+from du.drepo.SyncJournal import SyncJournal
+from du.drepo.ProjectPlan import ProjectPlan
+from du.drepo.manifest.Project import Project
+from du.drepo.manifest.Remote import Remote
+from test.TestBase import TestBase
+
+
+class SyncJournalTest(TestBase):
+    def setUp(self):
+        remote = Remote("remote", "ssh://server")
+
+        self._projectA = Project("a", remote, "a", "master", [])
+        self._projectB = Project("b", remote, "b", "master", [])
+
+        self._planA = self.__createPlan(self._projectA, "refs/heads/master")
+        self._planB = self.__createPlan(self._projectB, "refs/heads/master")
+
+        self._journalPath = self.getTempPath("journal/sync_journal.jsonl")
+        if os.path.exists(self._journalPath):
+            os.remove(self._journalPath)
+
+    def testResume(self):
+        journal = SyncJournal(self._journalPath)
+        journal.record(self._planA, SyncJournal.STEP_PREPARED)
+        journal.record(self._planA, SyncJournal.STEP_FETCHED)
+        journal.record(self._planA, SyncJournal.STEP_APPLIED, "1234")
+        journal.record(self._planB, SyncJournal.STEP_PREPARED)
+        journal.close()
+
+        # Simulate a sync interrupted while writing
+        with open(self._journalPath, "a") as fileObj:
+            fileObj.write('{"path": "b", "st')
+
+        journal = SyncJournal(self._journalPath, resume=True)
+
+        step, entry = journal.lastStep(self._planA)
+        self.assertEqual(step, SyncJournal.STEP_APPLIED)
+        self.assertEqual(entry[SyncJournal.KEY_HEAD_HASH], "1234")
+
+        step, entry = journal.lastStep(self._planB)
+        self.assertEqual(step, SyncJournal.STEP_PREPARED)
+
+        # Different inputs can't be resumed
+        step, entry = journal.lastStep(
+            self.__createPlan(self._projectA, "refs/tags/v1.0")
+        )
+        self.assertIsNone(step)
+
+        journal.close()
+
+        # Journal is discarded if not resuming
+        journal = SyncJournal(self._journalPath)
+        self.assertEqual(journal.lastStep(self._planA), (None, None))
+        journal.close()
+
+    def __createPlan(self, project, baseRef):
+        return ProjectPlan(
+            project, project.path, baseRef, None, [], None, False, None, None
+        )
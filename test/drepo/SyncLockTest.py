@@ -0,0 +1,75 @@
+import os
+
+from du.drepo.Commands import DownloadType
+from du.drepo.SyncLock import SyncLock
+from du.drepo.ProjectPlan import ProjectPlan, ChangeDownload
+from du.drepo.manifest.Project import Project
+from du.drepo.manifest.Remote import Remote
+from test.TestBase import TestBase
+
+
+class SyncLockTest(TestBase):
+    def setUp(self):
+        remote = Remote("remote", "ssh://server")
+
+        self._project = Project("a", remote, "path/a", "master", [])
+        self._unlocked = Project("b", remote, "path/b", "master", [])
+
+        self._lockPath = self.getTempPath("lock/build.lock")
+        if os.path.exists(self._lockPath):
+            os.remove(self._lockPath)
+
+    def testSaveLoad(self):
+        plan = ProjectPlan(
+            self._project,
+            "/root/path/a",
+            "refs/heads/master",
+            "master",
+            [ChangeDownload(1234, "refs/changes/34/1234/2", DownloadType.CHERRYPICK)],
+            None,
+            False,
+            None,
+            None,
+        )
+
+        lock = SyncLock("main")
+        lock.add(
+            plan,
+            "1" * 40,
+            "3" * 40,
+            ["2" * 40],
+            [["name", "name@test.com", "1700000000 +0100"]],
+        )
+        lock.save(self._lockPath)
+
+        lock = SyncLock.load(self._lockPath)
+        self.assertEqual(lock.buildName, "main")
+        self.assertIsNone(lock.get(self._unlocked))
+
+        entry = lock.get(self._project)
+        self.assertEqual(entry[SyncLock.KEY_BASE_HASH], "1" * 40)
+        self.assertEqual(entry[SyncLock.KEY_HEAD_HASH], "3" * 40)
+        self.assertEqual(entry[SyncLock.KEY_BASE_BRANCH], "master")
+        self.assertEqual(
+            entry[SyncLock.KEY_CHANGES],
+            [
+                {
+                    SyncLock.KEY_CHANGE: 1234,
+                    SyncLock.KEY_REF: "refs/changes/34/1234/2",
+                    SyncLock.KEY_HASH: "2" * 40,
+                    SyncLock.KEY_DOWNLOAD_TYPE: DownloadType.CHERRYPICK.value,
+                    SyncLock.KEY_COMMITTER: [
+                        "name",
+                        "name@test.com",
+                        "1700000000 +0100",
+                    ],
+                }
+            ],
+        )
+
+    def testInvalid(self):
+        with open(self._lockPath, "w") as fileObj:
+            fileObj.write("{")
+
+        with self.assertRaises(RuntimeError):
+            SyncLock.load(self._lockPath)
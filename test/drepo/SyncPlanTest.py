@@ -0,0 +1,103 @@
+from du.drepo.Commands import DownloadType
+from du.drepo.ProjectPlan import ProjectPlan, ChangeDownload, ProjectAction
+from du.drepo.SyncPlan import SyncPlan
+from du.drepo.manifest.Project import Project
+from du.drepo.manifest.Remote import Remote
+from test.TestBase import TestBase
+
+
+class SyncPlanTest(TestBase):
+    def setUp(self):
+        remote = Remote("remote", "ssh://server")
+
+        self._projectA = Project("a", remote, "a", "master", [])
+        self._projectB = Project("b", remote, "b", "master", [])
+
+        self._plans = {
+            self._projectA: ProjectPlan(
+                self._projectA,
+                "/root/a",
+                "refs/heads/master",
+                "master",
+                [
+                    ChangeDownload(1, "refs/changes/01/1/1", DownloadType.CHERRYPICK),
+                    ChangeDownload(2, "refs/changes/02/2/3", DownloadType.CHERRYPICK),
+                ],
+                None,
+                False,
+                None,
+                None,
+            ),
+            self._projectB: ProjectPlan(
+                self._projectB,
+                "/root/b",
+                "refs/heads/master",
+                "master",
+                [],
+                None,
+                False,
+                None,
+                None,
+            ),
+        }
+
+    def testPlan(self):
+        syncPlan = SyncPlan(
+            "build",
+            "/root",
+            self._plans,
+            {
+                self._projectA: ProjectAction(
+                    SyncPlan.ACTION_FULL_FETCH, None, 3 * 1024 * 1024, 10.0
+                ),
+                self._projectB: ProjectAction(
+                    SyncPlan.ACTION_SKIP, "up to date", 0, 2.0
+                ),
+            },
+        )
+
+        # Skipped projects are not processed
+        self.assertEqual(syncPlan.projectsToProcess, [self._projectA])
+
+        lines = syncPlan.formatTable().splitlines()
+
+        self.assertEqual(len(lines), 4)
+        self.assertEqual(
+            lines[1].split(),
+            [
+                "a",
+                "full",
+                "fetch",
+                "refs/heads/master",
+                "2",
+                "cherrypick",
+                "3.0MiB",
+                "10.0s",
+            ],
+        )
+        self.assertEqual(
+            lines[2].split(),
+            [
+                "b",
+                "no-op",
+                "(up",
+                "to",
+                "date)",
+                "refs/heads/master",
+                "-",
+                "0B",
+                "2.0s",
+            ],
+        )
+
+        # Skipped projects don't add to the estimated duration
+        self.assertEqual(
+            lines[3],
+            "2 project(s): 1 no-op, 1 full fetch; estimated size 3.0MiB, estimated duration 10.0s (sequential)",
+        )
+
+    def testFormatSize(self):
+        self.assertEqual(SyncPlan.formatSize(None), "?")
+        self.assertEqual(SyncPlan.formatSize(512), "512B")
+        self.assertEqual(SyncPlan.formatSize(1536), "1.5KiB")
+        self.assertEqual(SyncPlan.formatSize(5 * 1024 * 1024 * 1024), "5.0GiB")
@@ -0,0 +1,49 @@
+import json
+
+from du.drepo.SyncTelemetry import SyncTelemetry
+from du.drepo.manifest.Project import Project
+from du.drepo.manifest.Remote import Remote
+from test.TestBase import TestBase
+
+
+class SyncTelemetryTest(TestBase):
+    def setUp(self):
+        remote = Remote("remote", "ssh://server")
+
+        self._projectA = Project("a", remote, "a", "master", [])
+        self._projectB = Project("b", remote, "b", "master", [])
+
+    def testRecords(self):
+        telemetry = SyncTelemetry()
+
+        telemetry.record(None, "queries", 0, 1.0)
+        telemetry.record(None, "queries", 2, 0.5)
+        telemetry.record(self._projectA, SyncTelemetry.PHASE_FETCH, 1, 3.0)
+        telemetry.record(self._projectB, SyncTelemetry.PHASE_FETCH, 1, 1.0)
+        telemetry.record(self._projectB, SyncTelemetry.PHASE_APPLY, 2, 0.5)
+
+        with telemetry.measure(self._projectB, SyncTelemetry.PHASE_STATE):
+            pass
+
+        # Only global phases are summed up
+        self.assertEqual(telemetry.getGlobalTimings(), {"queries": 1.5})
+
+        path = self.getTempPath("telemetry/telemetry.jsonl")
+        telemetry.save(path)
+
+        with open(path, "r") as fileObj:
+            records = [json.loads(line) for line in fileObj]
+
+        self.assertEqual(len(records), 6)
+        self.assertEqual(records[2][SyncTelemetry.KEY_PROJECT], "a")
+        self.assertEqual(records[2][SyncTelemetry.KEY_PHASE], SyncTelemetry.PHASE_FETCH)
+        self.assertEqual(records[5][SyncTelemetry.KEY_PHASE], SyncTelemetry.PHASE_STATE)
+
+        # Slowest project first, limited number of entries
+        lines = telemetry.formatTopTable(1).splitlines()
+
+        self.assertEqual(lines[0], "slowest projects:")
+        self.assertTrue(lines[2].startswith("a "))
+        self.assertEqual(lines[3], "slowest phases:")
+        self.assertEqual(lines[5].split(), ["a", SyncTelemetry.PHASE_FETCH, "3.00s"])
+        self.assertEqual(len(lines), 6)
@@ -0,0 +1,45 @@
+import os
+import shutil
+
+from du.drepo.report.TagIndex import TagIndex
+from du.utils.ShellCommand import ShellCommand
+from test.TestBase import TestBase
+
+
+class TagIndexTest(TestBase):
+    def setUp(self):
+        self._path = os.path.dirname(self.getTempPath("tags/repository/dummy"))
+
+        shutil.rmtree(self._path)
+
+        ShellCommand.execute(["git", "init", self._path])
+
+        self.__git("commit", "--allow-empty", "-m", "first")
+        self.__git("tag", "light")
+        self.__git("tag", "-a", "-m", "annotated", "annotated")
+
+        self.__git("commit", "--allow-empty", "-m", "second")
+
+    def __git(self, *args):
+        return ShellCommand.execute(
+            ["git", "-c", "user.name=test", "-c", "user.email=test@test.com"]
+            + list(args),
+            workingDirectory=self._path,
+        ).stdoutStr.strip()
+
+    def testIndex(self):
+        tagIndex = TagIndex.create(self._path)
+
+        self.assertEqual(tagIndex.headHash, self.__git("rev-parse", "HEAD"))
+
+        firstHash = self.__git("rev-parse", "HEAD~1")
+
+        # Annotated tags come first, same as with git describe
+        self.assertEqual(tagIndex.getTags(firstHash), ["annotated", "light"])
+        self.assertEqual(tagIndex.getTags(tagIndex.headHash), [])
+
+        self.assertEqual(tagIndex.getRefHash("light"), firstHash)
+        self.assertEqual(
+            tagIndex.getRefHash("annotated"), self.__git("rev-parse", "annotated")
+        )
+        self.assertEqual(tagIndex.getRefHash("missing"), None)
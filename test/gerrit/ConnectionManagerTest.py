@@ -0,0 +1,102 @@
+import json
+import os
+import shutil
+import sys
+from unittest import mock
+
+from du.gerrit.ssh.Connection import Connection
+from du.gerrit.ssh.ConnectionManager import ConnectionManager
+from du.utils.ShellCommand import ShellCommand
+from test.TestBase import TestBase
+
+
+class ConnectionManagerTest(TestBase):
+    # SSH stand-in, logging its arguments and answering Gerrit queries with an empty result
+    SSH_SCRIPT = """#!%s
+import json, sys
+
+with open(%r, "a") as fileObj:
+    fileObj.write(json.dumps(sys.argv[1:]) + "\\n")
+
+if "gerrit" in sys.argv:
+    print(json.dumps({"type": "stats", "rowCount": 0}))
+elif "-O" not in sys.argv:
+    sys.exit(255)
+"""
+
+    def setUp(self):
+        binDir = os.path.dirname(self.getTempPath("connection_manager/bin/dummy"))
+        self._logPath = self.getTempPath("connection_manager/ssh.log")
+
+        shutil.rmtree(binDir)
+        os.makedirs(binDir)
+
+        if os.path.exists(self._logPath):
+            os.remove(self._logPath)
+
+        sshPath = os.path.join(binDir, "ssh")
+
+        with open(sshPath, "w") as fileObj:
+            fileObj.write(self.SSH_SCRIPT % (sys.executable, self._logPath))
+        os.chmod(sshPath, 0o755)
+
+        self._path = binDir + os.pathsep + os.environ["PATH"]
+
+    def __readLog(self):
+        """
+        Read arguments of all the SSH invocations
+
+        @return list of argument lists
+        """
+
+        with open(self._logPath, "r") as fileObj:
+            return [json.loads(line) for line in fileObj]
+
+    def testLifecycle(self):
+        manager = ConnectionManager()
+
+        controlPath = next(
+            arg.split("=", 1)[1]
+            for arg in manager.sshArgs
+            if arg.startswith("ControlPath=")
+        )
+        controlDir = os.path.dirname(controlPath)
+
+        self.assertTrue(os.path.isdir(controlDir))
+
+        with mock.patch.dict(os.environ, {"PATH": self._path}):
+            os.environ.pop(ConnectionManager.ENV_GIT_SSH_COMMAND, None)
+
+            # Queries & git fetches share the master connection
+            conn = Connection("ssh://user@server:29418", manager)
+            self.assertEqual(conn.query("status:open"), [])
+
+            with manager.gitEnvironment():
+                ShellCommand.execute(
+                    ["git", "ls-remote", "ssh://user@server:29418/project"],
+                    raiseOnError=False,
+                )
+
+            # Environment is restored
+            self.assertNotIn(ConnectionManager.ENV_GIT_SSH_COMMAND, os.environ)
+
+            # Only SSH URLs have master connections to close
+            manager.register("ssh://other/project")
+            manager.register("file:///path/project")
+
+            manager.close()
+
+        invocations = self.__readLog()
+
+        for args in invocations[:2]:
+            self.assertEqual(args[: len(manager.sshArgs)], manager.sshArgs)
+
+        self.assertIn("gerrit", invocations[0])
+        self.assertIn("git-upload-pack '/project'", invocations[1])
+
+        # Every master is told to exit, and the control sockets are removed
+        self.assertEqual(
+            sorted(args[len(manager.sshArgs) :] for args in invocations[2:]),
+            [["-O", "exit", "-p", "29418", "user@server"], ["-O", "exit", "other"]],
+        )
+        self.assertFalse(os.path.exists(controlDir))
@@ -0,0 +1,24 @@
+from du.gerrit.Utils import Utils
+from test.TestBase import TestBase
+
+
+class UtilsTest(TestBase):
+    def testChunkOrQuery(self):
+        self.assertEqual(Utils.chunkOrQuery([]), [])
+
+        self.assertEqual(
+            Utils.chunkOrQuery(["change:1", "change:2", "change:3"]),
+            [["change:1", "OR", "change:2", "OR", "change:3"]],
+        )
+
+        # Term limit
+        self.assertEqual(
+            Utils.chunkOrQuery(["change:1", "change:2", "change:3"], maxTerms=2),
+            [["change:1", "OR", "change:2"], ["change:3"]],
+        )
+
+        # Length limit
+        self.assertEqual(
+            Utils.chunkOrQuery(["change:1", "change:2", "change:3"], maxLength=24),
+            [["change:1", "OR", "change:2"], ["change:3"]],
+        )
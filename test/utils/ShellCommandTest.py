@@ -20,3 +20,24 @@ class ShellCommandTest(TestBase):
         self.assertNotEqual(cmd.returnCode, 0)
         self.assertTrue(cmd.stderrStr)
         self.assertFalse(cmd.stdoutStr)
+
+    def testStream(self):
+        cmd = ShellCommand(["printf", "a\\0b\\0c"])
+
+        self.assertEqual(list(cmd.stream("\0")), ["a", "b", "c"])
+        self.assertEqual(ShellCommand.RETURN_CODE_OK, cmd.returnCode)
+
+        with self.assertRaises(CommandFailedException):
+            list(ShellCommand(["cat", "#"]).stream())
+
+    def testStreamEarlyTermination(self):
+        # Never terminates on its own
+        cmd = ShellCommand(["yes"])
+
+        records = cmd.stream()
+        self.assertEqual(next(records), "y")
+
+        # Command is killed, without raising
+        records.close()
+        self.assertIsNotNone(cmd.returnCode)
+        self.assertNotEqual(cmd.returnCode, ShellCommand.RETURN_CODE_OK)